@@ -5,16 +5,47 @@ Main application file with API endpoints
 
 import os
 import json
-from flask import Flask, request, jsonify, send_file
+import time
+import uuid
+import atexit
+from flask import Flask, Response, request, jsonify, send_file, g
 from flask_cors import CORS
 from dotenv import load_dotenv
-from services.generator import ModuleGenerator
-from services.file_builder import FileBuilder
-from services.zipper import ModuleZipper
 
 # Load environment variables
 load_dotenv()
 
+# Configure logging before the services emit their startup records
+from services.structured_logging import (
+    configure_logging, get_logger, bind_log_context, reset_log_context
+)
+configure_logging()
+logger = get_logger("app")
+
+from services.generator import ModuleGenerator
+from services.file_builder import FileBuilder, safe_relative_path
+from services.zipper import ModuleZipper, ARCHIVE_FORMATS
+from services.tracing import tracer
+from services.metrics import metrics
+from services.tokens import TokenBudgetExceeded, token_budget
+from services.similarity import PromptIndex
+from services.search_index import SearchIndex
+from services.offload import offload_pool
+from services.deadline import latency_estimator
+from services.health import ProviderHealth
+from services.endpoint_pool import EndpointPool
+from services.versions import sanitize_module_name
+from services.prewarm import Prewarmer, RequestHistory, record_cache_lookup
+from services.idempotency import (
+    IdempotencyConflict, idempotency_store, idempotency_key, idempotency_scope, request_fingerprint
+)
+from services.scheduler import (
+    QueueFull, scheduler, resolve_tenant, resolve_priority, generation_cost, request_api_key
+)
+from services.cancellation import (
+    CancellationToken, GenerationCancelled, StageTimeout, active_requests, cancellation_scope, run_stage
+)
+
 app = Flask(__name__)
 # Enable full CORS support for React frontend
 CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
@@ -33,15 +64,95 @@ try:
     generator = ModuleGenerator()
     file_builder = FileBuilder()
     zipper = ModuleZipper()
-    print("Generator initialized successfully:", generator is not None)
+    logger.info("Generator initialized", extra={"generator_initialized": generator is not None})
 except Exception as e:
-    print(f"Warning: Failed to initialize services: {e}")
+    logger.warning("Failed to initialize services", extra={"error": str(e)})
     generator = None
     file_builder = FileBuilder()
     zipper = ModuleZipper()
 
 # Ensure output directory exists
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+# Move modules written before versioning into output/<module>/v1/
+file_builder.versions.migrate_legacy()
+# Record manifests and share unchanged files for versions stored before delta storage
+file_builder.versions.seal_existing()
+
+# Return an existing module when a near-duplicate prompt was already generated
+REUSE_SIMILAR_MODULES = os.getenv("REUSE_SIMILAR_MODULES", "true").lower() == "true"
+# Stream responses straight to disk and the ZIP; the response lists files instead of echoing them
+STREAMING_PIPELINE = os.getenv("STREAMING_PIPELINE", "false").lower() == "true"
+# Scheduler tenant that prewarm generations are queued and accounted under
+PREWARM_TENANT = os.getenv("PREWARM_TENANT", "prewarm")
+scheduler.known_tenants.add(PREWARM_TENANT)
+
+# Index of existing modules by canonical instructor prompt
+prompt_index = PromptIndex()
+prompt_index.rebuild(file_builder)
+
+# Full-text index over every generated file
+search_index = SearchIndex()
+search_index.sync(file_builder)
+
+# Warm provider connections in the background and cache health probes
+provider_health = ProviderHealth(generator)
+provider_health.start()
+
+# Prompts received by /generate-module, ranked by popularity for prewarming
+request_history = RequestHistory()
+# The prewarmer thread flushes it periodically; write what is left on exit
+atexit.register(request_history.flush)
+
+# Endpoints that record a span tree per request
+TRACED_ENDPOINTS = {"generate_module"}
+# Response headers readable by the React frontend
+EXPOSED_HEADERS = "X-Request-Id, X-Trace-Id, Content-Disposition, X-Archive-Files, X-Module-Version, Idempotent-Replayed, X-Original-Request-Id"
+
+
+@app.before_request
+def bind_request_id():
+    """Attach a request id to every log record emitted for this request"""
+    g.request_id = request.headers.get("X-Request-Id") or uuid.uuid4().hex
+    g.log_token = bind_log_context(request_id=g.request_id)
+
+
+@app.before_request
+def start_request_trace():
+    """Start a trace for traced endpoints"""
+    if request.endpoint not in TRACED_ENDPOINTS:
+        return
+    profile = request.headers.get("X-Debug-Profile", "").lower() in ("1", "true", "yes")
+    force = request.headers.get("X-Debug-Trace", "").lower() in ("1", "true", "yes")
+    g.trace_id, _ = tracer.start_trace(request.path, force=force, profile=profile)
+    bind_log_context(trace_id=g.trace_id)
+
+
+@app.after_request
+def finish_request_trace(response):
+    """Close the trace and expose its id to the client"""
+    trace_id = g.pop("trace_id", None)
+    if trace_id is not None:
+        tracer.finish_trace(status_code=response.status_code)
+        response.headers["X-Trace-Id"] = trace_id
+        response.headers["Access-Control-Expose-Headers"] = EXPOSED_HEADERS
+    return response
+
+
+@app.after_request
+def expose_request_id(response):
+    """Return the request id so clients can correlate logs"""
+    request_id = g.get("request_id")
+    if request_id is not None:
+        response.headers["X-Request-Id"] = request_id
+        response.headers["Access-Control-Expose-Headers"] = EXPOSED_HEADERS
+    return response
+
+
+@app.teardown_request
+def unbind_request_id(exc=None):
+    token = g.pop("log_token", None)
+    if token is not None:
+        reset_log_context(token)
 
 
 @app.route("/", methods=["GET"])
@@ -82,17 +193,37 @@ def test_llm():
 
 @app.route("/test-llm-call", methods=["GET"])
 def test_llm_call_route():
-    """Perform a lightweight test call to the configured LLM"""
+    """
+    Result of a lightweight test call to the configured LLM
+    
+    Served from the background health probe cache; ?fresh=true forces a live call.
+    """
     if generator is None:
         return jsonify({
             "status": "error",
             "message": "Generator not initialized. Check API keys."
         }), 500
 
-    result = generator.test_llm_call()
+    fresh = request.args.get("fresh", "").lower() in ("1", "true", "yes")
+    result = None if fresh else provider_health.cached()
+    if result is None:
+        result = dict(provider_health.probe(), cached=False)
     return jsonify(result)
 
 
+@app.route("/ready", methods=["GET"])
+def readiness_check():
+    """
+    Readiness probe for load balancers
+    
+    Returns 503 until provider warm-up has succeeded, and again after
+    repeated failed background probes.
+    """
+    readiness = provider_health.readiness()
+    return jsonify(dict(readiness, status="ready" if readiness["ready"] else "not_ready")), \
+        200 if readiness["ready"] else 503
+
+
 @app.route("/generate-module", methods=["POST"])
 def generate_module():
     """
@@ -100,17 +231,101 @@ def generate_module():
     
     Expected JSON:
     {
-        "instructor_prompt": "RAG module, intermediate, 5 days"
+        "instructor_prompt": "RAG module, intermediate, 5 days",
+        "regenerate": false,  # optional, skip reuse of similar modules
+        "deadline_s": 60,     # optional, or the X-Deadline-Ms header
+        "priority": "batch",  # optional, or the X-Priority header (default "interactive")
+        "idempotency_key": "..." # optional, or the Idempotency-Key header
     }
     
+    The tenant comes from the X-API-Key / Authorization: Bearer header or,
+    when SCHEDULER_TRUST_TENANT_HEADER is set, X-Tenant-Id; generations
+    queue for a slot by weighted fair share.
+    
+    A request repeating the Idempotency-Key of a running or recently
+    successful generation (same tenant and body) gets that generation's
+    response, marked with "Idempotent-Replayed: true", instead of starting
+    another one. Generations with a key keep running when the client
+    disconnects so a retry can collect the result.
+    
     Returns:
     {
         "status": "success",
         "module_name": "...",
         "file_tree": [...],
-        "zip_path": "..."
+        "tree": {...},        # nested folders with sizes and file counts
+        "zip_path": "...",
+        "reused": {...},      # present when an existing module was returned
+        "degradations": [...],# e.g. ["faster_model", "partial_days"] to meet the deadline
+        "scheduling": {...}   # tenant, priority and queue_wait_ms
     }
     """
+    data = request.get_json(silent=True) if request.is_json else None
+    data = data if isinstance(data, dict) else None
+    try:
+        key = idempotency_key(request.headers, data)
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+    if key is None:
+        return _generate_module()
+    
+    try:
+        entry, owner = idempotency_store.begin(
+            idempotency_scope(resolve_tenant(request.headers), request_api_key(request.headers)),
+            key, request_fingerprint(data), g.request_id
+        )
+    except IdempotencyConflict as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 422
+    if not owner:
+        return replay_idempotent(entry)
+    
+    body = status = headers = None
+    try:
+        response = app.make_response(_generate_module(watch_disconnect=False))
+        body, status = response.get_data(), response.status_code
+        headers = {"Retry-After": response.headers["Retry-After"]} if "Retry-After" in response.headers else None
+    finally:
+        usage = g.pop("generation_usage", None) or {}
+        idempotency_store.complete(entry, body, status, headers, tokens=usage.get("total_tokens", 0))
+    return response
+
+
+def replay_idempotent(entry):
+    """
+    Response of the request holding an Idempotency-Key, waiting for it to
+    finish if it is still running
+    """
+    in_flight = not entry.done.is_set()
+    with tracer.span("idempotent_wait", in_flight=in_flight):
+        idempotency_store.wait(entry)
+    if entry.body is None:
+        # The original request failed without producing a response
+        return jsonify({
+            "status": "error",
+            "message": "The original request for this Idempotency-Key failed; retry to generate again"
+        }), 500
+    
+    idempotency_store.record_replay(entry, in_flight)
+    response = Response(entry.body, status=entry.status, mimetype="application/json")
+    response.headers.update(entry.headers)
+    response.headers["Idempotent-Replayed"] = "true"
+    response.headers["X-Original-Request-Id"] = entry.request_id
+    return response
+
+
+def _generate_module(watch_disconnect=True):
+    """
+    /generate-module without idempotency handling
+    
+    Args:
+        watch_disconnect: Cancel the generation if the client disconnects
+    """
     try:
         # Check if generator is initialized
         if generator is None:
@@ -142,43 +357,393 @@ def generate_module():
                 "message": "instructor_prompt cannot be empty"
             }), 400
         
-        # Generate module using LLM
-        print(f"Generating module for prompt: {instructor_prompt}")
-        module_data = generator.generate_module(instructor_prompt)
+        request_history.record(instructor_prompt, resolve_tenant(request.headers))
+        
+        # Return an existing module generated from a near-duplicate prompt
+        if REUSE_SIMILAR_MODULES and not data.get("regenerate"):
+            reused = reuse_similar_module(instructor_prompt)
+            if reused is not None:
+                return jsonify(reused)
         
-        if not module_data or "module_name" not in module_data:
+        try:
+            deadline_s = request_deadline(data)
+            priority = resolve_priority(request.headers, data)
+        except ValueError as e:
             return jsonify({
                 "status": "error",
-                "message": "Failed to generate module structure"
-            }), 500
-        
-        module_name = module_data["module_name"]
-        files = module_data.get("files", {})
+                "message": str(e)
+            }), 400
         
+        # Cancellable from POST /requests/<request_id>/cancel or by disconnecting
+        token = CancellationToken(g.request_id, deadline_s=deadline_s)
+        sock = None
+        if watch_disconnect:
+            sock = request.environ.get("werkzeug.socket") or request.environ.get("gunicorn.socket")
+        active_requests.register(token, sock)
+        tenant = resolve_tenant(request.headers)
+        bind_log_context(tenant=tenant, priority=priority)
+        try:
+            with cancellation_scope(token):
+                with tracer.span("queue_wait", tenant=tenant, priority=priority):
+                    ticket = scheduler.acquire(tenant, priority, generation_cost(instructor_prompt), token)
+                try:
+                    result = run_generation(instructor_prompt, data)
+                finally:
+                    scheduler.release(ticket)
+            g.generation_usage = result.get("usage")
+            result["scheduling"] = {
+                "tenant": tenant,
+                "priority": priority,
+                "queue_wait_ms": round((ticket.granted_at - ticket.enqueued_at) * 1000, 1) if ticket else 0.0
+            }
+            return jsonify(result)
+        finally:
+            active_requests.unregister(token)
+    
+    except QueueFull as e:
+        logger.warning("Generation queue full", extra={"tenant": e.tenant})
+        response = jsonify({
+            "status": "error",
+            "message": str(e)
+        })
+        response.headers["Retry-After"] = str(e.retry_after_s)
+        return response, 429
+    
+    except StageTimeout as e:
+        logger.warning("Generation stage timed out", extra={"stage": e.stage, "timeout_s": e.timeout})
+        return jsonify({
+            "status": "error",
+            "message": str(e),
+            "stage": e.stage
+        }), 504
+    
+    except GenerationCancelled as e:
+        logger.info("Generation cancelled", extra={"reason": e.reason, "stage": e.stage})
+        # 499 (client closed request): usually nobody is left to read it
+        return jsonify({
+            "status": "cancelled",
+            "message": str(e),
+            "reason": e.reason,
+            "stage": e.stage
+        }), 499
+    
+    except TokenBudgetExceeded as e:
+        metrics.increment("token_budget_rejections_total")
+        logger.warning("Token budget exceeded", extra={"error": str(e)})
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 429
+    
+    except Exception as e:
+        logger.exception("Error generating module")
+        return jsonify({
+            "status": "error",
+            "message": f"Internal server error: {str(e)}"
+        }), 500
+
+
+def run_generation(instructor_prompt, data, prewarmed=False):
+    """
+    Generate, write, zip, publish and index a module
+    
+    Each generation is written to a new immutable version of the module and
+    only becomes "latest" once its files and ZIP are complete, so concurrent
+    generations of the same module never overwrite each other. Each stage
+    runs under its own timeout and stops early if the request is cancelled;
+    the unpublished version of a cancelled request is removed.
+    
+    With STREAMING_PIPELINE, every file is written to a staging area (and
+    the ZIP) as soon as the provider stream completes it, then moved into
+    the version; no stage holds the whole module in memory, and the
+    response carries the file tree without the file contents.
+    
+    Args:
+        instructor_prompt: Instructor prompt
+        data: /generate-module request body
+        prewarmed: Generated ahead of demand by the prewarm scheduler
+    
+    Returns:
+        dict: /generate-module response body
+    """
+    staging = file_builder.stage() if STREAMING_PIPELINE else None
+    try:
+        return _run_generation(instructor_prompt, data, staging, prewarmed)
+    finally:
+        if staging is not None:
+            staging.cleanup()
+
+
+def _run_generation(instructor_prompt, data, staging, prewarmed):
+    """run_generation without the staging cleanup (staging is None unless STREAMING_PIPELINE)"""
+    # Generate module using LLM
+    logger.info("Generating module", extra={"instructor_prompt": instructor_prompt})
+    with tracer.span("generate"):
+        module_data = generator.generate_module(
+            instructor_prompt, use_cache=not data.get("regenerate"), staging=staging
+        )
+    
+    if not module_data or "module_name" not in module_data:
+        raise Exception("Failed to generate module structure")
+    
+    module_name = module_data["module_name"]
+    files = module_data.get("files", {})
+    usage = module_data.get("usage")
+    version = file_builder.allocate_version(module_name)
+    
+    try:
         # Write files to disk
-        print(f"Writing files for module: {module_name}")
-        file_tree = file_builder.build_module(module_name, files)
-        
-        # Create ZIP file
-        print(f"Creating ZIP for module: {module_name}")
-        zip_path = zipper.create_zip(module_name)
+        logger.info("Writing module files", extra={
+            "module_name": module_name, "version": version, "file_count": len(files),
+            "streamed": staging is not None
+        })
+        zipped = False
+        with tracer.span("build_module", module_name=module_name, version=version):
+            if staging is not None:
+                file_tree, zipped = run_stage("build_module", file_builder.adopt_files, module_name, files, version)
+            else:
+                file_tree = run_stage("build_module", file_builder.build_module, module_name, files, version)
+            if usage:
+                file_builder.write_module_metadata(module_name, "usage", usage, version=version)
+            file_builder.write_module_metadata(module_name, "prompt", {
+                "instructor_prompt": instructor_prompt,
+                "created_at": time.time(),
+                "prewarmed": prewarmed
+            }, version=version)
         
-        # Ensure files are included in response
+        # Create ZIP file (already built while streaming, unless files changed after they were zipped)
+        with tracer.span("create_zip", streamed=zipped):
+            if zipped:
+                zip_path = file_builder.versions.zip_path(module_name, version)
+            else:
+                zip_path = run_stage("create_zip", zipper.create_zip, module_name, version)
+    except Exception:
+        # Nobody will download a half-written version
+        file_builder.discard_version(module_name, version)
+        raise
+    
+    is_latest = file_builder.publish_version(module_name, version)
+    if is_latest:
+        prompt_index.add(module_name, instructor_prompt)
+        with tracer.span("search_index"):
+            search_index.index_module(sanitize_module_name(module_name), files)
+    
+    # Ensure files are included in response
+    return {
+        "status": "success",
+        "module_name": module_name,
+        "version": version,
+        # Include files in response for frontend (streamed modules are fetched file by file)
+        "files": None if staging is not None else files,
+        "streamed": staging is not None,
+        "file_tree": file_tree,
+        "tree": file_builder.module_tree(module_name, version),
+        "zip_path": zip_path,
+        "usage": usage,
+        "generation": module_data.get("generation"),
+        "fragments": module_data.get("fragments"),
+        "degradations": module_data["generation"]["degradations"],
+        "deadline": module_data.get("deadline"),
+        "message": f"Module '{module_name}' generated successfully"
+    }
+
+
+def request_deadline(data):
+    """
+    Seconds the caller is willing to wait, from the X-Deadline-Ms header or
+    the "deadline_s" body field (the header wins)
+    
+    Returns:
+        float or None: Relative deadline, None if the caller did not set one
+    
+    Raises:
+        ValueError: if the value is not a positive number
+    """
+    header = request.headers.get("X-Deadline-Ms")
+    try:
+        if header:
+            deadline_s = float(header) / 1000
+        elif data.get("deadline_s") is not None:
+            deadline_s = float(data["deadline_s"])
+        else:
+            return None
+    except (TypeError, ValueError):
+        raise ValueError("Deadline must be a number (X-Deadline-Ms in milliseconds, deadline_s in seconds)")
+    if deadline_s <= 0:
+        raise ValueError("Deadline must be positive")
+    return deadline_s
+
+
+@app.route("/requests", methods=["GET"])
+def list_active_requests():
+    """List in-flight generations (request id, current stage, elapsed time)"""
+    return jsonify({
+        "status": "success",
+        "requests": active_requests.list()
+    })
+
+
+@app.route("/requests/<request_id>/cancel", methods=["POST"])
+def cancel_request(request_id):
+    """
+    Cancel an in-flight generation
+    
+    The request id is the X-Request-Id header of the generation request
+    (clients may set it themselves so they know it before the response).
+    Skips any remaining LLM calls, file writes and zipping.
+    """
+    if not active_requests.cancel(request_id, reason="cancelled"):
         return jsonify({
+            "status": "error",
+            "message": f"No in-flight generation with request id '{request_id}'"
+        }), 404
+    return jsonify({
+        "status": "success",
+        "message": f"Cancellation requested for '{request_id}'"
+    })
+
+
+def reuse_similar_module(instructor_prompt):
+    """
+    Build a /generate-module response from the best near-duplicate module
+    
+    Returns:
+        dict or None: Response body, or None if no usable match exists
+    """
+    with tracer.span("similarity_lookup") as span:
+        matches = prompt_index.find(instructor_prompt)
+        span.set(matches=len(matches))
+    
+    for match in matches:
+        module_name = match["module_name"]
+        # Pin to one version so a concurrent publish cannot mix two versions
+        version = file_builder.versions.latest(module_name)
+        loaded = file_builder.load_module(module_name, version) if version is not None else None
+        if loaded is None:
+            # Module was deleted from disk since it was indexed
+            prompt_index.remove(module_name)
+            search_index.remove_module(module_name)
+            continue
+        
+        files, file_tree = loaded
+        zip_path = zipper.zip_path(module_name, version)
+        if not os.path.exists(zip_path):
+            zip_path = zipper.create_zip(module_name, version)
+        
+        prompt_metadata = file_builder.read_module_metadata(module_name, "prompt", version=version) or {}
+        prewarmed = bool(prompt_metadata.get("prewarmed"))
+        metrics.increment("similar_module_hits_total")
+        record_cache_lookup(True, prewarmed=prewarmed)
+        logger.info("Reusing similar module", extra={
+            "module_name": module_name,
+            "version": version,
+            "similarity": match["similarity"]
+        })
+        return {
             "status": "success",
             "module_name": module_name,
-            "files": files,  # Include files in response for frontend
+            "version": version,
+            "files": files,
             "file_tree": file_tree,
+            "tree": file_builder.module_tree(module_name, version),
             "zip_path": zip_path,
-            "message": f"Module '{module_name}' generated successfully"
-        })
+            "usage": file_builder.read_module_metadata(module_name, "usage", version=version),
+            "reused": {
+                "similarity": match["similarity"],
+                "matched_prompt": match["instructor_prompt"],
+                "prewarmed": prewarmed
+            },
+            "message": f"Reused existing module '{module_name}' (send \"regenerate\": true to generate a new one)"
+        }
     
-    except Exception as e:
-        print(f"Error generating module: {str(e)}")
+    metrics.increment("similar_module_misses_total")
+    record_cache_lookup(False)
+    return None
+
+
+@app.route("/similar-modules", methods=["POST"])
+def similar_modules():
+    """
+    Find existing modules generated from prompts similar to the given one
+    
+    Expected JSON:
+    {
+        "instructor_prompt": "5-day intermediate RAG course",
+        "threshold": 0.8   # optional
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    instructor_prompt = (data.get("instructor_prompt") or "").strip()
+    if not instructor_prompt:
         return jsonify({
             "status": "error",
-            "message": f"Internal server error: {str(e)}"
+            "message": "Missing 'instructor_prompt' in request body"
+        }), 400
+    
+    try:
+        threshold = float(data["threshold"]) if "threshold" in data else None
+    except (TypeError, ValueError):
+        return jsonify({
+            "status": "error",
+            "message": "threshold must be a number"
+        }), 400
+    
+    return jsonify({
+        "status": "success",
+        "matches": prompt_index.find(instructor_prompt, threshold=threshold)
+    })
+
+
+@app.route("/search", methods=["GET"])
+def search_modules():
+    """
+    Full-text search across all generated modules
+    
+    Query parameters:
+    - q: search text (required), e.g. "vector databases" or "Bloom: Analyze"
+    - module: restrict to one module (optional)
+    - limit: maximum file hits (optional, default 20, max 200)
+    
+    Returns:
+    {
+        "status": "success",
+        "files": [{"module": "...", "path": "...", "score": 1.23, "snippet": "..."}],
+        "modules": [{"module": "...", "score": 4.56, "hits": 3}]
+    }
+    """
+    query = (request.args.get("q") or "").strip()
+    if not query:
+        return jsonify({
+            "status": "error",
+            "message": "Missing 'q' query parameter"
+        }), 400
+    
+    try:
+        limit = min(int(request.args.get("limit", 20)), 200)
+    except ValueError:
+        return jsonify({
+            "status": "error",
+            "message": "limit must be an integer"
+        }), 400
+    
+    try:
+        start = time.perf_counter()
+        results = search_index.search(query, limit=limit, module=request.args.get("module"))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        metrics.observe("search_latency_ms", elapsed_ms)
+    except Exception:
+        logger.exception("Error searching modules")
+        return jsonify({
+            "status": "error",
+            "message": "Search failed"
         }), 500
+    
+    return jsonify({
+        "status": "success",
+        "query": query,
+        "took_ms": round(elapsed_ms, 3),
+        **results
+    })
 
 
 @app.route("/download-module", methods=["GET"])
@@ -188,8 +753,14 @@ def download_module():
     
     Query parameters:
     - module: module name (required)
+    - version: version number (optional, default latest)
+    - path: file, folder or glob to include, repeatable (optional), e.g.
+      path=Day3/ or path=*/slides.md
+    - format: "zip" (default) or "tar.gz"
     
-    Returns: ZIP file download
+    Returns: ZIP file download; the prebuilt ZIP when no path is given,
+    otherwise an archive streamed as it is built. The version served is
+    returned in the X-Module-Version header.
     """
     try:
         module_name = request.args.get("module")
@@ -202,19 +773,51 @@ def download_module():
         
         # Sanitize module name to prevent path traversal
         module_name = os.path.basename(module_name)
-        zip_path = os.path.join(OUTPUT_DIR, f"{module_name}.zip")
+        patterns = request.args.getlist("path")
+        archive_format = request.args.get("format", "zip")
         
-        if not os.path.exists(zip_path):
+        requested_version = request.args.get("version")
+        if requested_version is not None and not requested_version.isdigit():
             return jsonify({
-                "error": f"ZIP not found for module {module_name}"
-            }), 404
+                "status": "error",
+                "message": "version must be a positive integer"
+            }), 400
         
-        response = send_file(
-            zip_path,
-            as_attachment=True,
-            download_name=f"{module_name}.zip",
-            mimetype="application/zip"
+        # Resolve "latest" once; everything below reads only this version
+        version = file_builder.versions.resolve(
+            module_name, int(requested_version) if requested_version else None
         )
+        if version is None:
+            return jsonify({
+                "error": f"Module {module_name} has no version {requested_version or 'published'}"
+            }), 404
+        
+        if patterns or archive_format != "zip":
+            return stream_module_archive(module_name, version, patterns, archive_format,
+                                         pinned=requested_version is not None)
+        
+        zip_path = zipper.zip_path(module_name, version)
+        superseded = version != file_builder.versions.latest(module_name)
+        if not os.path.exists(zip_path):
+            if superseded:
+                # Superseded versions keep no ZIP; build it from the files without storing it
+                return stream_module_archive(module_name, version, None, "zip",
+                                             pinned=requested_version is not None)
+            # Versions migrated without a ZIP get theirs on first download
+            zip_path = zipper.create_zip(module_name, version)
+        
+        try:
+            response = send_file(
+                zip_path,
+                as_attachment=True,
+                download_name=f"{module_name}_v{version}.zip",
+                mimetype="application/zip"
+            )
+        except FileNotFoundError:
+            # Pruned by a newer version published since the check above
+            return stream_module_archive(module_name, version, None, "zip",
+                                         pinned=requested_version is not None)
+        set_version_headers(response, version, pinned=requested_version is not None)
         # Add CORS headers for file download
         response.headers["Access-Control-Allow-Origin"] = "*"
         response.headers["Access-Control-Allow-Methods"] = "GET, OPTIONS"
@@ -222,13 +825,244 @@ def download_module():
         return response
     
     except Exception as e:
-        print(f"Error downloading module: {str(e)}")
+        logger.exception("Error downloading module")
         return jsonify({
             "status": "error",
             "message": f"Internal server error: {str(e)}"
         }), 500
 
 
+@app.route("/module-file", methods=["GET"])
+def module_file():
+    """
+    Contents of one file of a module (used by the frontend when a streamed
+    generation's response does not include the files)
+    
+    Query parameters:
+    - module: module name (required)
+    - path: file path within the module (required), e.g. Day1/lesson.md
+    - version: version number (optional, default latest)
+    """
+    module_name = request.args.get("module")
+    filepath = request.args.get("path")
+    if not module_name or not filepath:
+        return jsonify({
+            "status": "error",
+            "message": "Missing 'module' or 'path' query parameter"
+        }), 400
+    
+    requested_version = request.args.get("version")
+    if requested_version is not None and not requested_version.isdigit():
+        return jsonify({
+            "status": "error",
+            "message": "version must be a positive integer"
+        }), 400
+    
+    module_name = os.path.basename(module_name)
+    version = file_builder.versions.resolve(module_name, int(requested_version) if requested_version else None)
+    relative_path = safe_relative_path(filepath)
+    # Metadata files (dot-prefixed) are not part of the module
+    if relative_path is not None and any(part.startswith(".") for part in relative_path.split(os.sep)):
+        relative_path = None
+    if version is None or relative_path is None:
+        return jsonify({"error": f"File {filepath} not found in module {module_name}"}), 404
+    full_path = os.path.join(file_builder.module_path(module_name, version), relative_path)
+    if not os.path.isfile(full_path):
+        return jsonify({"error": f"File {filepath} not found in module {module_name}"}), 404
+    
+    response = send_file(full_path, mimetype="text/markdown; charset=utf-8")
+    set_version_headers(response, version, pinned=requested_version is not None)
+    return response
+
+
+@app.route("/module-versions", methods=["GET"])
+def module_versions():
+    """
+    Version history of a module
+    
+    Query parameters:
+    - module: module name (required)
+    
+    Returns:
+    {
+        "status": "success",
+        "module_name": "...",
+        "versions": [{"version": 1, "published_at": ..., "latest": false, "files": 28,
+                      "size": 48211, "stored_bytes": 48211,
+                      "changes": {"added": 28, "modified": 0, "removed": 0}}, ...],
+        "size": ...,          # bytes of all versions if each were a full copy
+        "stored_bytes": ...   # bytes the versions actually take on disk
+    }
+    """
+    module_name = request.args.get("module")
+    if not module_name:
+        return jsonify({
+            "status": "error",
+            "message": "Missing 'module' query parameter"
+        }), 400
+    
+    module_name = os.path.basename(module_name)
+    history = file_builder.versions.history(module_name)
+    if not history:
+        return jsonify({"error": f"Module {module_name} has no published version"}), 404
+    return jsonify({
+        "status": "success",
+        "module_name": module_name,
+        "versions": history,
+        "size": sum(entry["size"] for entry in history),
+        "stored_bytes": sum(entry["stored_bytes"] for entry in history)
+    })
+
+
+@app.route("/module-diff", methods=["GET"])
+def module_diff():
+    """
+    Compare two versions of a module
+    
+    Query parameters:
+    - module: module name (required)
+    - from, to: version numbers (to defaults to the latest, from to the version before it)
+    - text: "false" to list changed paths without the unified diffs
+    
+    Returns:
+    {
+        "status": "success",
+        "from": 2, "to": 3,
+        "added": [...], "modified": [...], "removed": [...], "unchanged": [...],
+        "files": {"Day2/lesson.md": {"status": "modified", "diff": "--- v2/...", "truncated": false}}
+    }
+    """
+    module_name = request.args.get("module")
+    if not module_name:
+        return jsonify({
+            "status": "error",
+            "message": "Missing 'module' query parameter"
+        }), 400
+    
+    module_name = os.path.basename(module_name)
+    requested = {name: request.args.get(name) for name in ("from", "to")}
+    if any(value is not None and not value.isdigit() for value in requested.values()):
+        return jsonify({
+            "status": "error",
+            "message": "from and to must be positive integers"
+        }), 400
+    
+    published = file_builder.versions.versions(module_name)
+    to_version = int(requested["to"]) if requested["to"] else file_builder.versions.latest(module_name)
+    if requested["from"]:
+        from_version = int(requested["from"])
+    else:
+        earlier = [version for version in published if to_version is not None and version < to_version]
+        from_version = earlier[-1] if earlier else None
+    
+    diff = None
+    if from_version is not None and to_version is not None:
+        text = request.args.get("text", "true").lower() not in ("0", "false", "no")
+        diff = file_builder.versions.diff(module_name, from_version, to_version, text=text)
+    if diff is None:
+        return jsonify({
+            "error": f"Module {module_name} has no published versions {requested['from'] or from_version} "
+                     f"and {requested['to'] or to_version} to compare"
+        }), 404
+    diff.update({"status": "success", "module_name": module_name, "from": from_version, "to": to_version})
+    return jsonify(diff)
+
+
+@app.route("/module-version", methods=["GET"])
+def module_version():
+    """
+    Materialize one version of a module: every file with its contents
+    
+    Query parameters:
+    - module: module name (required)
+    - version: version number (optional, default latest)
+    
+    Returns the same module_name, version, files, file_tree and tree fields
+    as /generate-module. /download-module?version=N returns the version as
+    an archive instead.
+    """
+    module_name = request.args.get("module")
+    if not module_name:
+        return jsonify({
+            "status": "error",
+            "message": "Missing 'module' query parameter"
+        }), 400
+    
+    requested_version = request.args.get("version")
+    if requested_version is not None and not requested_version.isdigit():
+        return jsonify({
+            "status": "error",
+            "message": "version must be a positive integer"
+        }), 400
+    
+    module_name = os.path.basename(module_name)
+    version = file_builder.versions.resolve(module_name, int(requested_version) if requested_version else None)
+    loaded = file_builder.load_module(module_name, version) if version is not None else None
+    if loaded is None:
+        return jsonify({
+            "error": f"Module {module_name} has no version {requested_version or 'published'}"
+        }), 404
+    
+    files, file_tree = loaded
+    response = jsonify({
+        "status": "success",
+        "module_name": module_name,
+        "version": version,
+        "files": files,
+        "file_tree": file_tree,
+        "tree": file_builder.module_tree(module_name, version)
+    })
+    set_version_headers(response, version, pinned=requested_version is not None)
+    return response
+
+
+def set_version_headers(response, version, pinned):
+    """Report the version served; a pinned version never changes, "latest" may move"""
+    response.headers["X-Module-Version"] = str(version)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable" if pinned else "no-cache"
+
+
+def stream_module_archive(module_name, version, patterns, archive_format, pinned=False):
+    """
+    Stream an archive of the files of one version matching patterns, built on the fly
+    
+    Nothing is written to disk and only one chunk per file is held in
+    memory, so memory use does not grow with the module size.
+    """
+    try:
+        chunks, file_count, total_bytes = zipper.stream_archive(module_name, patterns, archive_format, version)
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+    except FileNotFoundError:
+        return jsonify({
+            "error": f"Module {module_name} v{version} not found"
+        }), 404
+    
+    if not file_count:
+        return jsonify({
+            "error": f"No files in module {module_name} match {', '.join(patterns)}"
+        }), 404
+    
+    mimetype, extension = ARCHIVE_FORMATS[archive_format]
+    suffix = f"_v{version}" + ("_partial" if patterns else "")
+    logger.info("Streaming module archive", extra={
+        "module_name": module_name,
+        "version": version,
+        "format": archive_format,
+        "file_count": file_count,
+        "total_bytes": total_bytes
+    })
+    response = Response(chunks, mimetype=mimetype, direct_passthrough=True)
+    response.headers["Content-Disposition"] = f'attachment; filename="{module_name}{suffix}{extension}"'
+    response.headers["X-Archive-Files"] = str(file_count)
+    set_version_headers(response, version, pinned)
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    return response
+
+
 @app.route("/list-modules", methods=["GET"])
 def list_modules():
     """
@@ -237,21 +1071,24 @@ def list_modules():
     Returns:
     {
         "status": "success",
-        "modules": [...]
+        "modules": [{"name": "...", "version": 3, "versions": [1, 2, 3], ...}]
     }
     """
     try:
         modules = []
         
-        if os.path.exists(OUTPUT_DIR):
-            for item in os.listdir(OUTPUT_DIR):
-                item_path = os.path.join(OUTPUT_DIR, item)
-                if os.path.isdir(item_path) and not item.endswith(".zip"):
-                    modules.append({
-                        "name": item,
-                        "path": item_path,
-                        "zip_available": os.path.exists(f"{item_path}.zip")
-                    })
+        for item in file_builder.list_modules():
+            version = file_builder.versions.latest(item)
+            if version is None:
+                continue
+            modules.append({
+                "name": item,
+                "path": file_builder.module_path(item, version),
+                "version": version,
+                "versions": file_builder.versions.versions(item),
+                "zip_available": os.path.exists(zipper.zip_path(item, version) or ""),
+                "usage": file_builder.read_module_metadata(item, "usage", version=version)
+            })
         
         return jsonify({
             "status": "success",
@@ -259,18 +1096,167 @@ def list_modules():
         })
     
     except Exception as e:
-        print(f"Error listing modules: {str(e)}")
+        logger.exception("Error listing modules")
         return jsonify({
             "status": "error",
             "message": f"Internal server error: {str(e)}"
         }), 500
 
 
-if __name__ == "__main__":
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Return aggregated service metrics
+    
+    Returns:
+    {
+        "status": "success",
+        "metrics": {"counters": {...}, "summaries": {...}},
+        "token_budget": {...}
+    }
+    """
+    return jsonify({
+        "status": "success",
+        "metrics": metrics.snapshot(),
+        "fragment_cache": generator.fragment_cache.stats() if generator else None,
+        "search_index": search_index.stats(),
+        "offload": offload_pool.stats(),
+        "tokens_per_second": latency_estimator.snapshot(),
+        "scheduler": scheduler.stats(),
+        "endpoint_pool": generator.client.stats() if generator and isinstance(generator.client, EndpointPool) else None,
+        "idempotency": idempotency_store.stats(),
+        "prewarm": prewarmer.stats(),
+        "token_budget": token_budget.status()
+    })
+
+
+@app.route("/traces", methods=["GET"])
+def list_traces():
+    """
+    List recent request traces (newest first)
+    
+    Returns:
+    {
+        "status": "success",
+        "traces": [...]
+    }
+    """
+    return jsonify({
+        "status": "success",
+        "traces": tracer.list_traces()
+    })
+
+
+@app.route("/traces/<trace_id>", methods=["GET"])
+def get_trace(trace_id):
+    """Return the full span tree (and profile dump, if any) for a trace"""
+    trace = tracer.get_trace(trace_id)
+    if trace is None:
+        return jsonify({
+            "status": "error",
+            "message": f"Trace not found: {trace_id}"
+        }), 404
+
+    return jsonify({
+        "status": "success",
+        "trace": trace
+    })
+
+
+def prewarm_module(instructor_prompt):
+    """
+    Generate a module for the prewarm scheduler
+    
+    Runs as a batch request of PREWARM_TENANT, so it only takes slots
+    interactive requests leave free, and is cancellable like any other
+    generation.
+    
+    Returns:
+        dict: /generate-module response body
+    """
+    token = CancellationToken(f"prewarm-{uuid.uuid4().hex}")
+    active_requests.register(token)
+    log_token = bind_log_context(request_id=token.request_id, tenant=PREWARM_TENANT, priority="batch")
+    try:
+        with cancellation_scope(token):
+            ticket = scheduler.acquire(PREWARM_TENANT, "batch", generation_cost(instructor_prompt), token)
+            try:
+                return run_generation(instructor_prompt, {}, prewarmed=True)
+            finally:
+                scheduler.release(ticket)
+    finally:
+        reset_log_context(log_token)
+        active_requests.unregister(token)
+
+
+def has_reusable_module(instructor_prompt):
+    """True if /generate-module would reuse an existing module for this prompt"""
+    return bool(prompt_index.find(instructor_prompt))
+
+
+# Pre-generates popular prompts during off-peak windows
+prewarmer = Prewarmer(prewarm_module, has_reusable_module, request_history)
+if generator is not None:
+    prewarmer.start()
+
+
+@app.route("/prewarm", methods=["GET"])
+def prewarm_status():
+    """
+    Prewarm scheduler state, the prompts it would generate next and the
+    module cache hit rate in peak and off-peak hours
+    
+    Returns:
+    {
+        "status": "success",
+        "prewarm": {"window_open": ..., "tokens_spent_in_window": ..., "last_run": {...},
+                    "cache_hit_rate": {"peak": {...}, "off_peak": {...}}, ...},
+        "candidates": [{"instructor_prompt": ..., "cached": ...}, ...],
+        "popular": [{"instructor_prompt": ..., "requests": ..., "score": ...}, ...]
+    }
+    """
+    return jsonify({
+        "status": "success",
+        "prewarm": prewarmer.stats(),
+        "candidates": [
+            {"instructor_prompt": prompt, "cached": has_reusable_module(prompt)}
+            for prompt in prewarmer.candidates()
+        ],
+        "popular": request_history.popular()
+    })
+
+
+@app.route("/prewarm/run", methods=["POST"])
+def run_prewarm():
+    """Start a prewarm pass now (outside the off-peak windows, with a fresh token budget)"""
+    if generator is None:
+        return jsonify({
+            "status": "error",
+            "message": "LLM generator not initialized. Check API keys in .env file."
+        }), 500
+    prewarmer.trigger()
+    return jsonify({
+        "status": "success",
+        "message": "Prewarm pass started"
+    }), 202
+
+
+def main():
+    """Run the Flask server (started through server.py)"""
     # Get port from environment or default to 5000
     port = int(os.getenv("PORT", 5000))
     debug = os.getenv("FLASK_DEBUG", "False").lower() == "true"
     
-    print(f"Starting Flask AI Education Copilot on port {port}")
+    logger.info("Starting Flask AI Education Copilot", extra={"port": port})
     app.run(host="0.0.0.0", port=port, debug=debug)
 
+
+if __name__ == "__main__":
+    if offload_pool.start_method != "fork":
+        # Offload workers would re-import the main module, which here is the whole app
+        # (services, warm-up pings, the prewarmer), so keep the CPU-bound stages inline
+        offload_pool.enabled = False
+        logger.warning("Started as app.py: offload pool disabled, CPU-bound stages run inline; "
+                       "start with python server.py")
+    main()
+
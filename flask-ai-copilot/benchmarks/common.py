@@ -0,0 +1,136 @@
+"""
+Shared helpers for the benchmark scripts
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import platform
+import threading
+
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCHMARKS_DIR)
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+
+# Make `services` and `app` importable when run as a script
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def latency_summary(latencies_ms):
+    if not latencies_ms:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    return {
+        "p50": round(percentile(latencies_ms, 50), 3),
+        "p95": round(percentile(latencies_ms, 95), 3),
+        "p99": round(percentile(latencies_ms, 99), 3),
+        "mean": round(sum(latencies_ms) / len(latencies_ms), 3),
+        "max": round(max(latencies_ms), 3)
+    }
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # ru_maxrss is bytes on macOS and KB elsewhere
+            return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+        except ImportError:
+            return 0.0
+
+
+class MemorySampler:
+    """Samples RSS in a background thread and records the peak"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.start_mb = current_rss_mb()
+        self.peak_mb = self.start_mb
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+
+def environment_info():
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+
+
+def save_results(results, path=None, name="benchmark"):
+    """Write results as JSON and return the path"""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{name}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare_metric(name, baseline, current, threshold, higher_is_better=False):
+    """
+    Compare one metric against its baseline
+
+    Returns:
+        dict or None: regression details when the change exceeds threshold
+    """
+    if baseline in (None, 0) or current is None:
+        return None
+    change = (current - baseline) / abs(baseline)
+    worse = -change if higher_is_better else change
+    if worse > threshold:
+        return {
+            "metric": name,
+            "baseline": baseline,
+            "current": current,
+            "change_pct": round(change * 100, 1)
+        }
+    return None
+
+
+def print_regressions(regressions):
+    if not regressions:
+        print("No regressions against baseline.")
+        return
+    print(f"{len(regressions)} regression(s) against baseline:")
+    for item in regressions:
+        print(f"  {item['scenario']}: {item['metric']} {item['baseline']} -> {item['current']} "
+              f"({item['change_pct']:+.1f}%)")
@@ -0,0 +1,114 @@
+"""
+Continuation Benchmark
+Large-module success rate and latency when responses hit the provider's output token limit
+
+The stub LLM server cuts responses off at --max-output-tokens with
+finish_reason "length". Without continuation the generator keeps only the
+files that arrived; with continuation it asks for the remaining files:
+
+    python benchmarks/continuation_benchmark.py
+    python benchmarks/continuation_benchmark.py --days 14 --max-output-tokens 8192 --tokens-per-second 400
+"""
+
+import os
+import time
+import argparse
+
+from common import latency_summary, environment_info, save_results
+from stub_llm_server import StubLLMServer, add_stub_arguments, config_from_args
+
+
+def make_generator(stub_url):
+    """ModuleGenerator wired to the stub server"""
+    os.environ["AI_PROVIDER"] = "openai"
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["OPENAI_BASE_URL"] = stub_url
+    os.environ["OPENAI_MODEL"] = "stub-model"
+
+    # Keep generator logs out of the benchmark output
+    from services.structured_logging import configure_logging
+    configure_logging(stream=open(os.devnull, "w"))
+
+    import services.generator as generator_module
+    return generator_module, generator_module.ModuleGenerator()
+
+
+def run_mode(generator_module, generator, continuation, requests, prompt):
+    generator_module.CONTINUATION_ENABLED = continuation
+    latencies = []
+    calls = []
+    tokens = []
+    files = []
+    complete = 0
+    errors = 0
+
+    for _ in range(requests):
+        start = time.perf_counter()
+        try:
+            module = generator.generate_module(prompt, use_cache=False)
+        except Exception:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+        generation = module["generation"]
+        calls.append(
+            len(generation["attempts"])
+            + sum(c["calls"] for c in generation["continuations"])
+            + len(generation["repairs"])
+        )
+        tokens.append(module["usage"]["total_tokens"])
+        files.append(len(module["files"]))
+        if not generation["quality_issues"]:
+            complete += 1
+
+    count = max(len(latencies), 1)
+    return {
+        "scenario": "continuation" if continuation else "no_continuation",
+        "requests": requests,
+        "errors": errors,
+        "success_rate": round(complete / requests, 4),
+        "files_mean": round(sum(files) / count, 1),
+        "calls_mean": round(sum(calls) / count, 2),
+        "tokens_mean": round(sum(tokens) / count, 1),
+        "latency_ms": latency_summary(latencies)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Large-module generation with and without continuation")
+    parser.add_argument("--requests", type=int, default=10, help="Generations per mode")
+    parser.add_argument("--prompt", default=None, help="Instructor prompt (defaults to an advanced module of --days days)")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--name", default="continuation", help="Result file prefix")
+    add_stub_arguments(parser)
+    parser.set_defaults(latency_ms=50, days=10, file_size=1500, max_output_tokens=4096)
+    args = parser.parse_args()
+    prompt = args.prompt or f"Distributed systems, advanced, {args.days} days"
+
+    stub = StubLLMServer(config_from_args(args)).start()
+    generator_module, generator = make_generator(stub.base_url)
+
+    results = {
+        "benchmark": "continuation",
+        "environment": environment_info(),
+        "stub": stub.config.to_dict(),
+        "prompt": prompt,
+        "scenarios": []
+    }
+    try:
+        for continuation in (False, True):
+            scenario = run_mode(generator_module, generator, continuation, args.requests, prompt)
+            results["scenarios"].append(scenario)
+            print(f"{scenario['scenario']:<16} success={scenario['success_rate']:.0%} "
+                  f"files={scenario['files_mean']:<6} calls={scenario['calls_mean']:<5} "
+                  f"tokens={scenario['tokens_mean']:<9} p50={scenario['latency_ms']['p50']}ms "
+                  f"p95={scenario['latency_ms']['p95']}ms errors={scenario['errors']}")
+    finally:
+        stub.stop()
+
+    path = save_results(results, args.output, name=args.name)
+    print(f"\nResults written to {path}")
+
+
+if __name__ == "__main__":
+    main()
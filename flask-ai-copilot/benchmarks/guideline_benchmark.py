@@ -0,0 +1,150 @@
+"""
+Guideline Retrieval Benchmark
+Prompt size, latency and output quality with full guideline inlining vs. BM25-selected sections
+
+Runs offline against the stub LLM server by default (give it a prefill speed so
+prompt size shows up in latency). Point it at a real OpenAI-compatible server to
+compare output quality:
+
+    python benchmarks/guideline_benchmark.py --prompt-tokens-per-second 2000
+    python benchmarks/guideline_benchmark.py --budgets 0,800,1500 \\
+        --base-url http://localhost:8000/v1 --model meta-llama/Llama-3.1-8B-Instruct
+"""
+
+import os
+import re
+import time
+import argparse
+
+from common import latency_summary, environment_info, save_results
+from stub_llm_server import StubLLMServer, add_stub_arguments, config_from_args
+
+
+DEFAULT_PROMPTS = [
+    "RAG module, intermediate, 3 days",
+    "Python for absolute beginners, 2 days, lots of hands-on practice",
+    "Kubernetes operators, advanced, 3 days with a capstone project",
+    "Data visualization with gamification for high-school students, 2 days"
+]
+
+_BLOOM_PATTERN = re.compile(r"\b(remember|understand|apply|analy[sz]e|evaluate|create)\b", re.IGNORECASE)
+
+
+def make_generator(base_url, model, api_key):
+    """ModuleGenerator on the openai_compatible provider"""
+    os.environ["AI_PROVIDER"] = "openai_compatible"
+    os.environ["OPENAI_COMPATIBLE_BASE_URL"] = base_url
+    os.environ["OPENAI_COMPATIBLE_MODEL"] = model
+    os.environ["OPENAI_COMPATIBLE_API_KEY"] = api_key
+
+    # Keep generator logs out of the benchmark output
+    from services.structured_logging import configure_logging
+    configure_logging(stream=open(os.devnull, "w"))
+
+    from services.generator import ModuleGenerator
+    return ModuleGenerator()
+
+
+def module_quality(module):
+    """Quality proxies: issues from the generator's checks and Bloom tagging of the files"""
+    files = module["files"]
+    tagged = sum(1 for content in files.values() if _BLOOM_PATTERN.search(content))
+    return {
+        "issues": len(module["generation"]["quality_issues"]),
+        "files": len(files),
+        "mean_file_chars": sum(len(content) for content in files.values()) / max(len(files), 1),
+        "bloom_tagged": tagged / max(len(files), 1)
+    }
+
+
+def run_mode(generator, budget, prompts, repeats):
+    """budget 0 inlines the full guideline files"""
+    generator.guidelines.enabled = budget > 0
+    generator.guidelines.budget_tokens = budget
+
+    latencies = []
+    prompt_tokens = []
+    retrieval_ms = []
+    quality = []
+    errors = 0
+    for _ in range(repeats):
+        for prompt in prompts:
+            start = time.perf_counter()
+            try:
+                module = generator.generate_module(prompt, use_cache=False)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            prompt_tokens.append(module["usage"]["prompt_tokens"])
+            quality.append(module_quality(module))
+
+            # Selection cost on its own (the index is already built)
+            curriculum, pedagogy = generator._load_prompt_files()
+            start = time.perf_counter()
+            generator.guidelines.retrieve(prompt, {"curriculum": curriculum, "pedagogy": pedagogy})
+            retrieval_ms.append((time.perf_counter() - start) * 1000)
+
+    count = max(len(quality), 1)
+    return {
+        "scenario": "full" if budget == 0 else f"retrieved_{budget}",
+        "budget_tokens": budget or None,
+        "generations": len(quality),
+        "errors": errors,
+        "prompt_tokens_mean": round(sum(prompt_tokens) / count, 1),
+        "retrieval_ms": latency_summary(retrieval_ms),
+        "latency_ms": latency_summary(latencies),
+        "quality_issues_mean": round(sum(q["issues"] for q in quality) / count, 2),
+        "files_mean": round(sum(q["files"] for q in quality) / count, 1),
+        "mean_file_chars": round(sum(q["mean_file_chars"] for q in quality) / count, 1),
+        "bloom_tagged_rate": round(sum(q["bloom_tagged"] for q in quality) / count, 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full guideline inlining vs. retrieved guideline sections")
+    parser.add_argument("--budgets", default="0,1000,1500",
+                        help="Comma-separated guideline token budgets (0 = full inlining)")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs of every prompt per budget")
+    parser.add_argument("--base-url", help="OpenAI-compatible server to use instead of the stub")
+    parser.add_argument("--model", default="stub-model", help="Model name on that server")
+    parser.add_argument("--api-key", default="not-needed")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--name", default="guidelines", help="Result file prefix")
+    add_stub_arguments(parser)
+    parser.set_defaults(latency_ms=20)
+    args = parser.parse_args()
+
+    stub = None
+    base_url = args.base_url
+    if not base_url:
+        stub = StubLLMServer(config_from_args(args)).start()
+        base_url = stub.base_url
+    generator = make_generator(base_url, args.model, args.api_key)
+
+    results = {
+        "benchmark": "guidelines",
+        "environment": environment_info(),
+        "stub": stub.config.to_dict() if stub else None,
+        "base_url": args.base_url,
+        "model": args.model,
+        "prompts": DEFAULT_PROMPTS,
+        "scenarios": []
+    }
+    try:
+        for budget in [int(b) for b in args.budgets.split(",") if b.strip()]:
+            scenario = run_mode(generator, budget, DEFAULT_PROMPTS, args.repeats)
+            results["scenarios"].append(scenario)
+            print(f"{scenario['scenario']:<15} prompt_tokens={scenario['prompt_tokens_mean']:<8} "
+                  f"p50={scenario['latency_ms']['p50']}ms retrieval_p50={scenario['retrieval_ms']['p50']}ms "
+                  f"issues={scenario['quality_issues_mean']} bloom_tagged={scenario['bloom_tagged_rate']:.0%}")
+    finally:
+        if stub:
+            stub.stop()
+
+    path = save_results(results, args.output, name=args.name)
+    print(f"\nResults written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+End-to-End Load Benchmark
+Drives the Flask app at increasing concurrency against a local stub LLM server
+
+Runs entirely offline:
+
+    python benchmarks/load_benchmark.py --concurrency 1,4,16 --requests 40
+    python benchmarks/load_benchmark.py --compare benchmarks/results/baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+from common import (
+    MemorySampler, latency_summary, environment_info, save_results,
+    load_results, compare_metric, print_regressions
+)
+from stub_llm_server import StubLLMServer, add_stub_arguments, config_from_args
+
+
+DEFAULT_PROMPT = "RAG module, intermediate, 3 days"
+
+
+class RecordCounter(logging.Filter):
+    """Counts log records passing through the app's queue handler"""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        with self._lock:
+            self.count += 1
+        return True
+
+
+def start_app(stub_urls, output_dir, log_stream):
+    """
+    Import the Flask app wired to the stub server(s) and serve it on a free port
+
+    Several stub URLs are used as a pool through the openai_compatible provider.
+    """
+    if len(stub_urls) > 1:
+        os.environ["AI_PROVIDER"] = "openai_compatible"
+        os.environ["OPENAI_COMPATIBLE_BASE_URL"] = ",".join(stub_urls)
+        os.environ.setdefault("OPENAI_COMPATIBLE_MODEL", "stub-model")
+    else:
+        os.environ["AI_PROVIDER"] = "openai"
+        os.environ["OPENAI_API_KEY"] = "stub"
+        os.environ["OPENAI_BASE_URL"] = stub_urls[0]
+        os.environ.setdefault("OPENAI_MODEL", "stub-model")
+
+    # The batch clients' key is a tenant of its own; everyone else is the default tenant
+    os.environ.setdefault("SCHEDULER_API_KEYS", f"{BatchLoad.HEADERS['X-API-Key']}:benchmark-batch")
+
+    # Install the queue handler before the app does so logs go to log_stream
+    from services.structured_logging import configure_logging
+    queue_handler = configure_logging(stream=log_stream)
+
+    import app as app_module
+    from services.file_builder import FileBuilder
+    from services.zipper import ModuleZipper
+    from werkzeug.serving import make_server
+
+    if app_module.generator is None:
+        raise RuntimeError("Generator failed to initialize against the stub server")
+
+    # Keep benchmark output out of the project's output/ directory
+    app_module.OUTPUT_DIR = output_dir
+    app_module.file_builder = FileBuilder(output_dir=output_dir)
+    app_module.zipper = ModuleZipper(output_dir=output_dir)
+
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name="flask-app", daemon=True)
+    thread.start()
+    return server, queue_handler
+
+
+def wait_until_ready(base_url, timeout=30):
+    """Poll /ready until provider warm-up has finished"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/ready", timeout=5) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def post_generate(base_url, prompt, timeout, regenerate=True, headers=None):
+    """Send one /generate-module request; return (latency_ms, ok)"""
+    body = json.dumps({"instructor_prompt": prompt, "regenerate": regenerate}).encode("utf-8")
+    req = urllib.request.Request(
+        f"{base_url}/generate-module",
+        data=body,
+        headers={"Content-Type": "application/json", **(headers or {})},
+        method="POST"
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            payload = json.loads(response.read())
+            ok = response.status == 200 and payload.get("status") == "success"
+    except (urllib.error.URLError, OSError, ValueError):
+        ok = False
+    return (time.perf_counter() - start) * 1000, ok
+
+
+def measure_log_record_cost(samples=5000):
+    """Average cost (microseconds) of emitting one record through the queue handler"""
+    logger = logging.getLogger("benchmarks.logging")
+    start = time.perf_counter()
+    for i in range(samples):
+        logger.info("Benchmark record", extra={"module_name": "Stub_Module", "file_count": i})
+    return (time.perf_counter() - start) * 1e6 / samples
+
+
+class BatchLoad:
+    """Clients sending batch-priority requests as a separate tenant until stopped"""
+
+    # Mapped to its own tenant in start_app (X-Tenant-Id is ignored unless trusted)
+    HEADERS = {"X-API-Key": "benchmark-batch", "X-Priority": "batch"}
+
+    def __init__(self, base_url, clients, prompt, timeout):
+        self.base_url = base_url
+        self.clients = clients
+        self.prompt = prompt
+        self.timeout = timeout
+        self.completed = 0
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _client(self):
+        while not self._stop.is_set():
+            post_generate(self.base_url, self.prompt, self.timeout, headers=self.HEADERS)
+            self.completed += 1
+
+    def __enter__(self):
+        for index in range(self.clients):
+            thread = threading.Thread(target=self._client, name=f"batch-client-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(self.timeout)
+
+
+def run_scenario(base_url, concurrency, total_requests, prompt, timeout, counter, regenerate=True):
+    latencies = []
+    errors = 0
+    counter.count = 0
+
+    with MemorySampler() as memory:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [
+                pool.submit(post_generate, base_url, prompt, timeout, regenerate)
+                for _ in range(total_requests)
+            ]
+            for future in futures:
+                latency_ms, ok = future.result()
+                latencies.append(latency_ms)
+                if not ok:
+                    errors += 1
+        elapsed = time.perf_counter() - start
+
+    return {
+        "scenario": f"concurrency_{concurrency}",
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": errors,
+        "error_rate": round(errors / total_requests, 4) if total_requests else 0.0,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(total_requests / elapsed, 3) if elapsed > 0 else None,
+        "latency_ms": latency_summary(latencies),
+        "rss_mb_start": round(memory.start_mb, 1),
+        "rss_mb_peak": round(memory.peak_mb, 1),
+        "log_records_per_request": round(counter.count / total_requests, 2) if total_requests else 0
+    }
+
+
+def compare_to_baseline(results, baseline, threshold):
+    baseline_by_name = {s["scenario"]: s for s in baseline.get("scenarios", [])}
+    regressions = []
+    for scenario in results["scenarios"]:
+        previous = baseline_by_name.get(scenario["scenario"])
+        if previous is None:
+            continue
+        checks = [
+            compare_metric("throughput_rps", previous["throughput_rps"], scenario["throughput_rps"],
+                           threshold, higher_is_better=True),
+            compare_metric("p95_ms", previous["latency_ms"]["p95"], scenario["latency_ms"]["p95"], threshold),
+            compare_metric("p99_ms", previous["latency_ms"]["p99"], scenario["latency_ms"]["p99"], threshold),
+            compare_metric("rss_mb_peak", previous["rss_mb_peak"], scenario["rss_mb_peak"], threshold)
+        ]
+        if scenario["error_rate"] > previous["error_rate"] + 0.01:
+            checks.append({
+                "metric": "error_rate",
+                "baseline": previous["error_rate"],
+                "current": scenario["error_rate"],
+                "change_pct": round((scenario["error_rate"] - previous["error_rate"]) * 100, 1)
+            })
+        for regression in checks:
+            if regression:
+                regression["scenario"] = scenario["scenario"]
+                regressions.append(regression)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load benchmark for /generate-module")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per concurrency level")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="Instructor prompt to send")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds")
+    parser.add_argument("--allow-reuse", action="store_true",
+                        help="Let the server return existing similar modules instead of generating")
+    parser.add_argument("--batch-clients", type=int, default=0,
+                        help="Background clients sending batch-priority requests during the scenarios")
+    parser.add_argument("--endpoints", type=int, default=1,
+                        help="Stub servers to start; more than one are load-balanced as an endpoint pool")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--name", default="load", help="Result file prefix")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed relative regression (0.15 = 15%%)")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    stubs = [StubLLMServer(config_from_args(args)).start() for _ in range(max(args.endpoints, 1))]
+    stub = stubs[0]
+    output_dir = tempfile.mkdtemp(prefix="copilot-bench-")
+    log_stream = open(os.devnull, "w")
+    server, queue_handler = start_app([s.base_url for s in stubs], output_dir, log_stream)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    counter = RecordCounter()
+    queue_handler.addFilter(counter)
+
+    print(f"Stub LLM server: {', '.join(s.base_url for s in stubs)}")
+    print(f"Flask app:       {base_url}")
+    print(f"Output dir:      {output_dir}\n")
+
+    results = {
+        "benchmark": "load",
+        "environment": environment_info(),
+        "stub": stub.config.to_dict(),
+        "endpoints": len(stubs),
+        "prompt": args.prompt,
+        "batch_clients": args.batch_clients,
+        "scenarios": []
+    }
+
+    try:
+        wait_until_ready(base_url)
+        # Warm-up request so connection setup is not counted
+        post_generate(base_url, args.prompt, args.timeout)
+
+        for concurrency in levels:
+            with BatchLoad(base_url, args.batch_clients, args.prompt, args.timeout) as batch:
+                scenario = run_scenario(base_url, concurrency, args.requests, args.prompt, args.timeout,
+                                        counter, regenerate=not args.allow_reuse)
+            if args.batch_clients:
+                scenario["scenario"] += f"_batch_{args.batch_clients}"
+                scenario["batch_completed"] = batch.completed
+            results["scenarios"].append(scenario)
+            latency = scenario["latency_ms"]
+            print(f"c={concurrency:<3} rps={scenario['throughput_rps']:<8} p50={latency['p50']}ms "
+                  f"p95={latency['p95']}ms p99={latency['p99']}ms errors={scenario['error_rate']:.1%} "
+                  f"rss_peak={scenario['rss_mb_peak']}MB")
+
+        queue_handler.removeFilter(counter)
+        record_cost_us = measure_log_record_cost()
+        for scenario in results["scenarios"]:
+            scenario["logging_overhead_us_per_request"] = round(
+                scenario["log_records_per_request"] * record_cost_us, 2
+            )
+        results["logging"] = {"record_cost_us": round(record_cost_us, 3)}
+        print(f"\nLogging: {record_cost_us:.2f}us per record")
+        if len(stubs) > 1:
+            results["endpoint_requests"] = [s.requests for s in stubs]
+            print(f"Requests per endpoint: {results['endpoint_requests']}")
+    finally:
+        server.shutdown()
+        for s in stubs:
+            s.stop()
+        log_stream.close()
+
+    path = save_results(results, args.output, args.name)
+    print(f"Results saved to {path}")
+
+    if args.compare:
+        regressions = compare_to_baseline(results, load_results(args.compare), args.threshold)
+        print_regressions(regressions)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
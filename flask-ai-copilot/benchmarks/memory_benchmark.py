@@ -0,0 +1,160 @@
+"""
+Memory Benchmark
+Peak RSS of concurrent generations with buffered responses vs. the streaming pipeline (STREAMING_PIPELINE)
+
+Each mode runs the Flask app in its own process (so one mode's heap does not
+inflate the other's) against a stub LLM server started here. Use large
+modules so per-request memory dominates the interpreter's baseline:
+
+    python benchmarks/memory_benchmark.py
+    python benchmarks/memory_benchmark.py --concurrency 1,8,16 --days 10 --file-size 100000
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+from common import MemorySampler, latency_summary, environment_info, save_results
+from stub_llm_server import StubLLMServer, add_stub_arguments, config_from_args
+
+
+DEFAULT_PROMPT = "Distributed systems, advanced, 10 days"
+MODES = {"buffered": "false", "streamed": "true"}
+
+
+def post_generate(base_url, prompt, timeout):
+    """
+    Send one /generate-module request, reading the response in chunks
+    without keeping it (so the client does not add to the server's RSS)
+
+    Returns:
+        tuple: (latency_ms, ok, response bytes)
+    """
+    body = json.dumps({"instructor_prompt": prompt, "regenerate": True}).encode("utf-8")
+    req = urllib.request.Request(
+        f"{base_url}/generate-module",
+        data=body,
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    start = time.perf_counter()
+    size = 0
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            while True:
+                chunk = response.read(65536)
+                if not chunk:
+                    break
+                size += len(chunk)
+            ok = response.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return (time.perf_counter() - start) * 1000, ok, size
+
+
+def run_child(args):
+    """One mode in this process: start the app, run every concurrency level, print JSON"""
+    # Read by app.py at import time
+    os.environ["STREAMING_PIPELINE"] = MODES[args.mode]
+    from load_benchmark import start_app, wait_until_ready
+
+    output_dir = tempfile.mkdtemp(prefix="copilot-memory-")
+    server, _ = start_app([args.stub_url], output_dir, open(os.devnull, "w"))
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    wait_until_ready(base_url)
+    # Warm-up request so imports and connection setup are not counted
+    post_generate(base_url, args.prompt, args.timeout)
+
+    scenarios = []
+    try:
+        for concurrency in [int(level) for level in args.concurrency.split(",") if level.strip()]:
+            latencies = []
+            errors = 0
+            response_bytes = []
+            with MemorySampler(interval=0.01) as memory:
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    futures = [
+                        pool.submit(post_generate, base_url, args.prompt, args.timeout)
+                        for _ in range(concurrency * args.rounds)
+                    ]
+                    for future in futures:
+                        latency_ms, ok, size = future.result()
+                        latencies.append(latency_ms)
+                        response_bytes.append(size)
+                        if not ok:
+                            errors += 1
+            scenarios.append({
+                "scenario": f"{args.mode}_c{concurrency}",
+                "mode": args.mode,
+                "concurrency": concurrency,
+                "requests": len(latencies),
+                "errors": errors,
+                "latency_ms": latency_summary(latencies),
+                "response_kb_mean": round(sum(response_bytes) / max(len(response_bytes), 1) / 1024, 1),
+                "rss_mb_start": round(memory.start_mb, 1),
+                "rss_mb_peak": round(memory.peak_mb, 1),
+                "rss_mb_growth": round(memory.peak_mb - memory.start_mb, 1)
+            })
+    finally:
+        server.shutdown()
+    print(json.dumps(scenarios))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak RSS of buffered vs. streamed generations")
+    parser.add_argument("--concurrency", default="1,4,8", help="Comma-separated concurrency levels")
+    parser.add_argument("--rounds", type=int, default=2, help="Requests per client at each level")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="Instructor prompt to send")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--name", default="memory", help="Result file prefix")
+    # Internal: run one mode in a child process
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=sorted(MODES), help=argparse.SUPPRESS)
+    parser.add_argument("--stub-url", help=argparse.SUPPRESS)
+    add_stub_arguments(parser)
+    parser.set_defaults(latency_ms=20, days=10, file_size=50000)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    stub = StubLLMServer(config_from_args(args)).start()
+    results = {
+        "benchmark": "memory",
+        "environment": environment_info(),
+        "stub": stub.config.to_dict(),
+        "prompt": args.prompt,
+        "scenarios": []
+    }
+    try:
+        for mode in MODES:
+            command = [
+                sys.executable, os.path.abspath(__file__), "--child", "--mode", mode,
+                "--stub-url", stub.base_url, "--concurrency", args.concurrency,
+                "--rounds", str(args.rounds), "--prompt", args.prompt, "--timeout", str(args.timeout)
+            ]
+            completed = subprocess.run(command, capture_output=True, text=True, check=True)
+            scenarios = json.loads(completed.stdout.strip().splitlines()[-1])
+            results["scenarios"].extend(scenarios)
+            for scenario in scenarios:
+                print(f"{scenario['scenario']:<14} peak={scenario['rss_mb_peak']}MB "
+                      f"growth={scenario['rss_mb_growth']}MB p50={scenario['latency_ms']['p50']}ms "
+                      f"response={scenario['response_kb_mean']}KB errors={scenario['errors']}")
+    finally:
+        stub.stop()
+
+    path = save_results(results, args.output, name=args.name)
+    print(f"\nResults written to {path}")
+
+
+if __name__ == "__main__":
+    main()
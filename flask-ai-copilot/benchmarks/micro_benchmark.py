@@ -0,0 +1,199 @@
+"""
+Component Micro-Benchmarks
+Times FileBuilder, ModuleZipper and JSON extraction on synthetic modules
+
+    python benchmarks/micro_benchmark.py
+    python benchmarks/micro_benchmark.py --cases small,many_files --output benchmarks/results/micro_baseline.json
+    python benchmarks/micro_benchmark.py --compare benchmarks/results/micro_baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+from common import (
+    environment_info, save_results, load_results, compare_metric, print_regressions
+)
+
+# The generator refuses to import without a key; no request is ever sent
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ.setdefault("AI_PROVIDER", "openai")
+# Time the components themselves, not process-pool round-trips (see offload_benchmark.py)
+os.environ.setdefault("OFFLOAD_ENABLED", "false")
+
+from services.file_builder import FileBuilder
+from services.file_tree import FileTree
+from services.zipper import ModuleZipper
+from services.generator import ModuleGenerator
+
+
+KB = 1024
+MB = 1024 * KB
+
+# name: (file count, bytes per file, directory depth)
+CASES = {
+    "small": (10, 1 * KB, 1),
+    "medium": (100, 16 * KB, 1),
+    "many_files": (5000, 1 * KB, 1),
+    "large_files": (10, 4 * MB, 1),
+    "deep_nesting": (500, 2 * KB, 12)
+}
+
+QUICK_CASES = ["small", "medium", "deep_nesting"]
+
+
+def synthetic_module(file_count, file_size, depth):
+    """Build a {filepath: content} dict shaped like a generated module"""
+    line = "- Bloom: Apply. Learners build a retrieval pipeline step by step.\n"
+    content = (line * (file_size // len(line) + 1))[:file_size]
+    files = {"summary.md": content}
+    days = max(1, file_count // 5)
+    for index in range(file_count - 1):
+        day = index % days + 1
+        nested = "/".join(f"part{level}" for level in range(1, depth))
+        directory = f"Day{day}/{nested}" if nested else f"Day{day}"
+        files[f"{directory}/file_{index}.md"] = content
+    return files
+
+
+def llm_style_response(module):
+    """Wrap module JSON the way models often do (prose plus a code fence)"""
+    return "Here is your module:\n```json\n" + json.dumps(module) + "\n```\nLet me know if you need changes."
+
+
+def measure(func, repeats):
+    """
+    Run func `repeats` times for timing, then once under tracemalloc
+
+    Returns:
+        dict: best/median seconds, peak traced memory and allocated blocks
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+
+    tracemalloc.start()
+    before_blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    after_blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+
+    return {
+        "best_ms": round(timings[0] * 1000, 3),
+        "median_ms": round(timings[len(timings) // 2] * 1000, 3),
+        "peak_kb": round(peak / KB, 1),
+        "live_blocks": max(0, after_blocks - before_blocks)
+    }
+
+
+def run_case(name, file_count, file_size, depth, repeats, workdir):
+    files = synthetic_module(file_count, file_size, depth)
+    module = {"module_name": f"Bench_{name}", "files": files}
+    raw_response = llm_style_response(module)
+    total_bytes = sum(len(content) for content in files.values())
+
+    builder = FileBuilder(output_dir=workdir)
+    zipper = ModuleZipper(output_dir=workdir)
+    generator = ModuleGenerator()
+
+    # Build once so the tree and zip benchmarks have inputs on disk
+    file_tree = builder.build_module(module["module_name"], files)
+
+    components = {
+        "build_module": lambda: builder.build_module(module["module_name"], files),
+        "file_tree_markdown": lambda: FileTree.from_entries(file_tree).to_markdown(),
+        "create_zip": lambda: zipper.create_zip(module["module_name"]),
+        # Peak memory here should stay flat as the module grows
+        "stream_archive": lambda: sum(len(chunk) for chunk in zipper.stream_archive(module["module_name"])[0]),
+        "extract_json": lambda: generator._extract_json(raw_response)
+    }
+
+    results = {}
+    for component, func in components.items():
+        results[component] = measure(func, repeats)
+        print(f"  {component:<20} best={results[component]['best_ms']:>10}ms "
+              f"median={results[component]['median_ms']:>10}ms peak={results[component]['peak_kb']:>10}KB")
+
+    shutil.rmtree(os.path.join(workdir, module["module_name"]), ignore_errors=True)
+    return {
+        "case": name,
+        "file_count": file_count,
+        "file_size": file_size,
+        "depth": depth,
+        "total_mb": round(total_bytes / MB, 2),
+        "components": results
+    }
+
+
+def compare_to_baseline(results, baseline, threshold):
+    baseline_cases = {case["case"]: case for case in baseline.get("cases", [])}
+    regressions = []
+    for case in results["cases"]:
+        previous = baseline_cases.get(case["case"])
+        if previous is None:
+            continue
+        for component, current in case["components"].items():
+            old = previous["components"].get(component)
+            if old is None:
+                continue
+            for metric in ("median_ms", "peak_kb"):
+                regression = compare_metric(metric, old[metric], current[metric], threshold)
+                if regression:
+                    regression["scenario"] = f"{case['case']}/{component}"
+                    regressions.append(regression)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for module building, zipping and JSON extraction")
+    parser.add_argument("--cases", help=f"Comma-separated cases to run (available: {', '.join(CASES)})")
+    parser.add_argument("--quick", action="store_true", help=f"Run only {', '.join(QUICK_CASES)}")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per component")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--name", default="micro", help="Result file prefix")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.20, help="Allowed relative regression (0.20 = 20%%)")
+    args = parser.parse_args()
+
+    if args.cases:
+        selected = [name.strip() for name in args.cases.split(",") if name.strip()]
+    elif args.quick:
+        selected = QUICK_CASES
+    else:
+        selected = list(CASES)
+
+    unknown = [name for name in selected if name not in CASES]
+    if unknown:
+        parser.error(f"Unknown case(s): {', '.join(unknown)}")
+
+    workdir = tempfile.mkdtemp(prefix="copilot-micro-")
+    results = {"benchmark": "micro", "environment": environment_info(), "repeats": args.repeats, "cases": []}
+    try:
+        for name in selected:
+            file_count, file_size, depth = CASES[name]
+            print(f"{name}: {file_count} files x {file_size // KB}KB, depth {depth}")
+            results["cases"].append(run_case(name, file_count, file_size, depth, args.repeats, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    path = save_results(results, args.output, args.name)
+    print(f"\nResults saved to {path}")
+
+    if args.compare:
+        regressions = compare_to_baseline(results, load_results(args.compare), args.threshold)
+        print_regressions(regressions)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Offload Scaling Benchmark
+Measures CPU-bound stage throughput inline vs. in process pools of increasing size
+
+Each task zips a synthetic module and parses a large LLM-style JSON response,
+the two stages dispatched to the offload pool by the app:
+
+    python benchmarks/offload_benchmark.py
+    python benchmarks/offload_benchmark.py --workers 0,1,2,4,8 --tasks 32 --files 200
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from common import environment_info, save_results, load_results, compare_metric, print_regressions
+
+from services.offload import OffloadPool
+from services.zipper import write_zip_archive
+from services.json_parsing import parse_json_response
+from micro_benchmark import synthetic_module, llm_style_response, KB
+
+
+def write_module(workdir, files):
+    """Write files to disk; return (entries for write_zip_archive, total bytes)"""
+    entries = []
+    total = 0
+    for rel_path, content in files.items():
+        full_path = os.path.join(workdir, rel_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        entries.append((full_path, rel_path))
+        total += len(content)
+    return entries, total
+
+
+def run_level(workers, tasks, concurrency, entries, total_bytes, response, zip_dir):
+    """Run `tasks` zip+parse tasks from `concurrency` threads; workers=0 runs inline"""
+    pool = OffloadPool(workers=max(workers, 1), enabled=workers > 0, min_bytes=0,
+                       max_pending=max(concurrency, 1) * 2)
+
+    def task(index):
+        zip_path = os.path.join(zip_dir, f"bench_{index % concurrency}.zip")
+        pool.run(write_zip_archive, zip_path, entries, size=total_bytes, stage="create_zip")
+        pool.run(parse_json_response, response, size=len(response), stage="parse_json")
+
+    # Start the worker processes before timing
+    if workers > 0:
+        list(ThreadPoolExecutor(max_workers=workers).map(
+            lambda _: pool.run(parse_json_response, "{}", size=1, stage="warmup"), range(workers)
+        ))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as threads:
+        list(threads.map(task, range(tasks)))
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+
+    return {
+        "scenario": "inline" if workers == 0 else f"pool_{workers}",
+        "workers": workers,
+        "tasks": tasks,
+        "duration_s": round(elapsed, 3),
+        "throughput_tps": round(tasks / elapsed, 3)
+    }
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    default_levels = sorted({0, 1, 2, 4, cpus})
+    parser = argparse.ArgumentParser(description="Throughput of offloaded CPU-bound stages by pool size")
+    parser.add_argument("--workers", default=",".join(str(level) for level in default_levels),
+                        help="Comma-separated pool sizes (0 = inline on the request threads)")
+    parser.add_argument("--tasks", type=int, default=16, help="Tasks per pool size")
+    parser.add_argument("--concurrency", type=int, default=0, help="Request threads (0 = largest pool size)")
+    parser.add_argument("--files", type=int, default=100, help="Files in the synthetic module")
+    parser.add_argument("--file-size", type=int, default=32, help="KB per file")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--name", default="offload", help="Result file prefix")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed relative regression (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.workers.split(",") if level.strip()]
+    concurrency = args.concurrency or max(max(levels), 1)
+
+    files = synthetic_module(args.files, args.file_size * KB, 1)
+    response = llm_style_response({"module_name": "Bench_Offload", "files": files})
+    workdir = tempfile.mkdtemp(prefix="copilot-offload-")
+    entries, total_bytes = write_module(os.path.join(workdir, "module"), files)
+
+    print(f"CPUs: {cpus}  module: {len(files)} files, {total_bytes / (1024 * 1024):.1f}MB  "
+          f"response: {len(response) / (1024 * 1024):.1f}MB  threads: {concurrency}\n")
+
+    results = {
+        "benchmark": "offload",
+        "environment": environment_info(),
+        "module_bytes": total_bytes,
+        "response_bytes": len(response),
+        "concurrency": concurrency,
+        "scenarios": []
+    }
+    try:
+        inline_tps = None
+        for workers in levels:
+            scenario = run_level(workers, args.tasks, concurrency, entries, total_bytes, response, workdir)
+            if workers == 0:
+                inline_tps = scenario["throughput_tps"]
+            if inline_tps:
+                scenario["speedup"] = round(scenario["throughput_tps"] / inline_tps, 2)
+            results["scenarios"].append(scenario)
+            print(f"{scenario['scenario']:<8} {scenario['throughput_tps']:>8} tasks/s "
+                  f"speedup={scenario.get('speedup', '-')}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    path = save_results(results, args.output, args.name)
+    print(f"\nResults saved to {path}")
+
+    if args.compare:
+        baseline = {s["scenario"]: s for s in load_results(args.compare).get("scenarios", [])}
+        regressions = []
+        for scenario in results["scenarios"]:
+            previous = baseline.get(scenario["scenario"])
+            if previous is None:
+                continue
+            regression = compare_metric("throughput_tps", previous["throughput_tps"],
+                                        scenario["throughput_tps"], args.threshold, higher_is_better=True)
+            if regression:
+                regression["scenario"] = scenario["scenario"]
+                regressions.append(regression)
+        print_regressions(regressions)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Repair Benchmark
+Retry token spend with full-module retries vs. targeted repair of invalid files
+
+Runs the generator against a local stub LLM server that returns a fraction of
+files with invalid content. Without repair every broken module is retried in
+full on the next cascade model; with repair only the broken files are
+regenerated:
+
+    python benchmarks/repair_benchmark.py
+    python benchmarks/repair_benchmark.py --requests 50 --invalid-file-rate 0.1
+"""
+
+import os
+import time
+import argparse
+
+from common import latency_summary, environment_info, save_results
+from stub_llm_server import StubLLMServer, add_stub_arguments, config_from_args
+
+
+DEFAULT_PROMPT = "RAG module, intermediate, 3 days"
+
+
+def make_generator(stub_url, cascade):
+    """ModuleGenerator wired to the stub server"""
+    os.environ["AI_PROVIDER"] = "openai"
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["OPENAI_BASE_URL"] = stub_url
+    os.environ["OPENAI_MODEL"] = cascade[-1]
+    os.environ["MODEL_CASCADE"] = ",".join(cascade)
+
+    # Keep generator logs out of the benchmark output
+    from services.structured_logging import configure_logging
+    configure_logging(stream=open(os.devnull, "w"))
+
+    from services.generator import ModuleGenerator
+    return ModuleGenerator()
+
+
+def run_mode(generator, repair, requests, prompt):
+    generator.repair_enabled = repair
+    latencies = []
+    totals = {"total_tokens": 0, "escalation": 0, "repair": 0}
+    accepted_clean = 0
+    errors = 0
+
+    for _ in range(requests):
+        start = time.perf_counter()
+        try:
+            module = generator.generate_module(prompt, use_cache=False)
+        except Exception:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+        generation = module["generation"]
+        totals["total_tokens"] += module["usage"]["total_tokens"]
+        totals["escalation"] += generation["retry_tokens"]["escalation"]
+        totals["repair"] += generation["retry_tokens"]["repair"]
+        if not generation["quality_issues"]:
+            accepted_clean += 1
+
+    completed = max(len(latencies), 1)
+    return {
+        "scenario": "repair" if repair else "full_retry",
+        "requests": requests,
+        "errors": errors,
+        "clean_rate": round(accepted_clean / requests, 4),
+        "tokens_per_request": round(totals["total_tokens"] / completed, 1),
+        "retry_tokens_per_request": round((totals["escalation"] + totals["repair"]) / completed, 1),
+        "escalation_tokens": totals["escalation"],
+        "repair_tokens": totals["repair"],
+        "latency_ms": latency_summary(latencies)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retry token spend: full retries vs. targeted repair")
+    parser.add_argument("--requests", type=int, default=20, help="Generations per mode")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="Instructor prompt")
+    parser.add_argument("--cascade", default="stub-small,stub-model", help="Comma-separated model cascade")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--name", default="repair", help="Result file prefix")
+    add_stub_arguments(parser)
+    parser.set_defaults(latency_ms=20, invalid_file_rate=0.05, seed=7)
+    args = parser.parse_args()
+
+    stub = StubLLMServer(config_from_args(args)).start()
+    generator = make_generator(stub.base_url, [m.strip() for m in args.cascade.split(",") if m.strip()])
+
+    results = {
+        "benchmark": "repair",
+        "environment": environment_info(),
+        "stub": stub.config.to_dict(),
+        "prompt": args.prompt,
+        "scenarios": []
+    }
+    try:
+        for repair in (False, True):
+            scenario = run_mode(generator, repair, args.requests, args.prompt)
+            results["scenarios"].append(scenario)
+            print(f"{scenario['scenario']:<11} tokens/req={scenario['tokens_per_request']:<9} "
+                  f"retry_tokens/req={scenario['retry_tokens_per_request']:<9} "
+                  f"clean={scenario['clean_rate']:.0%} errors={scenario['errors']} "
+                  f"p50={scenario['latency_ms']['p50']}ms")
+    finally:
+        stub.stop()
+
+    path = save_results(results, args.output, name=args.name)
+    print(f"\nResults written to {path}")
+
+
+if __name__ == "__main__":
+    main()
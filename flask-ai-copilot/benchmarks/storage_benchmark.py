@@ -0,0 +1,124 @@
+"""
+Version Storage Benchmark
+Disk space per additional module version with full copies vs. delta storage (DELTA_STORAGE)
+
+Builds a module, then publishes versions that each change a few files, and
+measures the bytes every version adds on disk (hard-linked files counted once):
+
+    python benchmarks/storage_benchmark.py
+    python benchmarks/storage_benchmark.py --files 60 --file-size 20000 --changed 1,5,20
+"""
+
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from common import environment_info, save_results
+
+
+def disk_bytes(path):
+    """Bytes used by the files under path, counting hard-linked files once"""
+    seen = set()
+    total = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            stat = os.stat(os.path.join(root, filename))
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_size
+    return total
+
+
+def make_files(count, size, rng):
+    files = {}
+    for index in range(count):
+        day = index // 5 + 1
+        files[f"Day{day}/file{index}.md"] = "".join(rng.choice("abcdefgh \n") for _ in range(size))
+    files["summary.md"] = "# Summary\n"
+    return files
+
+
+def run_mode(delta, args, changed):
+    import services.versions as versions_module
+    from services.file_builder import FileBuilder
+    from services.zipper import ModuleZipper
+
+    versions_module.DELTA_STORAGE = delta
+    output_dir = tempfile.mkdtemp(prefix="copilot-storage-")
+    builder = FileBuilder(output_dir=output_dir)
+    zipper = ModuleZipper(output_dir=output_dir)
+    module_dir = builder.versions.module_dir("Storage_Benchmark")
+    rng = random.Random(1)
+
+    files = make_files(args.files, args.file_size, rng)
+    builder.build_module("Storage_Benchmark", files)
+    zipper.create_zip("Storage_Benchmark")
+    previous = disk_bytes(module_dir)
+
+    added = []
+    change_bytes = []
+    publish_ms = []
+    paths = sorted(files)
+    for _ in range(args.versions):
+        for path in rng.sample(paths, changed):
+            files[path] = "".join(rng.choice("abcdefgh \n") for _ in range(args.file_size))
+        start = time.perf_counter()
+        builder.build_module("Storage_Benchmark", files)
+        zipper.create_zip("Storage_Benchmark")
+        publish_ms.append((time.perf_counter() - start) * 1000)
+        current = disk_bytes(module_dir)
+        added.append(current - previous)
+        change_bytes.append(changed * args.file_size)
+        previous = current
+
+    count = len(added)
+    return {
+        "scenario": f"{'delta' if delta else 'full_copy'}_changed{changed}",
+        "delta_storage": delta,
+        "changed_files": changed,
+        "versions": count,
+        "module_bytes": sum(len(content) for content in files.values()),
+        "change_bytes_mean": round(sum(change_bytes) / count),
+        "added_bytes_mean": round(sum(added) / count),
+        "added_per_change_byte": round(sum(added) / max(sum(change_bytes), 1), 3),
+        "build_ms_mean": round(sum(publish_ms) / count, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Disk space per module version: full copies vs. delta storage")
+    parser.add_argument("--files", type=int, default=30, help="Files per module")
+    parser.add_argument("--file-size", type=int, default=10000, help="Characters per file")
+    parser.add_argument("--changed", default="1,3,10", help="Comma-separated numbers of files changed per version")
+    parser.add_argument("--versions", type=int, default=5, help="Versions published after the first")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--name", default="storage", help="Result file prefix")
+    args = parser.parse_args()
+
+    # Keep service logs out of the benchmark output
+    from services.structured_logging import configure_logging
+    configure_logging(stream=open(os.devnull, "w"))
+
+    results = {
+        "benchmark": "storage",
+        "environment": environment_info(),
+        "files": args.files,
+        "file_size": args.file_size,
+        "scenarios": []
+    }
+    for changed in [int(level) for level in args.changed.split(",") if level.strip()]:
+        for delta in (False, True):
+            scenario = run_mode(delta, args, min(changed, args.files))
+            results["scenarios"].append(scenario)
+            print(f"{scenario['scenario']:<20} module={scenario['module_bytes']} "
+                  f"change={scenario['change_bytes_mean']} added={scenario['added_bytes_mean']} "
+                  f"added/change={scenario['added_per_change_byte']} build={scenario['build_ms_mean']}ms")
+
+    path = save_results(results, args.output, name=args.name)
+    print(f"\nResults written to {path}")
+
+
+if __name__ == "__main__":
+    main()
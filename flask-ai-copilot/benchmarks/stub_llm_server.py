@@ -0,0 +1,329 @@
+"""
+Stub LLM Server
+Local OpenAI-compatible chat completions server for offline benchmarks
+"""
+
+import json
+import time
+import random
+import argparse
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubConfig:
+    """Behaviour of the stub server"""
+
+    def __init__(self, latency_ms=200, tokens_per_second=0, prompt_tokens_per_second=0, days=3,
+                 files_per_day=5, file_size=2000, error_rate=0.0, unique_modules=True, invalid_file_rate=0.0,
+                 max_output_tokens=0, seed=None):
+        # Time before the first byte of the response
+        self.latency_ms = latency_ms
+        # Simulated generation speed (0 disables the per-token delay)
+        self.tokens_per_second = tokens_per_second
+        # Simulated prompt processing (prefill) speed (0 disables the delay)
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        # Shape of the generated module
+        self.days = days
+        self.files_per_day = files_per_day
+        self.file_size = file_size
+        # Fraction of requests answered with HTTP 500
+        self.error_rate = error_rate
+        # Give every response its own module_name
+        self.unique_modules = unique_modules
+        # Fraction of files in a full module returned with non-string content
+        self.invalid_file_rate = invalid_file_rate
+        # Provider output limit: longer responses are cut off with finish_reason "length" (0 = no limit)
+        self.max_output_tokens = max_output_tokens
+        self.random = random.Random(seed)
+
+    def to_dict(self):
+        return {
+            "latency_ms": self.latency_ms,
+            "tokens_per_second": self.tokens_per_second,
+            "prompt_tokens_per_second": self.prompt_tokens_per_second,
+            "days": self.days,
+            "files_per_day": self.files_per_day,
+            "file_size": self.file_size,
+            "error_rate": self.error_rate,
+            "unique_modules": self.unique_modules,
+            "invalid_file_rate": self.invalid_file_rate,
+            "max_output_tokens": self.max_output_tokens
+        }
+
+
+# Characters of content per streamed chunk (roughly what providers send per event)
+STREAM_CHUNK_CHARS = 256
+
+DAY_FILES = ["lesson.md", "slides.md", "exercises.md", "video_script.md", "micro_learning.md",
+             "diagrams.md", "quiz.md", "reading.md"]
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def build_module(config, module_name):
+    """Build a synthetic module in the generator's output format"""
+    paragraph = ("Learners apply retrieval concepts to a worked example. "
+                 "Bloom: Apply. ") * (config.file_size // 64 + 1)
+    body = paragraph[:config.file_size]
+
+    files = {"summary.md": f"# {module_name}\n\n{body}"}
+    for day in range(1, config.days + 1):
+        for index in range(config.files_per_day):
+            name = DAY_FILES[index] if index < len(DAY_FILES) else f"extra_{index}.md"
+            files[f"Day{day}/{name}"] = f"# Day {day} - {name}\n\n{body}"
+    files["final_project.md"] = f"# Final Project\n\n{body}"
+    files["rubric.md"] = f"# Rubric\n\n{body}"
+    if config.invalid_file_rate > 0:
+        for path in files:
+            if config.random.random() < config.invalid_file_rate:
+                files[path] = None
+    return {"module_name": module_name, "files": files}
+
+
+def build_requested_files(config, paths):
+    """Content for the files named in a repair or continuation request"""
+    paragraph = ("Requested content that keeps the module consistent. "
+                 "Bloom: Understand. ") * (config.file_size // 64 + 1)
+    return {"files": {path: f"# {path}\n\n{paragraph[:config.file_size]}" for path in paths}}
+
+
+def response_schema(request_body):
+    """(name, schema) of a json_schema response_format, or (None, None)"""
+    response_format = request_body.get("response_format") or {}
+    if response_format.get("type") != "json_schema":
+        return None, None
+    json_schema = response_format.get("json_schema") or {}
+    return json_schema.get("name"), json_schema.get("schema") or {}
+
+
+def as_file_list(payload):
+    """Schema form of a response: files as [{"path", "content"}]"""
+    payload = dict(payload)
+    payload["files"] = [{"path": path, "content": content} for path, content in payload["files"].items()]
+    return payload
+
+
+class StubLLMServer:
+    """Threaded HTTP server implementing POST /v1/chat/completions"""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or StubConfig()
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        # Streams the client closed before they were complete
+        self.aborted_streams = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _next_module_name(self):
+        if not self.config.unique_modules:
+            return "Stub_Module"
+        return f"Stub_Module_{next(self._counter)}"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                # Keep benchmark output clean
+                pass
+
+            def _send_json(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"object": "list", "data": [{"id": "stub-model", "object": "model"}]})
+                else:
+                    self._send_json(404, {"error": {"message": "Not found"}})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b"{}"
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "Not found"}})
+                    return
+
+                request_body = json.loads(raw or b"{}")
+                config = server.config
+                with server._lock:
+                    server.requests += 1
+                    fail = config.error_rate > 0 and config.random.random() < config.error_rate
+                    if fail:
+                        server.errors += 1
+
+                time.sleep(config.latency_ms / 1000.0)
+                if fail:
+                    self._send_json(500, {"error": {"message": "Stub server error", "type": "server_error"}})
+                    return
+
+                messages = request_body.get("messages", [])
+                prompt_text = "".join(str(m.get("content", "")) for m in messages)
+                if config.prompt_tokens_per_second > 0:
+                    time.sleep(estimate_tokens(prompt_text) / config.prompt_tokens_per_second)
+                schema_name, schema = response_schema(request_body)
+                if request_body.get("max_tokens") == 5:
+                    content = "pong"
+                elif schema_name in ("module_repair", "module_continuation"):
+                    paths = schema["properties"]["files"]["items"]["properties"]["path"].get("enum", [])
+                    content = json.dumps(as_file_list(build_requested_files(config, paths)))
+                else:
+                    with server._lock:
+                        payload = build_module(config, server._next_module_name())
+                    if schema_name:
+                        payload = as_file_list(payload)
+                    content = json.dumps(payload)
+
+                finish_reason = "stop"
+                limit = config.max_output_tokens
+                if limit and request_body.get("max_tokens"):
+                    limit = min(limit, request_body["max_tokens"])
+                if limit and estimate_tokens(content) > limit:
+                    content = content[:limit * 4]
+                    finish_reason = "length"
+
+                completion_tokens = estimate_tokens(content)
+                usage = {
+                    "prompt_tokens": estimate_tokens(prompt_text),
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": estimate_tokens(prompt_text) + completion_tokens
+                }
+                if request_body.get("stream"):
+                    include_usage = (request_body.get("stream_options") or {}).get("include_usage")
+                    self._send_stream(request_body, content, finish_reason, usage if include_usage else None)
+                    return
+
+                if config.tokens_per_second > 0:
+                    time.sleep(completion_tokens / config.tokens_per_second)
+
+                self._send_json(200, {
+                    "id": f"chatcmpl-stub-{server.requests}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request_body.get("model", "stub-model"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": finish_reason
+                    }],
+                    "usage": usage
+                })
+
+            def _send_stream(self, request_body, content, finish_reason, usage):
+                """Server-sent events in chat.completion.chunk format, paced like the plain response"""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                base = {
+                    "id": f"chatcmpl-stub-{server.requests}",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": request_body.get("model", "stub-model")
+                }
+
+                def send(choices, **extra):
+                    event = dict(base, choices=choices, **extra)
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+
+                config = server.config
+                try:
+                    for start in range(0, len(content), STREAM_CHUNK_CHARS):
+                        piece = content[start:start + STREAM_CHUNK_CHARS]
+                        if config.tokens_per_second > 0:
+                            time.sleep(estimate_tokens(piece) / config.tokens_per_second)
+                        send([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+                    send([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+                    if usage:
+                        send([], usage=usage)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client closed the stream (a cancelled call): stop generating
+                    server.aborted_streams += 1
+
+        return Handler
+
+
+def add_stub_arguments(parser):
+    """Register the stub server options on an argparse parser"""
+    parser.add_argument("--latency-ms", type=int, default=200, help="Delay before responding")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="Simulated generation speed (0 = instant)")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=0,
+                        help="Simulated prompt processing speed (0 = instant)")
+    parser.add_argument("--days", type=int, default=3, help="Days in each generated module")
+    parser.add_argument("--files-per-day", type=int, default=5, help="Files per day")
+    parser.add_argument("--file-size", type=int, default=2000, help="Characters per file")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that return HTTP 500")
+    parser.add_argument("--invalid-file-rate", type=float, default=0.0,
+                        help="Fraction of generated files returned with invalid (null) content")
+    parser.add_argument("--max-output-tokens", type=int, default=0,
+                        help="Cut off longer responses with finish_reason=length (0 = no limit)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for error injection")
+
+
+def config_from_args(args):
+    return StubConfig(
+        latency_ms=args.latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        prompt_tokens_per_second=args.prompt_tokens_per_second,
+        days=args.days,
+        files_per_day=args.files_per_day,
+        file_size=args.file_size,
+        error_rate=args.error_rate,
+        invalid_file_rate=args.invalid_file_rate,
+        max_output_tokens=args.max_output_tokens,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible stub LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    server = StubLLMServer(config_from_args(args), host=args.host, port=args.port)
+    print(f"Stub LLM server listening on {server.base_url}")
+    print(f"Use: OPENAI_BASE_URL={server.base_url} OPENAI_API_KEY=stub AI_PROVIDER=openai")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -42,6 +42,7 @@ def check_env_file():
     google_key = os.getenv("GOOGLE_API_KEY")
     gemini_key = os.getenv("GEMINI_API_KEY")
     groq_key = os.getenv("GROQ_API_KEY")
+    compatible_url = os.getenv("OPENAI_COMPATIBLE_BASE_URL")
     
     print("Checking API Keys:")
     print("-" * 60)
@@ -75,12 +76,16 @@ def check_env_file():
         print(f"  Length: {len(groq_key)} characters")
     else:
         print("[ERROR] GROQ_API_KEY: Not found")
+
+    # Check self-hosted OpenAI-compatible endpoints (no key needed)
+    if compatible_url:
+        print(f"[OK] OPENAI_COMPATIBLE_BASE_URL: {compatible_url}")
     
     print("-" * 60)
     print()
     
     # Check if at least one key is present
-    has_key = bool(openai_key or google_key or gemini_key or groq_key)
+    has_key = bool(openai_key or google_key or gemini_key or groq_key or compatible_url)
     
     if has_key:
         print("[OK] At least one API key is configured")
@@ -96,6 +101,8 @@ def check_env_file():
                 print("  Will use: Google Gemini (default)")
             elif groq_key:
                 print("  Will use: Groq (default)")
+            elif compatible_url:
+                print("  Set AI_PROVIDER=openai_compatible to use the self-hosted endpoints")
 
         # Check model settings
         if openai_key:
@@ -109,6 +116,10 @@ def check_env_file():
         if groq_key:
             groq_model = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
             print(f"  Groq Model: {groq_model}")
+
+        if compatible_url:
+            compatible_model = os.getenv("OPENAI_COMPATIBLE_MODEL", "(not set)")
+            print(f"  OpenAI-compatible Model: {compatible_model}")
         
         print()
         print("=" * 60)
@@ -127,10 +138,12 @@ def check_env_file():
         print("GEMINI_API_KEY=your-gemini-api-key-here")
         print("# OR")
         print("GROQ_API_KEY=your-groq-api-key-here")
+        print("# OR (self-hosted llama.cpp / vLLM / Ollama)")
+        print("OPENAI_COMPATIBLE_BASE_URL=http://localhost:8000/v1")
         print("-" * 60)
         print()
         print("Optional settings:")
-        print("AI_PROVIDER=openai  # or 'gemini' or 'groq'")
+        print("AI_PROVIDER=openai  # or 'gemini', 'groq' or 'openai_compatible'")
         print("OPENAI_MODEL=gpt-4  # or 'gpt-3.5-turbo'")
         print("GEMINI_MODEL=gemini-1.5-pro  # or 'gemini-pro'")
         print("GROQ_MODEL=llama-3.1-8b-instant  # or other Groq models")
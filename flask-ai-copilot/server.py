@@ -0,0 +1,8 @@
+"""
+Server Entry Point
+Starts the Flask app; imports nothing at module level because offload worker processes re-import it
+"""
+
+if __name__ == "__main__":
+    from app import main
+    main()
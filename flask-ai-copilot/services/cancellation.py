@@ -0,0 +1,328 @@
+"""
+Cancellation Service
+Cancellation tokens, per-stage timeouts and client-disconnect detection
+"""
+
+import os
+import time
+import errno
+import socket
+import select
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from services.metrics import metrics
+from services.tracing import tracer
+from services.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+# Per-stage timeouts in seconds (0 disables the timeout)
+STAGE_TIMEOUTS = {
+    "provider_call": float(os.getenv("TIMEOUT_PROVIDER_CALL_S", "300")),
+    "build_module": float(os.getenv("TIMEOUT_BUILD_MODULE_S", "60")),
+    "create_zip": float(os.getenv("TIMEOUT_CREATE_ZIP_S", "60"))
+}
+# How often waiting stages and the disconnect watcher check for cancellation
+CANCEL_POLL_INTERVAL_S = float(os.getenv("CANCEL_POLL_INTERVAL_S", "0.2"))
+# Abort generation when the client disconnects
+CANCEL_ON_DISCONNECT = os.getenv("CANCEL_ON_DISCONNECT", "true").lower() == "true"
+
+_current_token = contextvars.ContextVar("cancellation_token", default=None)
+
+
+class GenerationCancelled(Exception):
+    """Raised inside a request whose generation was cancelled"""
+
+    def __init__(self, reason, stage=None):
+        self.reason = reason
+        self.stage = stage
+        super().__init__(f"Generation {reason}" + (f" during {stage}" if stage else ""))
+
+
+class StageTimeout(GenerationCancelled):
+    """Raised when a stage runs past its configured timeout"""
+
+    def __init__(self, stage, timeout):
+        self.timeout = timeout
+        super().__init__("timed_out", stage)
+        self.args = (f"Stage {stage} exceeded its {timeout:g}s timeout",)
+
+
+class DeadlineExceeded(StageTimeout):
+    """Raised when a stage would run past the request's deadline"""
+
+    def __init__(self, stage, timeout):
+        super().__init__(stage, timeout)
+        self.reason = "deadline_exceeded"
+        self.args = (f"Request deadline reached during {stage}",)
+
+
+class CancellationToken:
+    """Cancellation flag and optional deadline shared by one request and its stages"""
+
+    def __init__(self, request_id=None, deadline_s=None):
+        self.request_id = request_id
+        self.started_at = time.monotonic()
+        self.deadline_s = deadline_s
+        self.deadline = self.started_at + deadline_s if deadline_s else None
+        self.reason = None
+        self.stage = None
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason="cancelled"):
+        """Request cancellation; the first reason wins"""
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+            logger.info("Generation cancelled", extra={"request_id": self.request_id, "reason": reason})
+
+    def check(self, stage=None):
+        """Record the current stage and raise GenerationCancelled if cancelled"""
+        if stage is not None:
+            self.stage = stage
+        if self._event.is_set():
+            raise GenerationCancelled(self.reason, self.stage)
+
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    def remaining(self):
+        """Seconds left before the deadline, or None without a deadline"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+
+def current_token():
+    """Cancellation token of the current request, or None"""
+    return _current_token.get()
+
+
+def remaining_time():
+    """Seconds left before the current request's deadline, or None"""
+    token = _current_token.get()
+    return token.remaining() if token is not None else None
+
+
+def check_cancelled(stage=None):
+    """Raise GenerationCancelled if the current request was cancelled"""
+    token = _current_token.get()
+    if token is not None:
+        token.check(stage)
+
+
+@contextmanager
+def cancellation_scope(token):
+    """Make token the current request's cancellation token"""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def run_stage(stage, func, *args, timeout=None, on_abandoned=None, **kwargs):
+    """
+    Run one pipeline stage, giving up on cancellation or timeout
+
+    The stage runs on a helper thread (with the caller's context, so spans,
+    log fields, the token and a request profile carry over) while the
+    request thread waits; without a token or timeout it runs inline.
+    When the stage is given up on, its token is cancelled: stages that call
+    check_cancelled() (the provider call does between streamed chunks) stop
+    at the next check. A stage that still finishes has its result passed to
+    on_abandoned so the wasted work can be accounted for.
+
+    Args:
+        stage: Stage name (also the STAGE_TIMEOUTS key)
+        func: Callable to run
+        timeout: Seconds before StageTimeout (defaults to STAGE_TIMEOUTS[stage])
+        on_abandoned: Called with the result if the stage finishes after being given up on
+
+    Raises:
+        GenerationCancelled: if the request is cancelled while the stage runs
+        StageTimeout: if the stage exceeds its timeout
+        DeadlineExceeded: if the request's deadline passes first
+    """
+    token = _current_token.get()
+    timeout = STAGE_TIMEOUTS.get(stage, 0) if timeout is None else timeout
+    if token is not None:
+        token.check(stage)
+
+    # The request deadline caps every stage timeout
+    deadline_bound = False
+    remaining = token.remaining() if token is not None else None
+    if remaining is not None and (not timeout or remaining < timeout):
+        if remaining <= 0:
+            _record_cancellation("deadline_exceeded", stage, token)
+            raise DeadlineExceeded(stage, 0)
+        timeout = remaining
+        deadline_bound = True
+
+    if token is None and not timeout:
+        return func(*args, **kwargs)
+
+    future = Future()
+    abandoned = threading.Event()
+    context = contextvars.copy_context()
+    if token is None:
+        # A token of its own lets the stage see its timeout
+        token = CancellationToken()
+        context.run(_current_token.set, token)
+        owned_token = True
+    else:
+        owned_token = False
+
+    def target():
+        try:
+            result = context.run(tracer.profiled, func, *args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            if abandoned.is_set():
+                metrics.increment("abandoned_stage_errors_total", stage=stage)
+            return
+        future.set_result(result)
+        if abandoned.is_set():
+            metrics.increment("abandoned_stages_completed_total", stage=stage)
+            if on_abandoned is not None:
+                try:
+                    on_abandoned(result)
+                except Exception as e:
+                    logger.warning("Abandoned stage callback failed", extra={"stage": stage, "error": str(e)})
+
+    threading.Thread(target=target, name=f"stage-{stage}", daemon=True).start()
+
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        wait = CANCEL_POLL_INTERVAL_S
+        if deadline is not None:
+            wait = min(wait, max(0.0, deadline - time.monotonic()))
+        try:
+            return future.result(timeout=wait)
+        except FutureTimeout:
+            pass
+        except GenerationCancelled:
+            # The stage saw the cancellation before this thread did
+            _record_cancellation(token.reason, stage, token)
+            raise
+
+        if token.cancelled:
+            abandoned.set()
+            _record_cancellation(token.reason, stage, token)
+            raise GenerationCancelled(token.reason, stage)
+        if deadline is not None and time.monotonic() >= deadline:
+            abandoned.set()
+            reason = "deadline_exceeded" if deadline_bound else "timed_out"
+            token.cancel(reason)
+            _record_cancellation(reason, stage, None if owned_token else token)
+            if deadline_bound:
+                raise DeadlineExceeded(stage, timeout)
+            raise StageTimeout(stage, timeout)
+
+
+def _record_cancellation(reason, stage, token):
+    metrics.increment("cancellations_total", reason=reason, stage=stage)
+    if token is not None:
+        metrics.increment("wasted_seconds_total", round(token.elapsed(), 3), stage=stage)
+
+
+def record_wasted_tokens(usage, stage="provider_call"):
+    """Count tokens spent on a call whose result was thrown away"""
+    metrics.increment("wasted_tokens_total", usage.get("total_tokens", 0), stage=stage)
+
+
+def _peer_closed(sock):
+    """True if the client has closed its end of the connection"""
+    try:
+        readable, _, errored = select.select([sock], [], [sock], 0)
+        if errored:
+            return True
+        if not readable:
+            return False
+        # Readable with no data means EOF; readable with data is a pipelined request
+        return sock.recv(1, socket.MSG_PEEK) == b""
+    except (OSError, ValueError) as e:
+        if isinstance(e, OSError) and e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+            return False
+        return True
+
+
+class ActiveRequests:
+    """
+    In-flight generations by request id
+
+    Supports explicit cancellation (POST /requests/<id>/cancel) and, when the
+    WSGI server exposes the client socket, cancels requests whose client
+    disconnected. A single watcher thread polls all registered sockets.
+    """
+
+    def __init__(self, poll_interval=CANCEL_POLL_INTERVAL_S, cancel_on_disconnect=CANCEL_ON_DISCONNECT):
+        self.poll_interval = poll_interval
+        self.cancel_on_disconnect = cancel_on_disconnect
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._watcher = None
+
+    def register(self, token, sock=None):
+        """Track a request; sock is the client connection to watch, if known"""
+        with self._lock:
+            self._requests[token.request_id] = (token, sock)
+            if sock is not None and self.cancel_on_disconnect and self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch, name="disconnect-watcher", daemon=True)
+                self._watcher.start()
+
+    def unregister(self, token):
+        with self._lock:
+            entry = self._requests.get(token.request_id)
+            if entry is not None and entry[0] is token:
+                del self._requests[token.request_id]
+
+    def cancel(self, request_id, reason="cancelled"):
+        """
+        Cancel an in-flight request
+
+        Returns:
+            bool: False if no such request is running
+        """
+        with self._lock:
+            entry = self._requests.get(request_id)
+        if entry is None:
+            return False
+        entry[0].cancel(reason)
+        return True
+
+    def list(self):
+        with self._lock:
+            entries = list(self._requests.values())
+        return [
+            {
+                "request_id": token.request_id,
+                "stage": token.stage,
+                "elapsed_s": round(token.elapsed(), 3),
+                "cancelled": token.cancelled
+            }
+            for token, _ in entries
+        ]
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                watched = [(token, sock) for token, sock in self._requests.values()
+                           if sock is not None and not token.cancelled]
+            for token, sock in watched:
+                if _peer_closed(sock):
+                    metrics.increment("client_disconnects_total")
+                    token.cancel("client_disconnected")
+
+
+# Shared registry of in-flight generations
+active_requests = ActiveRequests()
@@ -0,0 +1,147 @@
+"""
+Deadline Planning Service
+Estimates generation time per model and plans degradations that fit a deadline
+"""
+
+import os
+import threading
+
+from services.tokens import TOKENS_PER_DAY, BASE_OUTPUT_TOKENS, DEFAULT_DAYS, LEVEL_MULTIPLIERS
+
+
+# Assumed output speed and fixed per-call latency until real calls are observed
+EXPECTED_TOKENS_PER_SECOND = float(os.getenv("EXPECTED_TOKENS_PER_SECOND", "40"))
+EXPECTED_CALL_OVERHEAD_S = float(os.getenv("EXPECTED_CALL_OVERHEAD_S", "2"))
+# Time kept back for writing files and zipping
+DEADLINE_RESERVE_S = float(os.getenv("DEADLINE_RESERVE_S", "2"))
+# Model to switch to when the deadline is short (defaults to the fastest observed cascade model)
+DEADLINE_FAST_MODEL = os.getenv("DEADLINE_FAST_MODEL", "").strip()
+# Files per day in a full module (lesson, slides, exercises, video script, micro-learning)
+FULL_DAY_FILES = int(os.getenv("FULL_DAY_FILES", "5"))
+
+# Weight of the newest observation in the moving averages
+_EWMA_ALPHA = 0.3
+
+
+class LatencyEstimator:
+    """Per-model moving average of output speed, fed by completed provider calls"""
+
+    def __init__(self, tokens_per_second=EXPECTED_TOKENS_PER_SECOND, overhead_s=EXPECTED_CALL_OVERHEAD_S):
+        self.default_tps = tokens_per_second
+        self.overhead_s = overhead_s
+        self._lock = threading.Lock()
+        self._tps = {}
+
+    def observe(self, model, duration_s, completion_tokens):
+        """Record one completed call"""
+        if completion_tokens <= 0 or duration_s <= 0:
+            return
+        tps = completion_tokens / max(duration_s - self.overhead_s, duration_s * 0.5)
+        with self._lock:
+            previous = self._tps.get(model)
+            self._tps[model] = tps if previous is None else previous + _EWMA_ALPHA * (tps - previous)
+
+    def tokens_per_second(self, model):
+        with self._lock:
+            return self._tps.get(model, self.default_tps)
+
+    def estimate(self, model, output_tokens):
+        """Expected seconds for a call producing output_tokens"""
+        return self.overhead_s + output_tokens / self.tokens_per_second(model)
+
+    def fastest(self, models):
+        return max(models, key=self.tokens_per_second)
+
+    def snapshot(self):
+        with self._lock:
+            return {model: round(tps, 2) for model, tps in self._tps.items()}
+
+
+def expected_output_tokens(days, level, files_per_day=FULL_DAY_FILES, module_files=True):
+    """Expected completion size of a module with `days` days to generate"""
+    multiplier = LEVEL_MULTIPLIERS.get(level or "intermediate", 1.2)
+    per_day = TOKENS_PER_DAY * files_per_day / FULL_DAY_FILES
+    base = BASE_OUTPUT_TOKENS if module_files else 0
+    return int((base + per_day * days) * multiplier)
+
+
+def plan_generation(remaining_s, cascade, days, level, reused_days=(), required_day_files=(),
+                    estimator=None, fast_model=DEADLINE_FAST_MODEL, reserve_s=DEADLINE_RESERVE_S):
+    """
+    Pick the least degraded way to generate a module within the time left
+
+    Degradations are tried in order, each on top of the previous one:
+    faster_model / no_escalation (a single attempt on the fastest model),
+    reduced_files (only the required files per day), partial_days (only the
+    first days that fit).
+
+    Args:
+        remaining_s: Seconds until the deadline (None = no deadline)
+        cascade: Models that would normally be tried, in order
+        days: Requested days (None if the prompt did not say)
+        level: Requested level
+        reused_days: Days already available from the fragment cache
+        required_day_files: Files that must exist for every day
+
+    Returns:
+        dict: {"models", "days", "day_files", "degradations", "estimated_s"}
+              where days/day_files are None when not reduced
+    """
+    estimator = estimator or latency_estimator
+    plan = {"models": list(cascade), "days": None, "day_files": None, "degradations": [], "estimated_s": None}
+    total_days = days or DEFAULT_DAYS
+    missing = [day for day in range(1, total_days + 1) if day not in set(reused_days)]
+
+    def estimate(model, day_count, files_per_day=FULL_DAY_FILES):
+        return estimator.estimate(model, expected_output_tokens(day_count, level, files_per_day))
+
+    final_model = cascade[-1]
+    plan["estimated_s"] = round(estimate(final_model, len(missing)), 2)
+    if remaining_s is None:
+        return plan
+
+    budget = remaining_s - reserve_s
+    if plan["estimated_s"] <= budget:
+        return plan
+
+    # 1. One attempt on the fastest model
+    candidates = list(dict.fromkeys(cascade + ([fast_model] if fast_model else [])))
+    model = fast_model or estimator.fastest(candidates)
+    plan["models"] = [model]
+    if model != final_model:
+        plan["degradations"].append("faster_model")
+    elif len(cascade) > 1:
+        plan["degradations"].append("no_escalation")
+    plan["estimated_s"] = round(estimate(model, len(missing)), 2)
+    if plan["estimated_s"] <= budget:
+        return plan
+
+    # 2. Only the required files per day
+    files_per_day = len(required_day_files) or FULL_DAY_FILES
+    if files_per_day < FULL_DAY_FILES:
+        plan["day_files"] = list(required_day_files)
+        plan["degradations"].append("reduced_files")
+        plan["estimated_s"] = round(estimate(model, len(missing), files_per_day), 2)
+        if plan["estimated_s"] <= budget:
+            return plan
+
+    # 3. The first days that fit (at least one, so the caller gets something back)
+    fitting = 1
+    for count in range(len(missing), 0, -1):
+        if estimate(model, count, files_per_day) <= budget:
+            fitting = count
+            break
+    if fitting < len(missing):
+        # Deliver a contiguous Day1..DayN prefix of generated and cached days
+        keep = set(missing[:fitting]) | set(reused_days)
+        last_day = 0
+        while last_day + 1 in keep:
+            last_day += 1
+        plan["days"] = last_day
+        plan["degradations"].append("partial_days")
+        plan["estimated_s"] = round(estimate(model, fitting, files_per_day), 2)
+    return plan
+
+
+# Shared estimator fed by every provider call in this process
+latency_estimator = LatencyEstimator()
@@ -0,0 +1,233 @@
+"""
+Endpoint Pool Service
+Least-in-flight load balancing and failover across OpenAI-compatible inference endpoints
+"""
+
+import os
+import re
+import time
+import threading
+from types import SimpleNamespace
+
+from openai import OpenAI, APIConnectionError, APIStatusError
+
+from services.metrics import metrics
+from services.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+# Consecutive failures before an endpoint is taken out of rotation
+POOL_FAILURE_THRESHOLD = int(os.getenv("POOL_FAILURE_THRESHOLD", "3"))
+# Seconds an endpoint stays out of rotation before it gets traffic again
+POOL_COOLDOWN_S = float(os.getenv("POOL_COOLDOWN_S", "30"))
+
+
+def parse_base_urls(value):
+    """Base URLs from a comma- or whitespace-separated list"""
+    return [url.rstrip("/") for url in re.split(r"[,\s]+", value or "") if url.strip()]
+
+
+def _endpoint_failure(error):
+    """
+    True if an error says the endpoint is unavailable (connection failure,
+    timeout, overload or server error) rather than that the request was bad
+    """
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+class Endpoint:
+    """One inference server in a pool"""
+
+    def __init__(self, base_url, client):
+        self.base_url = base_url
+        self.client = client
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+
+    def to_dict(self, now):
+        return {
+            "base_url": self.base_url,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "healthy": self.down_until <= now
+        }
+
+
+class PooledStream:
+    """
+    Streamed response from a pool endpoint; the endpoint counts as busy
+    until the stream has been read to the end or closed
+    """
+
+    def __init__(self, stream, on_done):
+        self.stream = stream
+        self._on_done = on_done
+
+    def __iter__(self):
+        try:
+            yield from self.stream
+        finally:
+            self.close()
+
+    def close(self):
+        on_done, self._on_done = self._on_done, None
+        if on_done is None:
+            return
+        try:
+            close = getattr(self.stream, "close", None)
+            if close:
+                close()
+        finally:
+            on_done()
+
+
+class EndpointPool:
+    """
+    OpenAI-compatible client spread over several inference servers
+
+    Each call goes to the healthy endpoint with the fewest calls in flight
+    (ties go to the endpoint that has served the fewest requests). A call
+    that fails because the endpoint is unavailable is retried on the next
+    endpoint; an endpoint that fails POOL_FAILURE_THRESHOLD times in a row
+    is skipped for POOL_COOLDOWN_S. If every endpoint is cooling down, they
+    are tried anyway rather than failing the call outright.
+
+    Exposes chat.completions.create like openai.OpenAI, so the generator
+    uses a pool exactly as it uses a single client.
+    """
+
+    def __init__(self, base_urls, api_key, failure_threshold=POOL_FAILURE_THRESHOLD,
+                 cooldown_s=POOL_COOLDOWN_S, client_factory=None):
+        if not base_urls:
+            raise ValueError("EndpointPool needs at least one base URL")
+        if client_factory is None:
+            # With several endpoints, failing over beats retrying the same one
+            max_retries = 2 if len(base_urls) == 1 else 0
+            client_factory = lambda url: OpenAI(base_url=url, api_key=api_key, max_retries=max_retries)
+        self.endpoints = [Endpoint(url, client_factory(url)) for url in base_urls]
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _acquire(self, tried):
+        """Pick the least loaded endpoint not tried yet for this call, or None"""
+        with self._lock:
+            now = time.monotonic()
+            untried = [endpoint for endpoint in self.endpoints if endpoint not in tried]
+            healthy = [endpoint for endpoint in untried if endpoint.down_until <= now]
+            candidates = healthy or untried
+            if not candidates:
+                return None
+            endpoint = min(candidates, key=lambda e: (e.in_flight, e.requests))
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _release(self, endpoint, failed):
+        with self._lock:
+            endpoint.in_flight -= 1
+            if not failed:
+                endpoint.consecutive_failures = 0
+                return
+            endpoint.errors += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.failure_threshold:
+                endpoint.down_until = time.monotonic() + self.cooldown_s
+                logger.warning("Endpoint taken out of rotation", extra={
+                    "base_url": endpoint.base_url, "cooldown_s": self.cooldown_s
+                })
+
+    def create(self, **kwargs):
+        """
+        chat.completions.create on the least loaded endpoint, failing over on unavailability
+
+        Raises:
+            Exception: the request's own error (e.g. 400) at once, or the
+                last endpoint's error once every endpoint has failed
+        """
+        tried = set()
+        last_error = None
+        while True:
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                raise last_error
+            tried.add(endpoint)
+            start = time.perf_counter()
+            try:
+                response = endpoint.client.chat.completions.create(**kwargs)
+            except Exception as e:
+                unavailable = _endpoint_failure(e)
+                self._release(endpoint, failed=unavailable)
+                if not unavailable:
+                    raise
+                metrics.increment("endpoint_failovers_total", endpoint=endpoint.base_url)
+                logger.warning("Endpoint call failed, trying the next endpoint", extra={
+                    "base_url": endpoint.base_url, "error": str(e)[:200]
+                })
+                last_error = e
+                continue
+            if kwargs.get("stream"):
+                # A streamed response keeps the endpoint busy until it has been read
+                return PooledStream(response, lambda endpoint=endpoint: self._finish(endpoint, start))
+            self._finish(endpoint, start)
+            return response
+
+    def _finish(self, endpoint, start):
+        self._release(endpoint, failed=False)
+        metrics.increment("endpoint_calls_total", endpoint=endpoint.base_url)
+        metrics.observe("endpoint_call_ms", (time.perf_counter() - start) * 1000, endpoint=endpoint.base_url)
+
+    def probe(self, **kwargs):
+        """
+        Send the same small call to every endpoint (warm-up and health probes)
+
+        Calls bypass load balancing so each endpoint's connection is opened
+        and its health known. A failing endpoint counts towards its cooldown
+        like a failed call; one that answers is put back into rotation.
+
+        Returns:
+            list: {"base_url", "status", "latency_ms"} per endpoint (plus "error")
+        """
+        results = []
+        for endpoint in self.endpoints:
+            start = time.perf_counter()
+            error = None
+            try:
+                endpoint.client.chat.completions.create(**kwargs)
+            except Exception as e:
+                error = e
+            result = {
+                "base_url": endpoint.base_url,
+                "status": "error" if error else "success",
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1)
+            }
+            with self._lock:
+                if error is None:
+                    endpoint.consecutive_failures = 0
+                    endpoint.down_until = 0.0
+                elif _endpoint_failure(error):
+                    endpoint.consecutive_failures += 1
+                    if endpoint.consecutive_failures >= self.failure_threshold:
+                        endpoint.down_until = time.monotonic() + self.cooldown_s
+            if error is not None:
+                result["error"] = str(error)[:200]
+            results.append(result)
+        return results
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "endpoints": [endpoint.to_dict(now) for endpoint in self.endpoints],
+                "in_flight": sum(endpoint.in_flight for endpoint in self.endpoints)
+            }
@@ -4,7 +4,194 @@ Handles creation of module files and directories
 """
 
 import os
+import json
+import uuid
+import shutil
+import zipfile
+import tempfile
 from pathlib import Path
+from collections.abc import MutableMapping
+from services.tracing import tracer
+from services.file_tree import FileTree, build_tree
+from services.offload import offload_pool
+from services.cancellation import check_cancelled
+from services.structured_logging import get_logger
+from services.versions import ModuleVersions
+
+logger = get_logger(__name__)
+
+# Scratch directory (inside the output directory, so moving files out of it is a rename)
+STAGING_DIR = ".staging"
+
+
+def safe_relative_path(filepath):
+    """
+    Normalized relative path of a generated file, or None if it would
+    escape the module directory
+    """
+    # Remove leading slashes and normalize
+    safe_filepath = os.path.normpath(filepath.lstrip("/\\"))
+    # Prevent path traversal
+    if ".." in safe_filepath or safe_filepath.startswith("/"):
+        return None
+    return safe_filepath
+
+
+class SpooledFiles(MutableMapping):
+    """
+    {filepath: content} mapping kept on disk instead of in memory
+
+    Each file is written under directory as soon as it is set; only paths
+    and sizes stay in memory and reading a file loads just that file.
+    Non-string content (which cannot be written) is kept as is. Files are
+    keyed by their normalized path, so "Day1/a.md", "./Day1/a.md" and
+    "Day1//a.md" are one file and the last one set wins. With an
+    archive_path, every written file is also appended to a ZIP, so the
+    module is zipped while it arrives; replacing or deleting a file that is
+    already in the archive makes the archive stale.
+    """
+
+    def __init__(self, directory, archive_path=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.archive_path = archive_path
+        self.archive_stale = False
+        # {filepath: (relative path on disk, size in bytes)}, in arrival order
+        self._entries = {}
+        self._invalid = {}
+        self._archived = set()
+        self._archive = zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) if archive_path else None
+        self._closed = False
+
+    def _key(self, filepath):
+        """Normalized path a file is stored under (unsafe paths are kept as given)"""
+        relative_path = safe_relative_path(filepath)
+        return Path(relative_path).as_posix() if relative_path is not None else filepath
+
+    def __getitem__(self, filepath):
+        filepath = self._key(filepath)
+        if filepath in self._invalid:
+            return self._invalid[filepath]
+        relative_path, _ = self._entries[filepath]
+        with open(os.path.join(self.directory, relative_path), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def __setitem__(self, filepath, content):
+        if self._closed:
+            raise ValueError("Spooled files are closed")
+        key = self._key(filepath)
+        if key != filepath and (key in self._entries or key in self._invalid):
+            logger.warning("Duplicate file path, keeping the last one", extra={"filepath": filepath, "path": key})
+        filepath = key
+        if filepath in self._archived:
+            self.archive_stale = True
+        if filepath in self._entries:
+            self._remove(filepath)
+        if not isinstance(content, str):
+            self._invalid[filepath] = content
+            return
+        self._invalid.pop(filepath, None)
+        relative_path = safe_relative_path(filepath)
+        if relative_path is None:
+            logger.warning("Skipping unsafe file path", extra={"filepath": filepath})
+            return
+        full_path = os.path.join(self.directory, relative_path)
+        parent_dir = os.path.dirname(full_path)
+        if parent_dir:
+            os.makedirs(parent_dir, exist_ok=True)
+        data = content.encode("utf-8")
+        with open(full_path, "wb") as f:
+            f.write(data)
+        self._entries[filepath] = (relative_path, len(data))
+        if self._archive is not None and not self.archive_stale:
+            self._archive.writestr(Path(relative_path).as_posix(), data)
+            self._archived.add(filepath)
+
+    def __delitem__(self, filepath):
+        filepath = self._key(filepath)
+        if filepath in self._invalid:
+            del self._invalid[filepath]
+            return
+        if filepath not in self._entries:
+            raise KeyError(filepath)
+        if filepath in self._archived:
+            self.archive_stale = True
+        self._remove(filepath)
+
+    def _remove(self, filepath):
+        relative_path, _ = self._entries.pop(filepath)
+        try:
+            os.remove(os.path.join(self.directory, relative_path))
+        except OSError:
+            pass
+
+    def __iter__(self):
+        return iter(list(self._entries) + [path for path in self._invalid if path not in self._entries])
+
+    def __len__(self):
+        return len(self._entries) + len(self._invalid)
+
+    def written(self):
+        """[(filepath, relative path on disk, size in bytes)] of the files written to disk"""
+        return [(filepath, relative_path, size) for filepath, (relative_path, size) in self._entries.items()]
+
+    def finish_archive(self, extra_entries, zip_path):
+        """
+        Complete the streamed archive and move it to zip_path
+
+        Args:
+            extra_entries: [(file path, archive name)] to append (e.g. FILE_TREE.md)
+
+        Returns:
+            bool: False if there is no usable archive (none was requested, or it is stale)
+        """
+        archive, self._archive = self._archive, None
+        if archive is None:
+            return False
+        if self.archive_stale:
+            archive.close()
+            return False
+        for file_path, arcname in extra_entries:
+            archive.write(file_path, arcname)
+        archive.close()
+        os.replace(self.archive_path, zip_path)
+        return True
+
+    def close(self):
+        """Stop accepting files (a provider call abandoned after a timeout stops at its next file)"""
+        self._closed = True
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+
+class ModuleStaging:
+    """
+    Scratch space of one streamed generation (output/.staging/<id>/)
+
+    Every provider call gets its own SpooledFiles; the accepted module's
+    files are moved into a version by FileBuilder.adopt_files and
+    cleanup() removes the rest.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._spools = []
+
+    def new_files(self, archive=True):
+        """SpooledFiles for one provider call (archive: also zip the files as they arrive)"""
+        name = f"call{len(self._spools) + 1}"
+        spool = SpooledFiles(
+            os.path.join(self.root, name),
+            archive_path=os.path.join(self.root, f"{name}.zip") if archive else None
+        )
+        self._spools.append(spool)
+        return spool
+
+    def cleanup(self):
+        for spool in self._spools:
+            spool.close()
+        shutil.rmtree(self.root, ignore_errors=True)
 
 
 class FileBuilder:
@@ -15,23 +202,40 @@ class FileBuilder:
         project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.output_dir = os.path.join(project_root, output_dir)
         os.makedirs(self.output_dir, exist_ok=True)
+        self.versions = ModuleVersions(self.output_dir)
+    
+    def module_path(self, module_name, version=None):
+        """
+        Directory holding one version of a module
+        
+        Args:
+            version: Version number; None for the latest published version
+        
+        Returns:
+            str or None: Directory path, None if the module has no such version
+        """
+        if version is None:
+            version = self.versions.latest(module_name)
+            if version is None:
+                return None
+        return self.versions.version_dir(module_name, version)
+    
+    def list_modules(self):
+        """Directory names of all modules with a published version"""
+        return self.versions.modules()
+    
+    def allocate_version(self, module_name):
+        """Reserve a new version to build into; returns the version number"""
+        version, _ = self.versions.allocate(module_name)
+        return version
+    
+    def publish_version(self, module_name, version):
+        """Make a fully built version visible (and latest, unless a newer one exists)"""
+        return self.versions.publish(module_name, version)
     
-    def _sanitize_module_name(self, module_name):
-        """Sanitize module name for filesystem safety"""
-        # Remove invalid characters
-        invalid_chars = '<>:"/\\|?*'
-        sanitized = module_name
-        for char in invalid_chars:
-            sanitized = sanitized.replace(char, "_")
-        
-        # Remove leading/trailing spaces and dots
-        sanitized = sanitized.strip(". ")
-        
-        # Ensure it's not empty
-        if not sanitized:
-            sanitized = "module"
-        
-        return sanitized
+    def discard_version(self, module_name, version):
+        """Delete a version that will not be published"""
+        self.versions.discard(module_name, version)
     
     def _ensure_directory(self, file_path):
         """Ensure parent directory exists"""
@@ -39,105 +243,229 @@ class FileBuilder:
         if parent_dir:
             os.makedirs(parent_dir, exist_ok=True)
     
-    def build_module(self, module_name, files):
+    def build_module(self, module_name, files, version=None):
         """
         Build module file structure
         
         Args:
             module_name: Name of the module
             files: Dictionary of {filepath: content}
+            version: Version from allocate_version(), published by the caller
+                     once complete; None allocates and publishes a new version
         
         Returns:
             list: File tree structure
         """
-        # Sanitize module name
-        safe_module_name = self._sanitize_module_name(module_name)
-        module_path = os.path.join(self.output_dir, safe_module_name)
-        
-        # Create module directory
+        publish = version is None
+        if publish:
+            version = self.allocate_version(module_name)
+        module_path = self.versions.version_dir(module_name, version)
         os.makedirs(module_path, exist_ok=True)
         
         file_tree = []
         
-        # Write each file
-        for filepath, content in files.items():
-            try:
-                # Sanitize file path to prevent directory traversal
-                # Remove leading slashes and normalize
-                safe_filepath = filepath.lstrip("/\\")
-                safe_filepath = os.path.normpath(safe_filepath)
+        with tracer.span("write_files", file_count=len(files)):
+            # Write each file
+            for filepath, content in files.items():
+                # Stop writing as soon as the request is cancelled
+                check_cancelled("write_files")
+                try:
+                    # Sanitize file path to prevent directory traversal
+                    safe_filepath = safe_relative_path(filepath)
+                    if safe_filepath is None:
+                        logger.warning("Skipping unsafe file path", extra={"filepath": filepath})
+                        continue
                 
-                # Prevent path traversal
-                if ".." in safe_filepath or safe_filepath.startswith("/"):
-                    print(f"Warning: Skipping unsafe file path: {filepath}")
-                    continue
+                    # Build full path
+                    full_path = os.path.join(module_path, safe_filepath)
                 
-                # Build full path
-                full_path = os.path.join(module_path, safe_filepath)
+                    # Ensure directory exists
+                    self._ensure_directory(full_path)
                 
-                # Ensure directory exists
-                self._ensure_directory(full_path)
+                    # Write file with UTF-8 encoding
+                    with open(full_path, "w", encoding="utf-8") as f:
+                        f.write(content)
                 
-                # Write file with UTF-8 encoding
-                with open(full_path, "w", encoding="utf-8") as f:
-                    f.write(content)
+                    # Track in file tree (size from disk rather than an encoded copy)
+                    file_tree.append({
+                        "path": filepath,
+                        "full_path": full_path,
+                        "size": os.path.getsize(full_path)
+                    })
                 
-                # Track in file tree
+                except Exception as e:
+                    logger.error("Error writing file", extra={"filepath": filepath, "error": str(e)})
+                    # Continue with other files even if one fails
+        
+        file_tree.append(self._write_file_tree(module_name, version, module_path, file_tree))
+        
+        if publish:
+            self.publish_version(module_name, version)
+        return file_tree
+    
+    def _write_file_tree(self, module_name, version, module_path, file_tree):
+        """
+        Write FILE_TREE.md and the cached tree metadata of a version
+        
+        Returns:
+            dict: File tree entry of FILE_TREE.md
+        """
+        # Build the nested tree once; FILE_TREE.md and the API both use it
+        with tracer.span("write_file_tree"):
+            entries = [{"path": entry["path"], "size": entry["size"]} for entry in file_tree]
+            tree, tree_md = offload_pool.run(
+                build_tree, entries, size=sum(len(entry["path"]) for entry in entries), stage="file_tree"
+            )
+            tree_path = os.path.join(module_path, "FILE_TREE.md")
+            with open(tree_path, "w", encoding="utf-8") as f:
+                f.write(tree_md)
+            self.write_module_metadata(module_name, "tree", tree, version=version)
+        
+        return {
+            "path": "FILE_TREE.md",
+            "full_path": tree_path,
+            "size": os.path.getsize(tree_path)
+        }
+    
+    def stage(self):
+        """Scratch space for a generation whose files are streamed to disk (see ModuleStaging)"""
+        return ModuleStaging(os.path.join(self.output_dir, STAGING_DIR, uuid.uuid4().hex))
+    
+    def adopt_files(self, module_name, files, version):
+        """
+        Move files streamed to disk into an allocated version
+        
+        Nothing is read back or copied: the files are renamed into the
+        version directory, and the archive built while they arrived becomes
+        the version's ZIP unless a file changed after it was zipped.
+        
+        Args:
+            files: SpooledFiles of the accepted module
+            version: Version from allocate_version(), published by the caller
+        
+        Returns:
+            tuple: (file tree list like build_module's, True if the version's ZIP was written)
+        """
+        module_path = self.versions.version_dir(module_name, version)
+        os.makedirs(module_path, exist_ok=True)
+        
+        with tracer.span("move_files", file_count=len(files)):
+            check_cancelled("write_files")
+            for name in os.listdir(files.directory):
+                os.replace(os.path.join(files.directory, name), os.path.join(module_path, name))
+            file_tree = [
+                {"path": filepath, "full_path": os.path.join(module_path, relative_path), "size": size}
+                for filepath, relative_path, size in files.written()
+            ]
+        
+        tree_entry = self._write_file_tree(module_name, version, module_path, file_tree)
+        file_tree.append(tree_entry)
+        zipped = files.finish_archive(
+            [(tree_entry["full_path"], "FILE_TREE.md")], self.versions.zip_path(module_name, version)
+        )
+        # From now on the mapping reads the version's files (e.g. for the search index)
+        files.close()
+        files.directory = module_path
+        return file_tree, zipped
+    
+    def load_module(self, module_name, version=None):
+        """
+        Read a previously built module back from disk
+        
+        Args:
+            module_name: Name of the module
+            version: Version number; None for the latest
+        
+        Returns:
+            tuple: (files dict, file tree list) or None if the module does not exist
+        """
+        module_path = self.module_path(module_name, version)
+        if module_path is None or not os.path.isdir(module_path):
+            return None
+        
+        files = {}
+        file_tree = []
+        for root, dirs, filenames in os.walk(module_path):
+            # Skip hidden directories and metadata files
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for filename in sorted(filenames):
+                if filename.startswith("."):
+                    continue
+                full_path = os.path.join(root, filename)
+                rel_path = os.path.relpath(full_path, module_path).replace(os.sep, "/")
+                with open(full_path, "r", encoding="utf-8") as f:
+                    content = f.read()
+                if rel_path != "FILE_TREE.md":
+                    files[rel_path] = content
                 file_tree.append({
-                    "path": filepath,
+                    "path": rel_path,
                     "full_path": full_path,
                     "size": len(content.encode("utf-8"))
                 })
-                
-            except Exception as e:
-                print(f"Error writing file {filepath}: {str(e)}")
-                # Continue with other files even if one fails
         
-        # Create a file tree markdown file
-        tree_md = self._generate_file_tree_markdown(file_tree)
-        tree_path = os.path.join(module_path, "FILE_TREE.md")
-        with open(tree_path, "w", encoding="utf-8") as f:
-            f.write(tree_md)
+        return files, file_tree
+    
+    def module_tree(self, module_name, version=None):
+        """
+        Nested file tree of a module (see services.file_tree)
         
-        file_tree.append({
-            "path": "FILE_TREE.md",
-            "full_path": tree_path,
-            "size": len(tree_md.encode("utf-8"))
-        })
+        Uses the tree cached at build time; modules built before trees were
+        cached get theirs built from disk and cached now.
         
-        return file_tree
+        Returns:
+            dict: Root folder with nested children, or None if the module does not exist
+        """
+        version = self.versions.resolve(module_name, version)
+        if version is None:
+            return None
+        tree = self.read_module_metadata(module_name, "tree", version=version)
+        if tree is not None:
+            return tree
+        
+        loaded = self.load_module(module_name, version)
+        if loaded is None:
+            return None
+        _, file_tree = loaded
+        tree = FileTree.from_entries(
+            entry for entry in file_tree if entry["path"] != "FILE_TREE.md"
+        ).to_dict()
+        self.write_module_metadata(module_name, "tree", tree, version=version)
+        return tree
     
-    def _generate_file_tree_markdown(self, file_tree):
-        """Generate a markdown representation of the file tree"""
-        lines = ["# Module File Tree\n", "```"]
-        
-        # Group files by directory
-        dirs = {}
-        root_files = []
-        
-        for file_info in sorted(file_tree, key=lambda x: x["path"]):
-            path = file_info["path"]
-            if "/" in path or "\\" in path:
-                # File in a subdirectory
-                parts = path.replace("\\", "/").split("/")
-                dir_name = "/".join(parts[:-1])
-                if dir_name not in dirs:
-                    dirs[dir_name] = []
-                dirs[dir_name].append(parts[-1])
-            else:
-                root_files.append(path)
-        
-        # Add root files
-        for file in sorted(root_files):
-            lines.append(f"├── {file}")
-        
-        # Add directories
-        for dir_name in sorted(dirs.keys()):
-            lines.append(f"├── {dir_name}/")
-            for file in sorted(dirs[dir_name]):
-                lines.append(f"│   └── {file}")
-        
-        lines.append("```")
-        
-        return "\n".join(lines)
-
+    def write_module_metadata(self, module_name, name, data, version=None):
+        """
+        Store JSON metadata alongside one version of a module
+        
+        Metadata files are hidden (dot-prefixed) so they are left out of the ZIP,
+        and replaced atomically so concurrent readers never see a partial file.
+        
+        Returns:
+            str: Path to the metadata file
+        """
+        module_path = self.module_path(module_name, version)
+        if module_path is None:
+            raise FileNotFoundError(f"Module has no published version: {module_name}")
+        os.makedirs(module_path, exist_ok=True)
+        metadata_path = os.path.join(module_path, f".{name}.json")
+        fd, tmp_path = tempfile.mkstemp(dir=module_path, prefix=f".{name}", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, metadata_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return metadata_path
+    
+    def read_module_metadata(self, module_name, name, version=None):
+        """Return stored metadata for a module version (default latest), or None if absent"""
+        module_path = self.module_path(module_name, version)
+        if module_path is None:
+            return None
+        metadata_path = os.path.join(module_path, f".{name}.json")
+        try:
+            with open(metadata_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
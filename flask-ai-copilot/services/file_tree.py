@@ -0,0 +1,141 @@
+"""
+File Tree Service
+Builds the nested module file tree in one pass and renders it as markdown
+"""
+
+
+class FileTree:
+    """
+    Nested file tree with per-directory sizes and file counts
+
+    Directories are looked up through a path index, so adding a file costs
+    O(depth) and building the whole tree is linear in the total path length.
+    """
+
+    def __init__(self):
+        self.root = self._folder("", "")
+        self._folders = {"": self.root}
+
+    @staticmethod
+    def _folder(name, path):
+        return {"name": name, "path": path, "type": "folder", "size": 0, "file_count": 0, "children": {}}
+
+    @classmethod
+    def from_entries(cls, entries):
+        """
+        Build a tree from file_tree entries
+
+        Args:
+            entries: Iterable of {"path": ..., "size": ...} dicts
+        """
+        tree = cls()
+        for entry in entries:
+            tree.add(entry["path"], entry.get("size", 0))
+        return tree
+
+    def add(self, path, size=0):
+        """Add one file, creating intermediate folders as needed"""
+        parts = [part for part in path.replace("\\", "/").split("/") if part]
+        if not parts:
+            return
+
+        parent = self.root
+        lineage = [parent]
+        folder_path = ""
+        for depth in range(len(parts) - 1):
+            folder_path = f"{folder_path}/{parts[depth]}" if folder_path else parts[depth]
+            folder = self._folders.get(folder_path)
+            if folder is None:
+                folder = self._folder(parts[depth], folder_path)
+                parent["children"][parts[depth]] = folder
+                self._folders[folder_path] = folder
+            parent = folder
+            lineage.append(folder)
+
+        name = parts[-1]
+        previous = parent["children"].get(name)
+        if previous is not None and previous["type"] == "file":
+            # Re-adding a path replaces the file; undo its old totals first
+            for folder in lineage:
+                folder["size"] -= previous["size"]
+                folder["file_count"] -= 1
+
+        parent["children"][name] = {"name": name, "path": "/".join(parts), "type": "file", "size": size}
+        for folder in lineage:
+            folder["size"] += size
+            folder["file_count"] += 1
+
+    def to_dict(self):
+        """
+        JSON-ready tree, folders first and then files, both alphabetical
+
+        Returns:
+            dict: Root folder with nested "children" lists
+        """
+        return self._export(self.root)
+
+    def _export(self, node):
+        # Explicit stack, like render_tree_markdown, so very deep modules cannot hit the recursion limit
+        exported_root = {key: value for key, value in node.items() if key != "children"}
+        stack = [(node, exported_root)]
+        while stack:
+            folder, exported = stack.pop()
+            children = sorted(folder["children"].values(), key=lambda n: (n["type"] != "folder", n["name"].lower()))
+            exported["children"] = []
+            for child in children:
+                if child["type"] == "file":
+                    exported["children"].append(dict(child))
+                    continue
+                exported_child = {key: value for key, value in child.items() if key != "children"}
+                exported["children"].append(exported_child)
+                stack.append((child, exported_child))
+        return exported_root
+
+    def to_markdown(self, title="Module File Tree"):
+        """Render the tree with box-drawing connectors at every depth"""
+        return render_tree_markdown(self.to_dict(), title)
+
+
+def render_tree_markdown(tree, title="Module File Tree"):
+    """
+    Render an exported tree (FileTree.to_dict()) as a markdown code block
+
+    Args:
+        tree: Root folder dict
+        title: Heading line
+
+    Returns:
+        str: Markdown text
+    """
+    lines = [f"# {title}\n", "```"]
+
+    # Iterative DFS so very deep modules cannot hit the recursion limit
+    stack = [(child, "", index == len(tree["children"]) - 1)
+             for index, child in reversed(list(enumerate(tree["children"])))]
+    while stack:
+        node, prefix, last = stack.pop()
+        connector = "└── " if last else "├── "
+        label = f"{node['name']}/" if node["type"] == "folder" else node["name"]
+        lines.append(f"{prefix}{connector}{label}")
+        if node["type"] == "folder":
+            child_prefix = prefix + ("    " if last else "│   ")
+            children = node["children"]
+            for index in range(len(children) - 1, -1, -1):
+                stack.append((children[index], child_prefix, index == len(children) - 1))
+
+    lines.append("```")
+    return "\n".join(lines)
+
+
+def build_tree(entries):
+    """
+    Build the exported tree and its markdown in one call (offload pool entry point)
+
+    Args:
+        entries: List of {"path": ..., "size": ...} dicts
+
+    Returns:
+        tuple: (tree dict, markdown text)
+    """
+    tree = FileTree.from_entries(entries).to_dict()
+    return tree, render_tree_markdown(tree)
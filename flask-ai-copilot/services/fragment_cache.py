@@ -0,0 +1,256 @@
+"""
+Fragment Cache Service
+Caches generated per-day file groups so modules can reuse days across requests
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+from services.metrics import metrics
+from services.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+FRAGMENT_CACHE_ENABLED = os.getenv("FRAGMENT_CACHE_ENABLED", "true").lower() == "true"
+FRAGMENT_CACHE_DIR = os.getenv("FRAGMENT_CACHE_DIR", os.path.join("cache", "fragments"))
+# Seconds a fragment is reused after it was written (0 = no expiry)
+FRAGMENT_CACHE_TTL_S = float(os.getenv("FRAGMENT_CACHE_TTL_S", str(7 * 24 * 3600)))
+# Fragments kept at most; least recently used ones are removed first (0 = no limit)
+FRAGMENT_CACHE_MAX_ENTRIES = int(os.getenv("FRAGMENT_CACHE_MAX_ENTRIES", "5000"))
+# Total size of the cached fragments (0 = no limit)
+FRAGMENT_CACHE_MAX_BYTES = int(os.getenv("FRAGMENT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+_DAY_PATTERN = re.compile(r"^Day(\d+)/(.+)$")
+
+
+def split_day_files(files):
+    """
+    Group module files by day
+
+    Returns:
+        tuple: ({day: {relative path: content}}, {module-level path: content})
+    """
+    days = {}
+    module_files = {}
+    for filepath, content in files.items():
+        match = _DAY_PATTERN.match(filepath.replace("\\", "/"))
+        if match:
+            days.setdefault(int(match.group(1)), {})[match.group(2)] = content
+        else:
+            module_files[filepath] = content
+    return days, module_files
+
+
+def hash_prompt_files(*contents):
+    """Short digest of the guideline files a fragment was generated from"""
+    digest = hashlib.sha256()
+    for content in contents:
+        digest.update(content.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+class FragmentCache:
+    """
+    On-disk cache of DayN/ file groups
+
+    Fragments are keyed by canonical topic, level, day index and the hash of
+    the guideline files, so a 3-day and a 5-day module on the same topic and
+    level share their early days.
+
+    The cache is bounded: fragments older than ttl_s are dropped when read,
+    and every write (and startup) removes expired fragments and then the
+    least recently used ones past max_entries or max_bytes.
+    """
+
+    def __init__(self, cache_dir=FRAGMENT_CACHE_DIR, enabled=FRAGMENT_CACHE_ENABLED, ttl_s=FRAGMENT_CACHE_TTL_S,
+                 max_entries=FRAGMENT_CACHE_MAX_ENTRIES, max_bytes=FRAGMENT_CACHE_MAX_BYTES):
+        # Get the project root directory (parent of services/)
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.cache_dir = os.path.join(project_root, cache_dir)
+        self.enabled = enabled
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # path -> [written_at, last_used, size] of every fragment on disk
+        self._entries = {}
+        self._bytes = 0
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._scan()
+            self._prune()
+
+    def _scan(self):
+        """Index the fragments already on disk"""
+        for root, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                if not filename.endswith(".json"):
+                    # Left behind by a write that was interrupted
+                    if filename.endswith(".tmp"):
+                        self._remove(path)
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                self._entries[path] = [stat.st_mtime, stat.st_mtime, stat.st_size]
+                self._bytes += stat.st_size
+
+    def _expired(self, entry, now):
+        return self.ttl_s > 0 and now - entry[0] > self.ttl_s
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _forget(self, path, reason):
+        """Drop a fragment from the index and the disk (caller holds the lock)"""
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+        self._remove(path)
+        metrics.increment("fragment_evictions_total", reason=reason)
+
+    def _prune(self):
+        """Remove expired fragments, then the least recently used past the limits"""
+        now = time.time()
+        with self._lock:
+            for path in [path for path, entry in self._entries.items() if self._expired(entry, now)]:
+                self._forget(path, "expired")
+            if not self._over_limit():
+                return
+            for path in sorted(self._entries, key=lambda path: self._entries[path][1]):
+                if not self._over_limit():
+                    break
+                self._forget(path, "size")
+
+    def _over_limit(self):
+        if self.max_entries and len(self._entries) > self.max_entries:
+            return True
+        return bool(self.max_bytes) and self._bytes > self.max_bytes
+
+    def _key(self, topic, level, day, prompt_hash):
+        raw = f"{topic}|{level or ''}|{day}|{prompt_hash}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, topic, level, day, prompt_hash):
+        """Return {relative path: content} for a cached day, or None"""
+        if not self.enabled or not topic:
+            return None
+        path = self._path(self._key(topic, level, day, prompt_hash))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and self._expired(entry, now):
+                self._forget(path, "expired")
+                entry = None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                fragment = json.load(f)
+        except (OSError, ValueError):
+            metrics.increment("fragment_misses_total")
+            return None
+        with self._lock:
+            if path in self._entries:
+                self._entries[path][1] = now
+        metrics.increment("fragment_hits_total")
+        return fragment["files"]
+
+    def put(self, topic, level, day, prompt_hash, files):
+        """Store one day's files (written atomically)"""
+        if not self.enabled or not topic or not files:
+            return
+        key = self._key(topic, level, day, prompt_hash)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fragment = {
+            "topic": topic,
+            "level": level,
+            "day": day,
+            "prompt_hash": prompt_hash,
+            "created_at": time.time(),
+            "files": files
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(fragment, f)
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            previous = self._entries.get(path)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[path] = [fragment["created_at"], fragment["created_at"], size]
+            self._bytes += size
+        metrics.increment("fragment_stores_total")
+        self._prune()
+
+    def lookup_days(self, topic, level, days, prompt_hash):
+        """
+        Fetch every cached day of a planned module
+
+        Returns:
+            dict: {day: files} for the days found in the cache
+        """
+        found = {}
+        for day in range(1, days + 1):
+            files = self.get(topic, level, day, prompt_hash)
+            if files:
+                found[day] = files
+        return found
+
+    def store_days(self, topic, level, prompt_hash, files, skip=()):
+        """
+        Cache every day of a module not listed in skip
+
+        Args:
+            files: Mapping of the module's {filepath: content}; only one
+                   day's files are read at a time, so it may be kept on disk
+        """
+        days = {}
+        for filepath in files:
+            match = _DAY_PATTERN.match(filepath.replace("\\", "/"))
+            if match:
+                days.setdefault(int(match.group(1)), []).append((filepath, match.group(2)))
+        for day, entries in sorted(days.items()):
+            if day in skip:
+                continue
+            try:
+                self.put(topic, level, day, prompt_hash, {name: files[filepath] for filepath, name in entries})
+            except OSError as e:
+                logger.warning("Failed to cache fragment", extra={"day": day, "error": str(e)})
+
+    def stats(self):
+        hits = metrics.counter("fragment_hits_total")
+        misses = metrics.counter("fragment_misses_total")
+        total = hits + misses
+        with self._lock:
+            entries, size = len(self._entries), self._bytes
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else None,
+            "entries": entries,
+            "bytes": size,
+            "ttl_s": self.ttl_s or None,
+            "max_entries": self.max_entries or None,
+            "max_bytes": self.max_bytes or None
+        }
@@ -4,10 +4,36 @@ Handles LLM integration and module generation
 """
 
 import os
-import json
 import re
+import math
+import time
+from collections.abc import Mapping
 from openai import OpenAI
 from dotenv import load_dotenv
+from services.tracing import tracer
+from services.structured_logging import get_logger
+from services.metrics import metrics
+from services.offload import offload_pool
+from services.cancellation import (
+    GenerationCancelled, STAGE_TIMEOUTS, check_cancelled, run_stage, record_wasted_tokens, remaining_time
+)
+from services.deadline import latency_estimator, plan_generation, expected_output_tokens, FULL_DAY_FILES
+from services.json_parsing import (
+    extract_json, parse_json_response, salvage_truncated_module, ModuleStreamParser
+)
+from services.similarity import canonicalize
+from services.fragment_cache import FragmentCache, hash_prompt_files
+from services.endpoint_pool import EndpointPool, parse_base_urls
+from services.guidelines import GuidelineRetriever
+from services.structured_output import (
+    STRUCTURED_OUTPUT, REPAIR_ENABLED, REPAIR_MAX_FILES, REPAIR_TOKENS_PER_FILE, MODULE_SCHEMA_NAME,
+    REPAIR_SCHEMA_NAME, CONTINUATION_SCHEMA_NAME, module_schema, repair_schema, openai_response_format, gemini_schema, schema_rejected,
+    normalize_module, invalid_content
+)
+from services.tokens import (
+    estimate_tokens, parse_prompt_shape, adaptive_max_tokens, usage_dict, merge_usage, token_budget,
+    TokenBudgetExceeded, DEFAULT_DAYS, CHARS_PER_TOKEN
+)
 
 # Load environment variables BEFORE reading any keys
 load_dotenv()
@@ -16,15 +42,42 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Self-hosted OpenAI-compatible servers (llama.cpp, vLLM, Ollama); several comma-separated URLs form a pool
+OPENAI_COMPATIBLE_BASE_URL = os.getenv("OPENAI_COMPATIBLE_BASE_URL")
+# Most self-hosted servers accept any key
+OPENAI_COMPATIBLE_API_KEY = os.getenv("OPENAI_COMPATIBLE_API_KEY") or "not-needed"
 
-# Console diagnostics
-print("Loaded OPENAI_API_KEY:", OPENAI_API_KEY is not None)
-print("Loaded GOOGLE/GEMINI_API_KEY:", GOOGLE_API_KEY is not None)
-print("Loaded GROQ_API_KEY:", GROQ_API_KEY is not None)
+logger = get_logger(__name__)
 
-# Validate that at least one API key is present
-if not OPENAI_API_KEY and not GOOGLE_API_KEY and not GROQ_API_KEY:
-    raise Exception("Missing API key. Add your key to .env file. Required: OPENAI_API_KEY, GOOGLE_API_KEY (or GEMINI_API_KEY), or GROQ_API_KEY")
+# Startup diagnostics
+logger.info(
+    "API keys loaded",
+    extra={
+        "openai_key_present": OPENAI_API_KEY is not None,
+        "google_key_present": GOOGLE_API_KEY is not None,
+        "groq_key_present": GROQ_API_KEY is not None,
+        "openai_compatible_base_url_present": OPENAI_COMPATIBLE_BASE_URL is not None
+    }
+)
+
+# Validate that at least one API key (or self-hosted endpoint) is present
+if not OPENAI_API_KEY and not GOOGLE_API_KEY and not GROQ_API_KEY and not OPENAI_COMPATIBLE_BASE_URL:
+    raise Exception("Missing API key. Add your key to .env file. Required: OPENAI_API_KEY, GOOGLE_API_KEY (or GEMINI_API_KEY), GROQ_API_KEY, or OPENAI_COMPATIBLE_BASE_URL")
+
+# Cheaper models tried before the provider's configured model, in order
+MODEL_CASCADE = [m.strip() for m in os.getenv("MODEL_CASCADE", "").split(",") if m.strip()]
+# Files every DayN/ folder must contain for a cascade step to be accepted
+REQUIRED_DAY_FILES = [f.strip() for f in os.getenv("REQUIRED_DAY_FILES", "lesson.md,slides.md,exercises.md").split(",") if f.strip()]
+# Minimum characters for each generated file
+MIN_FILE_CHARS = int(os.getenv("MIN_FILE_CHARS", "200"))
+# Ask for the rest of a module whose response was cut off by the output token limit
+CONTINUATION_ENABLED = os.getenv("CONTINUATION_ENABLED", "true").lower() == "true"
+# Continuation calls per cascade attempt before the missing files are left to repair/escalation
+CONTINUATION_MAX_CALLS = int(os.getenv("CONTINUATION_MAX_CALLS", "6"))
+# Files planned for every DayN/ folder when continuing a truncated module
+CONTINUATION_DAY_FILES = [f.strip() for f in os.getenv(
+    "CONTINUATION_DAY_FILES", "lesson.md,slides.md,exercises.md,video_script.md,micro_learning.md"
+).split(",") if f.strip()]
 
 # Try to import Gemini (optional)
 try:
@@ -57,57 +110,75 @@ class ModuleGenerator:
         # Initialize AI client (OpenAI by default, can switch to Gemini or Groq)
         self.ai_provider = os.getenv("AI_PROVIDER", "openai").lower()
 
-        # Auto-detect provider if not specified
+        # An explicit AI_PROVIDER always wins; the key-based auto-detection only applies when it is empty
         if self.ai_provider == "openai" or (not self.ai_provider and OPENAI_API_KEY):
             if not OPENAI_API_KEY:
                 raise Exception("OPENAI_API_KEY not found in environment variables")
-            print("Initializing OpenAI client...")
             self.client = OpenAI(api_key=OPENAI_API_KEY)
             self.model = os.getenv("OPENAI_MODEL", "gpt-4")
             self.ai_provider = "openai"
-            print(f"Using OpenAI model: {self.model}")
-        elif self.ai_provider == "gemini" or (not OPENAI_API_KEY and GOOGLE_API_KEY and not GROQ_API_KEY):
+            logger.info("Initialized OpenAI client", extra={"model": self.model})
+        elif self.ai_provider == "openai_compatible":
+            base_urls = parse_base_urls(OPENAI_COMPATIBLE_BASE_URL)
+            if not base_urls:
+                raise Exception("OPENAI_COMPATIBLE_BASE_URL not found in environment variables")
+            self.model = os.getenv("OPENAI_COMPATIBLE_MODEL")
+            if not self.model:
+                raise Exception("OPENAI_COMPATIBLE_MODEL not found in environment variables")
+            # One endpoint or a load-balanced pool, used like a single OpenAI client
+            self.client = EndpointPool(base_urls, api_key=OPENAI_COMPATIBLE_API_KEY)
+            logger.info("Initialized OpenAI-compatible endpoint pool", extra={
+                "model": self.model, "endpoints": base_urls
+            })
+        elif self.ai_provider == "gemini" or (not self.ai_provider and not OPENAI_API_KEY and GOOGLE_API_KEY and not GROQ_API_KEY):
             if not GEMINI_AVAILABLE:
                 raise ImportError("Google Gemini package not installed. Install with: pip install google-generativeai")
             if not GOOGLE_API_KEY:
                 raise Exception("GOOGLE_API_KEY not found in environment variables")
-            print("Initializing Google Gemini client...")
             # Configure Gemini
             genai.configure(api_key=GOOGLE_API_KEY)
             self.client = genai
             self.model = os.getenv("GEMINI_MODEL", "gemini-1.5-pro") or os.getenv("GOOGLE_MODEL", "gemini-pro")
             self.ai_provider = "gemini"
-            print(f"Using Gemini model: {self.model}")
-        elif self.ai_provider == "groq" or (not OPENAI_API_KEY and not GOOGLE_API_KEY and GROQ_API_KEY):
+            logger.info("Initialized Gemini client", extra={"model": self.model})
+        elif self.ai_provider == "groq" or (not self.ai_provider and not OPENAI_API_KEY and not GOOGLE_API_KEY and GROQ_API_KEY):
             if not GROQ_AVAILABLE:
                 raise ImportError("Groq package not installed. Install with: pip install groq")
             if not GROQ_API_KEY:
                 raise Exception("GROQ_API_KEY not found in environment variables")
-            print("Initializing Groq client...")
             self.client = Groq(api_key=GROQ_API_KEY)
             self.model = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
             self.ai_provider = "groq"
-            print(f"Using Groq model: {self.model}")
+            logger.info("Initialized Groq client", extra={"model": self.model})
         else:
-            raise ValueError(f"Unsupported AI provider: {self.ai_provider}. Available: openai, gemini, groq")
+            raise ValueError(f"Unsupported AI provider: {self.ai_provider}. Available: openai, gemini, groq, openai_compatible")
+        
+        self.fragment_cache = FragmentCache()
+        self.guidelines = GuidelineRetriever()
+        self.repair_enabled = REPAIR_ENABLED
+        # Models that rejected schema-constrained output (they get plain JSON mode)
+        self._schema_unsupported = set()
+        
+        # Models tried in order; the configured model is always the last resort
+        self.cascade = [m for m in MODEL_CASCADE if m != self.model] + [self.model]
+        if len(self.cascade) > 1:
+            logger.info("Model cascade enabled", extra={"cascade": self.cascade})
     
     def _load_prompt_files(self):
         """Load curriculum.md and pedagogy.md"""
-        print("Loading curriculum.md...")
         try:
             with open(self.curriculum_path, "r", encoding="utf-8") as f:
                 curriculum = f.read()
-            print(f"Loaded curriculum.md: {len(curriculum)} characters")
+            logger.debug("Loaded curriculum.md", extra={"chars": len(curriculum)})
         except FileNotFoundError as e:
             raise FileNotFoundError(f"Prompt file not found: {e}")
         except Exception as e:
             raise Exception(f"Error loading curriculum.md: {e}")
         
-        print("Loading pedagogy.md...")
         try:
             with open(self.pedagogy_path, "r", encoding="utf-8") as f:
                 pedagogy = f.read()
-            print(f"Loaded pedagogy.md: {len(pedagogy)} characters")
+            logger.debug("Loaded pedagogy.md", extra={"chars": len(pedagogy)})
         except FileNotFoundError as e:
             raise FileNotFoundError(f"Prompt file not found: {e}")
         except Exception as e:
@@ -115,8 +186,18 @@ class ModuleGenerator:
         
         return curriculum, pedagogy
     
-    def _build_master_prompt(self, instructor_prompt, curriculum, pedagogy):
-        """Build the master prompt for LLM"""
+    def _build_master_prompt(self, instructor_prompt, curriculum, pedagogy, reused_days=None, plan=None):
+        """
+        Build the master prompt for LLM
+        
+        Args:
+            curriculum, pedagogy: Guideline text (whole files, or the
+                sections selected by services.guidelines)
+            reused_days: Optional {day: files} already available from the
+                fragment cache; the model is told to skip those days
+            plan: Optional deadline plan (see services.deadline) limiting
+                the days and files to generate
+        """
         system_prompt = """You are an AI Course-Builder Copilot designed for instructors. 
 Using three inputs:
 
@@ -155,6 +236,8 @@ Output format (MANDATORY):
   }
 }
 
+If a response schema is enforced, return "files" as a list of {"path": ..., "content": ...} objects instead.
+
 Do NOT return anything except JSON."""
         
         user_prompt = f"""Instructor Prompt:
@@ -174,252 +257,1197 @@ Pedagogy Guidelines:
 
 Now generate the complete module following the format specified above. Return ONLY valid JSON."""
         
-        print(f"Final LLM prompt length: {len(system_prompt) + len(user_prompt)} characters")
-        print(f"System prompt: {len(system_prompt)} characters")
-        print(f"User prompt: {len(user_prompt)} characters")
+        if reused_days:
+            user_prompt += self._reused_days_note(reused_days)
+        if plan and (plan["days"] or plan["day_files"]):
+            user_prompt += self._deadline_note(plan)
+        
+        logger.debug(
+            "Built master prompt",
+            extra={
+                "prompt_chars": len(system_prompt) + len(user_prompt),
+                "system_prompt_chars": len(system_prompt),
+                "user_prompt_chars": len(user_prompt)
+            }
+        )
         
         return system_prompt, user_prompt
     
+    def _reused_days_note(self, reused_days):
+        """Prompt section telling the model which days already exist"""
+        lines = []
+        for day in sorted(reused_days):
+            lesson = reused_days[day].get("lesson.md", "")
+            heading = next((line.lstrip("# ").strip() for line in lesson.splitlines() if line.strip()), "")
+            lines.append(f"- Day{day}: {heading[:120]}")
+        day_list = ", ".join(f"Day{day}" for day in sorted(reused_days))
+        return f"""
+
+---
+
+The following days already exist and will be added to the module automatically:
+{chr(10).join(lines)}
+
+Do NOT generate any files for {day_list}. Generate the files for every other day, plus the
+module-level files (summary.md, final project, rubric), keeping them consistent with the existing days."""
+    
+    def _deadline_note(self, plan):
+        """Prompt section limiting output when the deadline is short"""
+        lines = []
+        if plan["days"]:
+            lines.append(f"- Generate only Day1 to Day{plan['days']}. summary.md must say the module "
+                         f"currently covers {plan['days']} day(s); do not add files for later days.")
+        if plan["day_files"]:
+            lines.append(f"- For each day generate only: {', '.join(plan['day_files'])}.")
+        return f"""
+
+---
+
+Time is limited for this request. Keep the output smaller:
+{chr(10).join(lines)}
+- Keep summary.md, the final project and the rubric."""
+    
     def _extract_json(self, text):
         """Extract JSON from text using regex to find first { and last }"""
-        try:
-            # Try to find JSON object boundaries
-            first_brace = text.find('{')
-            last_brace = text.rfind('}')
-            
-            if first_brace != -1 and last_brace != -1 and last_brace > first_brace:
-                json_text = text[first_brace:last_brace + 1]
-                # Remove markdown code blocks if present
-                if "```json" in json_text:
-                    json_text = json_text.split("```json")[1].split("```")[0].strip()
-                elif "```" in json_text:
-                    json_text = json_text.split("```")[1].split("```")[0].strip()
-                return json.loads(json_text)
-            else:
-                raise ValueError("No JSON object found in response")
-        except Exception as e:
-            raise Exception(f"Failed to extract JSON: {e}")
+        return extract_json(text)
     
-    def _call_openai(self, system_prompt, user_prompt):
-        """Call OpenAI API"""
-        print("Calling OpenAI API...")
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
+    def _parse_content(self, content, truncated=False):
+        """
+        Parse a JSON response body, falling back to extraction
+
+        A body that does not parse because it was cut off (the provider
+        reported the output limit, or the JSON is unterminated) keeps its
+        complete files and comes back marked "truncated": True so the
+        generator can ask for the rest.
+
+        Args:
+            truncated: The provider stopped at the output token limit
+        """
+        with tracer.span("parse_response", response_chars=len(content)) as span:
+            try:
+                data, extracted = offload_pool.run(
+                    parse_json_response, content, size=len(content), stage="parse_json"
+                )
+            except Exception:
+                salvaged = salvage_truncated_module(content)
+                if salvaged is None:
+                    raise
+                metrics.increment("truncated_responses_total", provider=self.ai_provider,
+                                  reason="length" if truncated else "unterminated_json")
+                logger.warning("Response was cut off, kept the complete files", extra={
+                    "files": len(salvaged["files"]), "finish_length": truncated
+                })
+                span.set(truncated=True, salvaged_files=len(salvaged["files"]))
+                salvaged["truncated"] = True
+                return normalize_module(salvaged)
+            if extracted:
+                logger.warning("Direct JSON parse failed, used extraction")
+            # Schema-constrained output returns files as a list of {path, content}
+            return normalize_module(data)
+
+    def _parse_stream(self, pieces, files, stopped_at_limit=lambda: False):
+        """
+        Parse a streamed response, writing every file to files as soon as it is complete
+
+        Only the file being received is held in memory. A response that
+        ends before its JSON object is complete keeps the files that
+        arrived and comes back marked "truncated": True, like _parse_content.
+
+        Args:
+            pieces: Iterator over the response text
+            files: Mapping the files are written to (e.g. SpooledFiles)
+            stopped_at_limit: Called at the end; True if the provider reported the output limit
+
+        Returns:
+            tuple: (module data whose "files" is files, characters received)
+        """
+        parser = ModuleStreamParser()
+        module_data = {"files": files}
+        received = 0
+        with tracer.span("parse_stream") as span:
+            for piece in pieces:
+                received += len(piece)
+                for event in parser.feed(piece):
+                    if event[0] == "module_name":
+                        module_data["module_name"] = event[1]
+                        continue
+                    files[event[1]] = event[2]
+            span.set(response_chars=received, files=len(files))
+            if not parser.started:
+                raise ValueError("No JSON object found in streamed response")
+            if not parser.done:
+                truncated = stopped_at_limit()
+                metrics.increment("truncated_responses_total", provider=self.ai_provider,
+                                  reason="length" if truncated else "unterminated_json")
+                logger.warning("Response was cut off, kept the complete files", extra={
+                    "files": len(files), "finish_length": truncated
+                })
+                span.set(truncated=True)
+                module_data["truncated"] = True
+        return module_data, received
+
+    def _stream_usage(self, state, prompt):
+        """Token usage reported at the end of a stream, estimated from the characters received if absent"""
+        usage = state["usage"]
+        if usage and usage.get("prompt_tokens") is not None:
+            return usage_dict(usage["prompt_tokens"], usage["completion_tokens"])
+        return usage_dict(estimate_tokens(prompt), math.ceil(state["received"] / CHARS_PER_TOKEN), estimated=True)
+
+    def _use_schema(self, model, schema):
+        return schema is not None and STRUCTURED_OUTPUT and model not in self._schema_unsupported
+
+    def _schema_fallback(self, model, error):
+        """Remember that a model rejected schema-constrained output"""
+        self._schema_unsupported.add(model)
+        metrics.increment("structured_output_fallbacks_total", provider=self.ai_provider, model=model)
+        logger.warning("Model rejected schema-constrained output, using JSON mode", extra={
+            "model": model, "error": str(error)[:200]
+        })
+
+    def _chat_completion(self, model, system_prompt, user_prompt, max_tokens, schema_name, schema):
+        """
+        Streamed OpenAI-compatible chat completion (OpenAI, Groq and self-hosted servers) in JSON mode
+
+        The response is always streamed so a cancelled or timed-out call can
+        stop reading between chunks (see _chat_pieces) instead of running to
+        the end unobserved.
+
+        With a schema, the model is asked for strict JSON-schema output; a
+        model that rejects it is retried once in plain JSON mode and is not
+        asked again.
+
+        Returns:
+            Chunk iterator of the response
+        """
+        options = {"stream": True}
+        if max_tokens:
+            options["max_tokens"] = max_tokens
+        if self.ai_provider != "groq":
+            # Token usage only arrives (in a last chunk) when asked for
+            options["stream_options"] = {"include_usage": True}
+        if STAGE_TIMEOUTS["provider_call"]:
+            # Bounds calls that keep running after their request gave up on them
+            options["timeout"] = STAGE_TIMEOUTS["provider_call"]
+
+        def create(response_format):
+            return self.client.chat.completions.create(
+                model=model,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
                 temperature=0.7,
-                response_format={"type": "json_object"}
+                response_format=response_format,
+                **options
             )
-            
-            content = response.choices[0].message.content
-            print("LLM responded successfully")
-            print(f"Response length: {len(content)} characters")
-            
+
+        response = None
+        if self._use_schema(model, schema):
             try:
-                return json.loads(content)
-            except json.JSONDecodeError:
-                print("Warning: Direct JSON parse failed, attempting extraction...")
-                return self._extract_json(content)
+                response = create(openai_response_format(schema_name, schema))
+                metrics.increment("structured_output_calls_total", provider=self.ai_provider, mode="json_schema")
+            except Exception as e:
+                if not schema_rejected(e):
+                    raise
+                self._schema_fallback(model, e)
+        if response is None:
+            response = create({"type": "json_object"})
+            metrics.increment("structured_output_calls_total", provider=self.ai_provider, mode="json_object")
+        return response
+
+    def _stream_events(self, stream):
+        """
+        Chunks of a streamed chat completion as dicts
+
+        Iterates the SDK's public stream, which also raises the provider's
+        in-stream errors; extension fields such as Groq's x_groq are kept.
+        """
+        for chunk in stream:
+            yield chunk.model_dump() if hasattr(chunk, "model_dump") else chunk
+
+    def _chat_pieces(self, stream, state):
+        """
+        Text of a streamed chat completion, piece by piece
+
+        Checks for cancellation between chunks, so a cancelled or timed-out
+        call stops here and the caller closes the stream (which aborts the
+        generation on the server). state collects the usage, the finish
+        reason and the characters received.
+        """
+        for chunk in self._stream_events(stream):
+            check_cancelled("provider_call")
+            # Groq reports usage in an x_groq extension of the last chunk
+            usage = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage")
+            if usage:
+                state["usage"] = usage
+            for choice in chunk.get("choices") or []:
+                if choice.get("finish_reason"):
+                    state["finish_reason"] = choice["finish_reason"]
+                content = (choice.get("delta") or {}).get("content")
+                if content:
+                    state["received"] += len(content)
+                    yield content
+
+    def _close_stream(self, stream):
+        # Releases the connection (and the endpoint of a pool) even if the stream was not read to the end
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+
+    def _stream_chat(self, model, system_prompt, user_prompt, max_tokens, schema_name, schema, files=None):
+        """
+        Streamed chat completion
+
+        Args:
+            files: Mapping the response's files are written to as they arrive
+                   (None reads the whole response and parses it at the end)
+
+        Returns:
+            tuple: (module data, token usage dict)
+        """
+        stream = self._chat_completion(model, system_prompt, user_prompt, max_tokens, schema_name, schema)
+        state = {"usage": None, "finish_reason": None, "received": 0}
+        prompt = system_prompt + user_prompt
+        try:
+            if files is not None:
+                module_data, _ = self._parse_stream(
+                    self._chat_pieces(stream, state), files,
+                    stopped_at_limit=lambda: state["finish_reason"] == "length"
+                )
+            else:
+                content = "".join(self._chat_pieces(stream, state))
+        except GenerationCancelled:
+            self._record_aborted_call(model, prompt, state["received"])
+            raise
+        finally:
+            self._close_stream(stream)
+        usage = self._stream_usage(state, prompt)
+        if files is not None:
+            logger.debug("LLM response streamed", extra={"response_chars": state["received"], "files": len(files), **usage})
+            return module_data, usage
+        logger.debug("LLM responded", extra={"response_chars": len(content), **usage})
+        return self._parse_content(content, truncated=state["finish_reason"] == "length"), usage
+
+    def _call_openai(self, system_prompt, user_prompt, max_tokens=None, model=None,
+                     schema_name=MODULE_SCHEMA_NAME, schema=None, files=None):
+        """
+        Call OpenAI API
+
+        Args:
+            schema: Optional JSON schema the response must follow
+            files: Mapping to stream the files into (None reads the whole response)
+
+        Returns:
+            tuple: (parsed module data, token usage dict)
+        """
+        model = model or self.model
+        logger.debug("Calling OpenAI API", extra={"model": model, "max_tokens": max_tokens})
+        try:
+            return self._stream_chat(model, system_prompt, user_prompt, max_tokens, schema_name, schema, files)
+        except GenerationCancelled:
+            raise
         except Exception as e:
-            print(f"OpenAI API error: {e}")
+            logger.error("OpenAI API error", extra={"error": str(e)})
             raise Exception(f"OpenAI API error: {e}")
     
-    def _call_gemini(self, system_prompt, user_prompt):
-        """Call Google Gemini API"""
-        print("Calling Google Gemini API...")
+    def _call_gemini(self, system_prompt, user_prompt, max_tokens=None, model=None,
+                     schema_name=MODULE_SCHEMA_NAME, schema=None, files=None):
+        """
+        Call Google Gemini API
+
+        Args:
+            schema: Optional JSON schema the response must follow
+            files: Mapping to stream the files into (None reads the whole response)
+
+        Returns:
+            tuple: (parsed module data, token usage dict)
+        """
+        model_name = model or self.model
+        logger.debug("Calling Gemini API", extra={"model": model_name, "max_tokens": max_tokens})
         try:
             # Combine system and user prompts for Gemini
             full_prompt = f"{system_prompt}\n\n{user_prompt}"
 
             # Use GenerativeModel for Gemini
-            model = self.client.GenerativeModel(self.model)
+            model = self.client.GenerativeModel(model_name)
 
             # Generate content with JSON response format
-            response = model.generate_content(
-                full_prompt,
-                generation_config={
-                    "temperature": 0.7
-                }
-            )
+            generation_config = {"temperature": 0.7, "response_mime_type": "application/json"}
+            if max_tokens:
+                generation_config["max_output_tokens"] = max_tokens
+
+            request_options = {}
+            if STAGE_TIMEOUTS["provider_call"]:
+                request_options["timeout"] = STAGE_TIMEOUTS["provider_call"]
+
+            # Always streamed, so a cancelled call stops reading between chunks
+            response = None
+            if self._use_schema(model_name, schema):
+                try:
+                    response = model.generate_content(
+                        full_prompt,
+                        generation_config=dict(generation_config, response_schema=gemini_schema(schema)),
+                        request_options=request_options,
+                        stream=True
+                    )
+                    metrics.increment("structured_output_calls_total", provider="gemini", mode="json_schema")
+                except Exception as e:
+                    if not schema_rejected(e):
+                        raise
+                    self._schema_fallback(model_name, e)
+            if response is None:
+                response = model.generate_content(
+                    full_prompt,
+                    generation_config=generation_config,
+                    request_options=request_options,
+                    stream=True
+                )
+                metrics.increment("structured_output_calls_total", provider="gemini", mode="json_object")
+
+            def stopped_at_limit():
+                candidates = getattr(response, "candidates", None) or []
+                finish_reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+                return getattr(finish_reason, "name", finish_reason) in ("MAX_TOKENS", 2)
 
-            content = response.text
-            print("LLM responded successfully")
-            print(f"Response length: {len(content)} characters")
+            state = {"received": 0}
+
+            def pieces():
+                for chunk in response:
+                    check_cancelled("provider_call")
+                    text = self._gemini_chunk_text(chunk)
+                    state["received"] += len(text)
+                    yield text
 
             try:
-                return json.loads(content)
-            except json.JSONDecodeError:
-                print("Warning: Direct JSON parse failed, attempting extraction...")
-                return self._extract_json(content)
+                if files is not None:
+                    result, _ = self._parse_stream(pieces(), files, stopped_at_limit)
+                else:
+                    content = "".join(pieces())
+            except GenerationCancelled:
+                # The SDK has no close(); dropping the iterator ends the stream
+                self._record_aborted_call(model_name, full_prompt, state["received"])
+                raise
+
+            # Streamed responses carry usage and finish reason once fully read
+            metadata = getattr(response, "usage_metadata", None)
+            if metadata is not None and getattr(metadata, "prompt_token_count", None) is not None:
+                usage = usage_dict(metadata.prompt_token_count, metadata.candidates_token_count)
+            else:
+                usage = usage_dict(
+                    estimate_tokens(full_prompt), math.ceil(state["received"] / CHARS_PER_TOKEN), estimated=True
+                )
+            logger.debug("LLM responded", extra={"response_chars": state["received"], **usage})
+
+            if files is not None:
+                return result, usage
+            return self._parse_content(content, truncated=stopped_at_limit()), usage
+        except GenerationCancelled:
+            raise
         except Exception as e:
-            print(f"Gemini API error: {e}")
+            logger.error("Gemini API error", extra={"error": str(e)})
             raise Exception(f"Gemini API error: {e}")
 
-    def _call_groq(self, system_prompt, user_prompt):
-        """Call Groq API"""
-        print("Calling Groq API...")
+    def _gemini_chunk_text(self, chunk):
+        """Text of one streamed Gemini chunk ("" for chunks without text parts)"""
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7,
-                response_format={"type": "json_object"}
-            )
+            return chunk.text
+        except ValueError:
+            return ""
 
-            content = response.choices[0].message.content
-            print("LLM responded successfully")
-            print(f"Response length: {len(content)} characters")
+    def _call_groq(self, system_prompt, user_prompt, max_tokens=None, model=None,
+                   schema_name=MODULE_SCHEMA_NAME, schema=None, files=None):
+        """
+        Call Groq API
 
-            try:
-                return json.loads(content)
-            except json.JSONDecodeError:
-                print("Warning: Direct JSON parse failed, attempting extraction...")
-                return self._extract_json(content)
+        Args:
+            schema: Optional JSON schema the response must follow
+            files: Mapping to stream the files into (None reads the whole response)
+
+        Returns:
+            tuple: (parsed module data, token usage dict)
+        """
+        model = model or self.model
+        logger.debug("Calling Groq API", extra={"model": model, "max_tokens": max_tokens})
+        try:
+            return self._stream_chat(model, system_prompt, user_prompt, max_tokens, schema_name, schema, files)
+        except GenerationCancelled:
+            raise
         except Exception as e:
-            print(f"Groq API error: {e}")
+            logger.error("Groq API error", extra={"error": str(e)})
             raise Exception(f"Groq API error: {e}")
     
-    def generate_module(self, instructor_prompt):
+    def _call_openai_compatible(self, system_prompt, user_prompt, max_tokens=None, model=None,
+                                schema_name=MODULE_SCHEMA_NAME, schema=None, files=None):
+        """
+        Call a self-hosted OpenAI-compatible server (or the least loaded one of a pool)
+
+        Args:
+            schema: Optional JSON schema the response must follow
+            files: Mapping to stream the files into (None reads the whole response)
+
+        Returns:
+            tuple: (parsed module data, token usage dict)
+        """
+        model = model or self.model
+        logger.debug("Calling OpenAI-compatible endpoint", extra={"model": model, "max_tokens": max_tokens})
+        try:
+            return self._stream_chat(model, system_prompt, user_prompt, max_tokens, schema_name, schema, files)
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            logger.error("OpenAI-compatible endpoint error", extra={"error": str(e)})
+            raise Exception(f"OpenAI-compatible endpoint error: {e}")
+    
+    def _call_provider(self, model, system_prompt, user_prompt, max_tokens,
+                       schema_name=MODULE_SCHEMA_NAME, schema=None, files=None):
+        """Dispatch to the configured provider (files: stream the response's files into this mapping)"""
+        options = {"model": model, "schema_name": schema_name, "schema": schema, "files": files}
+        if self.ai_provider == "openai":
+            return self._call_openai(system_prompt, user_prompt, max_tokens, **options)
+        elif self.ai_provider == "gemini":
+            return self._call_gemini(system_prompt, user_prompt, max_tokens, **options)
+        elif self.ai_provider == "groq":
+            return self._call_groq(system_prompt, user_prompt, max_tokens, **options)
+        elif self.ai_provider == "openai_compatible":
+            return self._call_openai_compatible(system_prompt, user_prompt, max_tokens, **options)
+        else:
+            raise ValueError(f"Unsupported AI provider: {self.ai_provider}")
+
+    def _validate_module(self, module_data):
+        """
+        Check the structure of a parsed LLM response (raises ValueError)
+
+        Only problems that need a full retry raise; a missing module_name is
+        derived from the prompt and invalid files are repaired individually
+        (see _file_problems).
+        """
+        if not isinstance(module_data, dict):
+            raise ValueError("LLM response is not a dictionary")
+        
+        if "files" not in module_data:
+            raise ValueError("LLM response missing 'files' field")
+        
+        # A dict, or SpooledFiles when the response was streamed to disk
+        if not isinstance(module_data["files"], Mapping):
+            raise ValueError("LLM response 'files' field must be a dictionary")
+        
+        if not module_data["files"]:
+            raise ValueError("LLM response contains no files")
+
+    def _fallback_module_name(self, canonical):
+        """Module name derived from the prompt, for responses without a usable module_name"""
+        words = [word.capitalize() for word in canonical["topic"].split()[:6]]
+        if canonical["level"]:
+            words.append(canonical["level"].capitalize())
+        return "_".join(words) or "Module"
+
+    def _present_days(self, files):
+        """Day numbers that have at least one file under DayN/"""
+        present_days = set()
+        for filepath in files:
+            first = filepath.replace("\\", "/").split("/", 1)[0]
+            match = re.fullmatch(r"Day(\d+)", first)
+            if match:
+                present_days.add(int(match.group(1)))
+        return present_days
+
+    def _file_problems(self, module_data, days):
+        """
+        Find the files of a structurally valid module that need repairing
+        
+        Args:
+            module_data: Validated module dict
+            days: Number of days requested (None if the prompt did not say)
+        
+        Returns:
+            dict: {filepath: "missing" | "invalid" | "short"} (empty if the module is acceptable)
+        """
+        files = module_data["files"]
+        problems = {}
+        
+        if "summary.md" not in files:
+            problems["summary.md"] = "missing"
+        
+        expected_days = range(1, (days or max(self._present_days(files), default=1)) + 1)
+        
+        for day in expected_days:
+            for name in REQUIRED_DAY_FILES:
+                if f"Day{day}/{name}" not in files:
+                    problems[f"Day{day}/{name}"] = "missing"
+        
+        for filepath, content in files.items():
+            if invalid_content(content):
+                problems[filepath] = "invalid"
+            elif len(content.strip()) < MIN_FILE_CHARS:
+                problems[filepath] = "short"
+        
+        return problems
+
+    def _quality_issues(self, problems):
+        """
+        Human-readable form of _file_problems
+
+        Returns:
+            list: Problems (empty if the module is acceptable)
+        """
+        issues = []
+        for filepath, problem in problems.items():
+            if problem == "missing":
+                issues.append(f"missing {filepath}")
+            elif problem == "invalid":
+                issues.append(f"{filepath} has no valid content")
+            else:
+                issues.append(f"{filepath} shorter than {MIN_FILE_CHARS} characters")
+        return issues
+
+    def _build_repair_prompt(self, instructor_prompt, module_data, problems):
+        """
+        Prompt asking for just the broken files
+
+        The curriculum and pedagogy guidelines are left out: the module's
+        file list and summary carry enough context, and the prompt stays a
+        small fraction of the full generation prompt.
+        """
+        system_prompt = """You are an AI Course-Builder Copilot repairing a generated learning module.
+Some files of the module are missing or invalid. Write the complete markdown content of
+exactly the files listed, consistent with the rest of the module.
+
+Output format (MANDATORY):
+
+{
+  "files": [
+      {"path": "Day2/slides.md", "content": "..."},
+      ...
+  ]
+}
+
+Do NOT return anything except JSON."""
+
+        files = module_data["files"]
+        reasons = {
+            "missing": "missing",
+            "invalid": "content was not valid text",
+            "short": f"too short, write at least {MIN_FILE_CHARS} characters"
+        }
+        existing = [path for path in sorted(files) if path not in problems][:60]
+        summary = files.get("summary.md")
+        summary = summary[:1500] if isinstance(summary, str) and "summary.md" not in problems else "(not available)"
+        to_write = "\n".join(f"- {path}: {reasons[problem]}" for path, problem in sorted(problems.items()))
+
+        user_prompt = f"""Instructor Prompt:
+{instructor_prompt}
+
+---
+
+Module name: {module_data["module_name"]}
+
+Existing files:
+{chr(10).join(f"- {path}" for path in existing) or "(none)"}
+
+summary.md (excerpt):
+{summary}
+
+---
+
+Files to write:
+{to_write}
+
+Return ONLY valid JSON with these files."""
+        return system_prompt, user_prompt
+
+    def _time_for_tokens(self, model, output_tokens):
+        """True if a call producing output_tokens on model is expected to finish before the deadline"""
+        remaining = remaining_time()
+        if remaining is None:
+            return True
+        return latency_estimator.estimate(model, output_tokens) <= remaining
+
+    def _followup_call(self, model, system_prompt, user_prompt, max_tokens, schema_name, schema, budget,
+                       files=None):
+        """
+        One extra provider call within an attempt (repair or continuation)
+
+        Applies the token budgets and records usage like a cascade attempt.
+        With files, the response's files are streamed into that mapping.
+
+        Args:
+            budget: The request's RequestBudget
+
+        Returns:
+            tuple: (parsed response, token usage dict)
+
+        Raises:
+            TokenBudgetExceeded: if the request's budget leaves no room for the call
+        """
+        prompt_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+        max_tokens = budget.fit(prompt_tokens, max_tokens)
+        reserved = token_budget.reserve(prompt_tokens + (max_tokens or 0))
+        usage = None
+        call_started = time.monotonic()
+        try:
+            result, usage = run_stage(
+                "provider_call", self._call_provider, model, system_prompt, user_prompt, max_tokens,
+                schema_name, schema, files,
+                on_abandoned=lambda result: self._record_abandoned_call(result, model)
+            )
+        finally:
+            spent = usage["total_tokens"] if usage else prompt_tokens
+            token_budget.settle(reserved, spent)
+            budget.charge(spent)
+        self._record_usage(usage, model)
+        latency_estimator.observe(model, time.monotonic() - call_started, usage["completion_tokens"])
+        return result, usage
+
+    def _repair_files(self, model, instructor_prompt, module_data, problems, budget):
+        """
+        Regenerate only the files that failed validation, in place
+
+        A failed repair call is logged and reported, never raised: the
+        caller falls back to escalating or accepting with quality issues.
+
+        Args:
+            module_data: Module whose files are updated with the repaired content
+            problems: {filepath: problem} from _file_problems
+            budget: The request's RequestBudget
+
+        Returns:
+            dict: {"model", "files", "fixed", "usage"} (plus "error" if the call failed)
+        """
+        paths = sorted(problems)
+        system_prompt, user_prompt = self._build_repair_prompt(instructor_prompt, module_data, problems)
+        record = {"model": model, "files": paths, "fixed": [], "usage": None}
+        
+        with tracer.span("repair", model=model, files=len(paths)) as span:
+            try:
+                result, usage = self._followup_call(
+                    model, system_prompt, user_prompt, REPAIR_TOKENS_PER_FILE * len(paths),
+                    REPAIR_SCHEMA_NAME, repair_schema(paths), budget
+                )
+                span.set(**usage)
+            except GenerationCancelled:
+                raise
+            except TokenBudgetExceeded as e:
+                metrics.increment("repair_calls_total", model=model, outcome="over_budget")
+                logger.info("Skipped repair, request token budget spent", extra={"model": model, "error": str(e)})
+                record["error"] = str(e)
+                return record
+            except Exception as e:
+                metrics.increment("repair_calls_total", model=model, outcome="error")
+                logger.warning("Repair call failed", extra={"model": model, "files": paths, "error": str(e)})
+                record["error"] = str(e)
+                return record
+            
+            metrics.increment("retry_tokens_total", usage["total_tokens"], kind="repair")
+            record["usage"] = usage
+            
+            repaired = result.get("files") if isinstance(result, dict) else None
+            if isinstance(repaired, Mapping):
+                for path, content in repaired.items():
+                    # Only the requested files may change; the rest of the module is kept as is
+                    if path not in problems or invalid_content(content):
+                        continue
+                    module_data["files"][path] = content
+                    if len(content.strip()) >= MIN_FILE_CHARS:
+                        record["fixed"].append(path)
+            span.set(fixed=len(record["fixed"]))
+        
+        unfixed = len(paths) - len(record["fixed"])
+        outcome = "fixed" if not unfixed else ("partial" if record["fixed"] else "unfixed")
+        metrics.increment("repair_calls_total", model=model, outcome=outcome)
+        metrics.increment("repair_files_total", len(record["fixed"]), outcome="fixed")
+        metrics.increment("repair_files_total", unfixed, outcome="unfixed")
+        logger.info("Repaired module files", extra={
+            "model": model, "requested": len(paths), "fixed": len(record["fixed"]),
+            "total_tokens": usage["total_tokens"]
+        })
+        return record
+
+    def _remaining_files(self, module_data, days, day_files, skip_days=()):
+        """
+        Planned files of a module that have not been written yet
+
+        The plan is summary.md, day_files for every day (days, or the
+        highest day present when the prompt did not say), a final project
+        and a rubric.
+        """
+        files = module_data["files"]
+        planned_days = days or max(self._present_days(files), default=DEFAULT_DAYS)
+        remaining = []
+        if "summary.md" not in files:
+            remaining.append("summary.md")
+        for day in range(1, planned_days + 1):
+            if day in skip_days:
+                continue
+            for name in day_files:
+                if f"Day{day}/{name}" not in files:
+                    remaining.append(f"Day{day}/{name}")
+        lowered = [path.lower() for path in files]
+        if not any("project" in path for path in lowered):
+            remaining.append("final_project.md")
+        if not any("rubric" in path for path in lowered):
+            remaining.append("rubric.md")
+        return remaining
+
+    def _continuation_prompt(self, user_prompt, module_data, remaining):
+        """Master user prompt plus a note asking for the remaining files only"""
+        written = "\n".join(f"- {path}" for path in sorted(module_data["files"])) or "(none)"
+        still_to_write = "\n".join(f"- {path}" for path in remaining)
+        return f"""{user_prompt}
+
+---
+
+Your previous response was cut off by the output length limit. These files are already written;
+do NOT repeat them:
+{written}
+
+Files still to write:
+{still_to_write}
+
+Return ONLY JSON of the form {{"files": [{{"path": "...", "content": "..."}}]}} containing the files
+still to write, in the order listed, consistent with the files already written."""
+
+    def _complete_truncated(self, model, system_prompt, user_prompt, module_data, days, day_files,
+                            max_tokens, budget, skip_days=(), staging=None):
+        """
+        Continue a module whose response hit the output token limit, in place
+
+        Each continuation call asks for the planned files that are still
+        missing; a continuation that is cut off again is followed by
+        another one. Stops when nothing is missing, a call adds no files,
+        CONTINUATION_MAX_CALLS is reached, or the deadline or the request's
+        token budget does not leave room for another call; the reason is
+        reported as "stopped". Failures are reported, never raised.
+
+        Args:
+            budget: The request's RequestBudget
+            staging: ModuleStaging to stream the continuations to disk (None keeps them in memory)
+
+        Returns:
+            dict: {"model", "calls", "files_added", "remaining", "usage", "stopped"}
+                  (plus "error" if a call failed)
+        """
+        record = {"model": model, "calls": 0, "files_added": 0, "remaining": [], "usage": None, "stopped": None}
+        with tracer.span("continuation", model=model) as span:
+            while True:
+                remaining = self._remaining_files(module_data, days, day_files, skip_days)
+                if not remaining:
+                    record["stopped"] = "complete"
+                    break
+                if record["calls"] >= CONTINUATION_MAX_CALLS:
+                    record["stopped"] = "max_calls"
+                    break
+                if not self._time_for_tokens(model, max_tokens or 0):
+                    record["stopped"] = "deadline"
+                    break
+                continuation_prompt = self._continuation_prompt(user_prompt, module_data, remaining)
+                if not budget.allows(estimate_tokens(system_prompt) + estimate_tokens(continuation_prompt)):
+                    record["stopped"] = "token_budget"
+                    break
+                try:
+                    result, usage = self._followup_call(
+                        model, system_prompt, continuation_prompt,
+                        max_tokens, CONTINUATION_SCHEMA_NAME, repair_schema(remaining), budget,
+                        files=staging.new_files(archive=False) if staging else None
+                    )
+                except GenerationCancelled:
+                    raise
+                except Exception as e:
+                    metrics.increment("continuation_calls_total", model=model, outcome="error")
+                    logger.warning("Continuation call failed", extra={"model": model, "error": str(e)})
+                    record["error"] = str(e)
+                    record["stopped"] = "error"
+                    break
+                record["calls"] += 1
+                record["usage"] = merge_usage(record["usage"], usage)
+                
+                truncated = bool(result.pop("truncated", False)) if isinstance(result, dict) else False
+                continued = result.get("files") if isinstance(result, dict) else None
+                added = 0
+                if isinstance(continued, Mapping):
+                    for path, content in continued.items():
+                        if path not in module_data["files"] and not invalid_content(content):
+                            module_data["files"][path] = content
+                            added += 1
+                record["files_added"] += added
+                metrics.increment("continuation_calls_total", model=model,
+                                  outcome="truncated" if truncated else "completed")
+                if not added:
+                    # No progress; leave what is missing to repair or escalation
+                    record["stopped"] = "no_progress"
+                    break
+                if not truncated and self._remaining_files(module_data, days, day_files, skip_days):
+                    # The model ended its answer early; what is still missing goes to repair
+                    record["stopped"] = "finished"
+                    break
+            
+            record["remaining"] = self._remaining_files(module_data, days, day_files, skip_days)
+            span.set(calls=record["calls"], files_added=record["files_added"], remaining=len(record["remaining"]),
+                     stopped=record["stopped"])
+        
+        metrics.increment("continuation_files_total", record["files_added"])
+        logger.info("Continued truncated module", extra={
+            "model": model, "calls": record["calls"], "files_added": record["files_added"],
+            "remaining": len(record["remaining"]), "stopped": record["stopped"]
+        })
+        return record
+
+    def _escalate(self, attempts, model, reason, detail):
+        metrics.increment("cascade_escalations_total", model=model, reason=reason)
+        attempts.append({"model": model, "outcome": "escalated", "reason": reason, "detail": detail})
+        logger.warning("Escalating to next model", extra={"model": model, "reason": reason, "detail": detail})
+    
+    def generate_module(self, instructor_prompt, use_cache=True, staging=None):
         """
         Generate a complete learning module
         
+        Models in the cascade are tried in order; output that fails
+        structural validation escalates to the next (stronger) model. A
+        response cut off by the output token limit keeps its complete files
+        and is continued with calls for the remaining files. When only a few
+        files are missing or invalid, a small repair call regenerates just
+        those files first; if problems remain, the output escalates too. The last model's structurally valid output is
+        accepted even if it has quality issues.
+        
+        Attempts, repairs and continuations share one TOKEN_BUDGET_PER_REQUEST:
+        each call is fitted to what is left, and once too little is left the
+        current output is accepted instead of escalating.
+        
+        Days already in the fragment cache (same topic, level and guideline
+        files) are reused, and the model is only asked for the missing ones.
+        
+        With a staging area, responses are streamed and every file is written
+        to disk as soon as it arrives, so memory use is bounded by the largest
+        file rather than the module; "files" is then a SpooledFiles mapping.
+        
         Args:
             instructor_prompt: The instructor's prompt (e.g., "RAG module, intermediate, 5 days")
+            use_cache: Reuse cached day fragments
+            staging: ModuleStaging from FileBuilder.stage() (None keeps the module in memory)
         
         Returns:
-            dict: Module data with module_name and files
+            dict: Module data with module_name, files, usage and generation details
         """
-        print(f"\n{'='*60}")
-        print("Starting module generation...")
-        print(f"Instructor prompt: {instructor_prompt[:100]}...")
-        print(f"{'='*60}\n")
+        logger.info("Starting module generation", extra={"instructor_prompt": instructor_prompt[:100]})
         
         # Load prompt files
-        curriculum, pedagogy = self._load_prompt_files()
+        with tracer.span("load_prompts"):
+            curriculum, pedagogy = self._load_prompt_files()
+        
+        days, level = parse_prompt_shape(instructor_prompt)
+        
+        # Look up cached days (only possible when the duration is known)
+        canonical = canonicalize(instructor_prompt)
+        prompt_hash = hash_prompt_files(curriculum, pedagogy)
+        reused_days = {}
+        if use_cache and days:
+            with tracer.span("fragment_lookup") as span:
+                reused_days = self.fragment_cache.lookup_days(canonical["topic"], level, days, prompt_hash)
+                span.set(reused_days=len(reused_days))
+        
+        # Degrade (faster model, fewer files, fewer days) if the deadline is short
+        remaining = remaining_time()
+        plan = plan_generation(remaining, self.cascade, days, level, reused_days, REQUIRED_DAY_FILES)
+        degradations = list(plan["degradations"])
+        target_days = plan["days"] or days
+        if plan["days"]:
+            reused_days = {day: files for day, files in reused_days.items() if day <= plan["days"]}
+        if degradations:
+            metrics.increment("deadline_degradations_total", degradations=",".join(degradations))
+            logger.info("Degrading generation to meet deadline", extra={
+                "remaining_s": round(remaining, 2), "estimated_s": plan["estimated_s"],
+                "degradations": degradations
+            })
+        
+        # Only the guideline sections relevant to this prompt go into it
+        with tracer.span("guideline_retrieval") as span:
+            guideline_docs, guideline_stats = self.guidelines.retrieve(
+                instructor_prompt, {"curriculum": curriculum, "pedagogy": pedagogy}
+            )
+            span.set(mode=guideline_stats["mode"], guideline_tokens=guideline_stats["tokens"])
         
         # Build master prompt
-        system_prompt, user_prompt = self._build_master_prompt(
-            instructor_prompt, curriculum, pedagogy
-        )
+        with tracer.span("build_prompt") as span:
+            system_prompt, user_prompt = self._build_master_prompt(
+                instructor_prompt, guideline_docs["curriculum"], guideline_docs["pedagogy"],
+                reused_days=reused_days, plan=plan
+            )
+            span.set(prompt_chars=len(system_prompt) + len(user_prompt))
         
-        # Call appropriate AI provider
-        if self.ai_provider == "openai":
-            module_data = self._call_openai(system_prompt, user_prompt)
-        elif self.ai_provider == "gemini":
-            module_data = self._call_gemini(system_prompt, user_prompt)
-        elif self.ai_provider == "groq":
-            module_data = self._call_groq(system_prompt, user_prompt)
-        else:
-            raise ValueError(f"Unsupported AI provider: {self.ai_provider}")
+        prompt_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
         
-        print("Validating LLM response...")
+        total_usage = None
+        attempts = []
+        module_data = None
+        quality_issues = []
+        repairs = []
+        continuations = []
+        # Tokens spent beyond the first attempt: full retries on the next model, and repair calls
+        retry_tokens = {"escalation": 0, "repair": 0}
+        # Every provider call below draws on one per-request budget
+        budget = token_budget.request()
         
-        # Validate response structure
-        if not isinstance(module_data, dict):
-            raise ValueError("LLM response is not a dictionary")
+        models = plan["models"]
+        files_per_day = len(plan["day_files"]) if plan["day_files"] else FULL_DAY_FILES
+        # Scale the output limit down with the planned days and files
+        token_days = target_days * files_per_day / FULL_DAY_FILES if target_days else None
         
-        if "module_name" not in module_data:
-            raise ValueError("LLM response missing 'module_name' field")
+        with tracer.span("provider_call", provider=self.ai_provider, cascade=",".join(models)):
+            for index, model in enumerate(models):
+                final = index == len(models) - 1
+                check_cancelled("provider_call")
+                
+                # Pre-flight token budgeting (context windows differ per model)
+                max_tokens = adaptive_max_tokens(token_days, level, model=model, prompt_tokens=prompt_tokens)
+                max_tokens = budget.fit(prompt_tokens, max_tokens)
+                reserved = token_budget.reserve(prompt_tokens + (max_tokens or 0))
+                metrics.increment("cascade_attempts_total", model=model)
+                
+                usage = None
+                with tracer.span("attempt", number=index + 1, model=model, max_tokens=max_tokens) as span:
+                    call_started = time.monotonic()
+                    try:
+                        candidate, usage = run_stage(
+                            "provider_call", self._call_provider, model, system_prompt, user_prompt, max_tokens,
+                            MODULE_SCHEMA_NAME, module_schema(), staging.new_files() if staging else None,
+                            on_abandoned=lambda result, model=model: self._record_abandoned_call(result, model)
+                        )
+                        span.set(**usage)
+                    except GenerationCancelled:
+                        raise
+                    except Exception as e:
+                        if final:
+                            raise
+                        self._escalate(attempts, model, "provider_error", str(e))
+                        continue
+                    finally:
+                        # Failed calls are charged the estimated prompt size
+                        spent = usage["total_tokens"] if usage else prompt_tokens
+                        token_budget.settle(reserved, spent)
+                        budget.charge(spent)
+                    
+                    self._record_usage(usage, model)
+                    latency_estimator.observe(model, time.monotonic() - call_started, usage["completion_tokens"])
+                    total_usage = merge_usage(total_usage, usage)
+                    if index > 0:
+                        # Every attempt after the first is a full retry
+                        retry_tokens["escalation"] += usage["total_tokens"]
+                        metrics.increment("retry_tokens_total", usage["total_tokens"], kind="escalation")
+                    
+                    # Output cut off by the token limit: keep the complete files and ask for the rest
+                    truncated = candidate.pop("truncated", False) if isinstance(candidate, dict) else False
+                    if truncated and CONTINUATION_ENABLED:
+                        continuation = self._complete_truncated(
+                            model, system_prompt, user_prompt, candidate, target_days,
+                            plan["day_files"] or CONTINUATION_DAY_FILES, max_tokens, budget,
+                            skip_days=reused_days, staging=staging
+                        )
+                        continuations.append(continuation)
+                        if continuation["usage"]:
+                            total_usage = merge_usage(total_usage, continuation["usage"])
+                    
+                    with tracer.span("validate"):
+                        try:
+                            self._validate_module(candidate)
+                        except ValueError as e:
+                            if final:
+                                raise
+                            self._escalate(attempts, model, "invalid_structure", str(e))
+                            continue
+                        
+                        candidate_name = candidate.get("module_name")
+                        if not isinstance(candidate_name, str) or not candidate_name.strip():
+                            candidate["module_name"] = self._fallback_module_name(canonical)
+                            logger.warning("LLM response missing 'module_name', derived it from the prompt",
+                                           extra={"module_name": candidate["module_name"]})
+                        
+                        # Cached days replace anything the model produced for them
+                        for day, day_files in reused_days.items():
+                            for name, content in day_files.items():
+                                candidate["files"][f"Day{day}/{name}"] = content
+                        
+                        problems = self._file_problems(candidate, target_days)
+                    
+                    # A few broken files are regenerated on their own instead of retrying the module
+                    if (problems and self.repair_enabled and len(problems) <= REPAIR_MAX_FILES
+                            and self._time_for_tokens(model, REPAIR_TOKENS_PER_FILE * len(problems))):
+                        repair = self._repair_files(model, instructor_prompt, candidate, problems, budget)
+                        repairs.append(repair)
+                        if repair["usage"]:
+                            total_usage = merge_usage(total_usage, repair["usage"])
+                            retry_tokens["repair"] += repair["usage"]["total_tokens"]
+                        problems = self._file_problems(candidate, target_days)
+                    
+                    # Content that is still not text cannot be written
+                    invalid = [path for path, problem in problems.items() if problem == "invalid"]
+                    if invalid:
+                        for path in invalid:
+                            del candidate["files"][path]
+                        problems = self._file_problems(candidate, target_days)
+                    
+                    generated_days = self._present_days(candidate["files"])
+                    quality_issues = self._quality_issues(problems)
+                    
+                    if quality_issues and not final:
+                        if not budget.allows(prompt_tokens):
+                            # A stronger model would be refused; keep what we have
+                            logger.warning("Skipped escalation, request token budget spent", extra={
+                                "model": model, "spent": budget.spent, "limit": budget.limit
+                            })
+                        elif self._time_for_attempt(models[index + 1], target_days, level, files_per_day):
+                            self._escalate(attempts, model, "quality", "; ".join(quality_issues[:5]))
+                            continue
+                        else:
+                            # No time left for a stronger model; keep what we have
+                            degradations.append("skipped_escalation")
+                    
+                    module_data = candidate
+                    metrics.increment("cascade_accepted_total", model=model)
+                    attempts.append({"model": model, "outcome": "accepted"})
+                    break
         
-        if "files" not in module_data:
-            raise ValueError("LLM response missing 'files' field")
+        if quality_issues:
+            logger.warning("Accepted module with quality issues", extra={"issues": quality_issues[:20]})
+        elif use_cache and days and "reduced_files" not in degradations:
+            # Only cache complete days from an accepted, issue-free generation
+            self.fragment_cache.store_days(
+                canonical["topic"], level, prompt_hash, module_data["files"], skip=reused_days
+            )
         
-        if not isinstance(module_data["files"], dict):
-            raise ValueError("LLM response 'files' field must be a dictionary")
+        module_data["fragments"] = {
+            "reused_days": sorted(reused_days),
+            "generated_days": sorted(day for day in generated_days if day not in reused_days),
+            "hit_rate": round(len(reused_days) / days, 4) if use_cache and days else None
+        }
         
-        # Validate each file entry
-        print(f"Module name: {module_data['module_name']}")
-        print(f"Number of files: {len(module_data['files'])}")
+        if remaining is not None:
+            module_data["deadline"] = {
+                "remaining_s": round(remaining, 3),
+                "estimated_s": plan["estimated_s"],
+                "requested_days": days,
+                "delivered_days": target_days,
+                "day_files": plan["day_files"]
+            }
         
-        for filepath, content in module_data["files"].items():
-            if not isinstance(filepath, str):
-                raise ValueError(f"File path must be a string, got {type(filepath)}")
-            if not isinstance(content, str):
-                raise ValueError(f"File content must be a string for {filepath}, got {type(content)}")
+        module_data["usage"] = dict(total_usage, max_tokens=max_tokens, estimated_prompt_tokens=prompt_tokens)
+        module_data["generation"] = {
+            "model": attempts[-1]["model"],
+            "attempts": attempts,
+            "quality_issues": quality_issues,
+            "degradations": degradations,
+            "repairs": repairs,
+            "continuations": continuations,
+            "retry_tokens": retry_tokens,
+            "token_budget": {"limit": budget.limit or None, "spent": budget.spent, "remaining": budget.remaining},
+            "guidelines": guideline_stats
+        }
         
-        print("Validation successful!")
-        print(f"{'='*60}\n")
+        logger.info(
+            "Module generated",
+            extra={
+                "module_name": module_data["module_name"],
+                "file_count": len(module_data["files"]),
+                "model": attempts[-1]["model"],
+                "total_tokens": total_usage["total_tokens"]
+            }
+        )
         
         return module_data
 
-    def test_llm_call(self):
+    def _time_for_attempt(self, model, days, level, files_per_day):
+        """True if another call on model is expected to finish before the deadline"""
+        remaining = remaining_time()
+        if remaining is None:
+            return True
+        expected = latency_estimator.estimate(
+            model, expected_output_tokens(days or DEFAULT_DAYS, level, files_per_day)
+        )
+        return expected <= remaining
+    
+    def _record_abandoned_call(self, result, model):
+        """Account for a provider call that finished after its request was cancelled"""
+        _, usage = result
+        self._record_usage(usage, model)
+        record_wasted_tokens(usage)
+        # The reservation was settled at the prompt estimate when the call was given up on
+        token_budget.settle(0, max(0, usage["total_tokens"] - usage["prompt_tokens"]))
+
+    def _record_aborted_call(self, model, prompt, received):
+        """Account for a provider call stopped mid-stream: its prompt and the characters received so far"""
+        usage = usage_dict(estimate_tokens(prompt), math.ceil(received / CHARS_PER_TOKEN), estimated=True)
+        self._record_abandoned_call((None, usage), model)
+    
+    def _record_usage(self, usage, model):
+        """Aggregate token usage in the shared metrics registry"""
+        labels = {"provider": self.ai_provider, "model": model}
+        metrics.increment("llm_calls_total", **labels)
+        metrics.increment("tokens_prompt_total", usage["prompt_tokens"], **labels)
+        metrics.increment("tokens_completion_total", usage["completion_tokens"], **labels)
+        metrics.observe("tokens_per_call", usage["total_tokens"], **labels)
+
+    def _ping_request(self, model_name):
+        """Arguments of the smallest useful chat completion"""
+        return {
+            "model": model_name,
+            "messages": [
+                {"role": "system", "content": "You are a simple diagnostic bot."},
+                {"role": "user", "content": "Reply with the single word 'pong'."}
+            ],
+            "temperature": 0.0,
+            "max_tokens": 5
+        }
+
+    def test_endpoint_calls(self, model=None):
+        """
+        Ping every endpoint of an openai_compatible pool
+
+        Returns:
+            list: EndpointPool.probe results, empty for other providers
+        """
+        if not isinstance(self.client, EndpointPool):
+            return []
+        return self.client.probe(**self._ping_request(model or self.model))
+
+    def test_llm_call(self, model=None):
         """
         Perform a lightweight test call to the configured LLM provider.
         Returns a status dictionary without exposing full responses.
+        
+        Args:
+            model: Model to ping (defaults to the configured model)
         """
-        if self.ai_provider == "openai":
+        model_name = model or self.model
+        if self.ai_provider in ("openai", "groq", "openai_compatible"):
             try:
-                prompt = "Reply with the single word 'pong'."
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a simple diagnostic bot."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.0,
-                    max_tokens=5
-                )
+                response = self.client.chat.completions.create(**self._ping_request(model_name))
                 content = response.choices[0].message.content.strip() if response.choices else ""
                 return {
-                    "provider": "openai",
-                    "model": self.model,
+                    "provider": self.ai_provider,
+                    "model": model_name,
                     "status": "success",
                     "message": content[:50]
                 }
             except Exception as e:
                 return {
-                    "provider": "openai",
-                    "model": self.model,
+                    "provider": self.ai_provider,
+                    "model": model_name,
                     "status": "error",
                     "error": str(e)
                 }
         elif self.ai_provider == "gemini":
             try:
-                model = self.client.GenerativeModel(self.model)
-                response = model.generate_content("Reply with the single word 'pong'.")
+                gemini_model = self.client.GenerativeModel(model_name)
+                response = gemini_model.generate_content("Reply with the single word 'pong'.")
                 text = getattr(response, "text", "") or "OK"
                 return {
                     "provider": "gemini",
-                    "model": self.model,
+                    "model": model_name,
                     "status": "success",
                     "message": text[:50]
                 }
             except Exception as e:
                 return {
                     "provider": "gemini",
-                    "model": self.model,
-                    "status": "error",
-                    "error": str(e)
-                }
-        elif self.ai_provider == "groq":
-            try:
-                prompt = "Reply with the single word 'pong'."
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": "You are a simple diagnostic bot."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.0,
-                    max_tokens=5
-                )
-                content = response.choices[0].message.content.strip() if response.choices else ""
-                return {
-                    "provider": "groq",
-                    "model": self.model,
-                    "status": "success",
-                    "message": content[:50]
-                }
-            except Exception as e:
-                return {
-                    "provider": "groq",
-                    "model": self.model,
+                    "model": model_name,
                     "status": "error",
                     "error": str(e)
                 }
@@ -0,0 +1,246 @@
+"""
+Guideline Retrieval Service
+Splits curriculum.md and pedagogy.md into sections and picks the ones relevant to a prompt (BM25)
+"""
+
+import os
+import re
+import math
+import threading
+from collections import Counter
+
+from services.metrics import metrics
+from services.tokens import estimate_tokens
+from services.fragment_cache import hash_prompt_files
+
+
+GUIDELINE_RETRIEVAL_ENABLED = os.getenv("GUIDELINE_RETRIEVAL_ENABLED", "true").lower() == "true"
+# Prompt tokens available for guideline sections (files that fit are inlined whole)
+GUIDELINE_TOKEN_BUDGET = int(os.getenv("GUIDELINE_TOKEN_BUDGET", "1500"))
+# Terms added to every query so the sections about the files being generated always compete
+GUIDELINE_BASE_QUERY = os.getenv(
+    "GUIDELINE_BASE_QUERY",
+    "learning objectives bloom lesson plan slides exercises video script diagrams "
+    "micro-learning final project rubric assessment"
+)
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_TERM_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "with", "by", "at", "as", "is",
+    "are", "be", "it", "its", "this", "that", "these", "from", "into", "each", "e", "g", "vs",
+    "should", "can", "will", "their", "they", "how", "what", "when", "use", "using"
+}
+
+
+def stem(term):
+    """Strip common English suffixes so "exercises" matches "exercise" """
+    for suffix in ("ing", "ies", "es", "ed", "s"):
+        if len(term) > len(suffix) + 3 and term.endswith(suffix):
+            return term[:-len(suffix)] + ("y" if suffix == "ies" else "")
+    return term
+
+
+def tokenize(text):
+    return [stem(term) for term in _TERM_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+
+class Section:
+    """One heading of a guideline document with the text up to the next heading"""
+
+    def __init__(self, document, position, level, heading, path, body):
+        self.document = document
+        self.position = position
+        self.level = level
+        self.heading = heading
+        # Headings of the enclosing sections, outermost first
+        self.path = path
+        self.body = body
+        self.text = f"{'#' * level} {heading}\n{body}".rstrip()
+        self.tokens = estimate_tokens(self.text)
+        # The heading path counts towards relevance ("Module Structure > Slides")
+        self.terms = Counter(tokenize(" ".join(path + [heading]) + "\n" + body))
+        self.length = sum(self.terms.values())
+
+
+def split_sections(document, text):
+    """
+    Split a markdown document at every heading
+
+    Text before the first heading becomes a level-0 section without a
+    heading line.
+    """
+    sections = []
+    stack = []
+    level, heading, body = 0, "", []
+
+    def flush():
+        if heading or "".join(body).strip():
+            path = [title for _, title in stack[:-1]] if heading else []
+            section = Section(document, len(sections), level, heading, path, "\n".join(body).strip("\n"))
+            if not heading:
+                section.text = section.body
+            sections.append(section)
+
+    for line in text.splitlines():
+        match = _HEADING_PATTERN.match(line)
+        if not match:
+            body.append(line)
+            continue
+        flush()
+        level, heading, body = len(match.group(1)), match.group(2), []
+        while stack and stack[-1][0] >= level:
+            stack.pop()
+        stack.append((level, heading))
+    flush()
+    return sections
+
+
+class GuidelineIndex:
+    """BM25 index over the sections of a set of guideline documents"""
+
+    def __init__(self, documents):
+        self.documents = list(documents)
+        self.sections = []
+        for name, text in documents.items():
+            self.sections.extend(split_sections(name, text))
+        self.document_frequency = Counter()
+        for section in self.sections:
+            self.document_frequency.update(section.terms.keys())
+        self.average_length = (
+            sum(section.length for section in self.sections) / len(self.sections) if self.sections else 0
+        )
+
+    def scores(self, query):
+        """BM25 score of every section for a free-text query"""
+        count = len(self.sections)
+        query_terms = set(tokenize(query))
+        scores = []
+        for section in self.sections:
+            score = 0.0
+            for term in query_terms:
+                frequency = section.terms.get(term)
+                if not frequency:
+                    continue
+                df = self.document_frequency[term]
+                idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * section.length / (self.average_length or 1))
+                score += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+            scores.append(score)
+        return scores
+
+    def select(self, query, budget_tokens):
+        """
+        Highest-scoring sections that fit in the token budget
+
+        Sections are taken best first; one that does not fit is skipped
+        so that smaller relevant sections can still be added.
+
+        Returns:
+            list: Selected sections in document order
+        """
+        ranked = sorted(
+            zip(self.scores(query), self.sections), key=lambda item: (-item[0], item[1].position)
+        )
+        selected = []
+        used = 0
+        for score, section in ranked:
+            if score <= 0:
+                break
+            if used + section.tokens > budget_tokens:
+                continue
+            selected.append(section)
+            used += section.tokens
+        return sorted(selected, key=lambda section: (self.documents.index(section.document), section.position))
+
+    def render(self, selected):
+        """
+        Rebuild each document from its selected sections
+
+        Headings of enclosing sections that were not selected are kept (as
+        bare headings) so every excerpt stays under its original context.
+
+        Returns:
+            dict: {document: text}
+        """
+        rendered = {name: [] for name in self.documents}
+        emitted = {name: set() for name in self.documents}
+        for section in selected:
+            lines = rendered[section.document]
+            for depth, title in enumerate(section.path):
+                if title not in emitted[section.document]:
+                    ancestor = next(
+                        (s for s in self.sections if s.document == section.document and s.heading == title),
+                        None
+                    )
+                    level = ancestor.level if ancestor else depth + 1
+                    lines.append(f"{'#' * level} {title}")
+                    emitted[section.document].add(title)
+            lines.append(section.text)
+            emitted[section.document].add(section.heading)
+        return {name: "\n\n".join(lines) for name, lines in rendered.items()}
+
+
+class GuidelineRetriever:
+    """
+    Chooses the guideline text that goes into a generation prompt
+
+    Documents that fit the budget together are passed through unchanged;
+    otherwise the sections most relevant to the instructor prompt (plus
+    GUIDELINE_BASE_QUERY) are selected. The index is rebuilt only when the
+    guideline files change.
+    """
+
+    def __init__(self, enabled=GUIDELINE_RETRIEVAL_ENABLED, budget_tokens=GUIDELINE_TOKEN_BUDGET,
+                 base_query=GUIDELINE_BASE_QUERY):
+        self.enabled = enabled
+        self.budget_tokens = budget_tokens
+        self.base_query = base_query
+        self._lock = threading.Lock()
+        self._index = None
+        self._index_hash = None
+
+    def _get_index(self, documents):
+        digest = hash_prompt_files(*documents.keys(), *documents.values())
+        with self._lock:
+            if self._index_hash != digest:
+                self._index = GuidelineIndex(documents)
+                self._index_hash = digest
+            return self._index
+
+    def retrieve(self, instructor_prompt, documents):
+        """
+        Args:
+            documents: {name: full markdown text}, e.g. curriculum and pedagogy
+
+        Returns:
+            tuple: ({name: text to put in the prompt}, stats dict)
+        """
+        full_tokens = sum(estimate_tokens(text) for text in documents.values())
+        stats = {"mode": "full", "tokens": full_tokens, "full_tokens": full_tokens}
+        if not self.enabled:
+            stats["mode"] = "disabled"
+            return dict(documents), stats
+        if full_tokens <= self.budget_tokens:
+            return dict(documents), stats
+
+        index = self._get_index(documents)
+        selected = index.select(f"{instructor_prompt}\n{self.base_query}", self.budget_tokens)
+        rendered = index.render(selected)
+        tokens = sum(estimate_tokens(text) for text in rendered.values())
+        stats = {
+            "mode": "retrieved",
+            "tokens": tokens,
+            "full_tokens": full_tokens,
+            "sections": len(selected),
+            "total_sections": len(index.sections),
+            "headings": [section.heading for section in selected]
+        }
+        metrics.observe("guideline_prompt_tokens", tokens)
+        metrics.increment("guideline_tokens_saved_total", full_tokens - tokens)
+        return rendered, stats
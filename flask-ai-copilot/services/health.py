@@ -0,0 +1,173 @@
+"""
+Provider Health Service
+Background provider warm-up, periodic cached health probes and readiness
+"""
+
+import os
+import time
+import threading
+
+from services.metrics import metrics
+from services.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+HEALTH_WARMUP_ENABLED = os.getenv("HEALTH_WARMUP_ENABLED", "true").lower() == "true"
+# Seconds between background probes of the configured model
+HEALTH_PROBE_INTERVAL_S = float(os.getenv("HEALTH_PROBE_INTERVAL_S", "60"))
+# Seconds between warm-up retries while the provider is unreachable
+HEALTH_WARMUP_RETRY_S = float(os.getenv("HEALTH_WARMUP_RETRY_S", "5"))
+# Consecutive failed probes before an instance reports not ready again
+HEALTH_FAILURE_THRESHOLD = int(os.getenv("HEALTH_FAILURE_THRESHOLD", "3"))
+
+
+class ProviderHealth:
+    """
+    Keeps the provider connection warm and caches the last ping result
+
+    Warm-up pings every model in the generator's cascade once (opening the
+    HTTP connection pool and waking cold models), then the configured model is
+    probed every HEALTH_PROBE_INTERVAL_S. With an endpoint pool, every
+    endpoint is also pinged directly at each step, since a pooled call only
+    reaches one of them. The instance is ready once warm-up has succeeded and
+    stays ready until HEALTH_FAILURE_THRESHOLD probes in a row fail.
+    """
+
+    def __init__(self, generator, enabled=HEALTH_WARMUP_ENABLED, interval_s=HEALTH_PROBE_INTERVAL_S,
+                 retry_s=HEALTH_WARMUP_RETRY_S, failure_threshold=HEALTH_FAILURE_THRESHOLD):
+        self.generator = generator
+        self.enabled = enabled
+        self.interval_s = interval_s
+        self.retry_s = retry_s
+        self.failure_threshold = failure_threshold
+        self._lock = threading.Lock()
+        self._results = {}
+        # Endpoint pool members: base_url -> last probe result
+        self._endpoints = {}
+        # Without warm-up the instance is ready as soon as it starts
+        self._warmed_up = not enabled
+        self._consecutive_failures = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start warm-up and periodic probing on a daemon thread"""
+        if not self.enabled or self.generator is None or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="provider-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def probe(self, model=None):
+        """
+        Ping a model now and cache the result
+
+        Returns:
+            dict: test_llm_call result plus latency_ms and checked_at
+        """
+        model = model or self.generator.model
+        start = time.perf_counter()
+        result = self.generator.test_llm_call(model=model)
+        latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        result = dict(result, latency_ms=latency_ms, checked_at=time.time())
+
+        ok = result.get("status") == "success"
+        metrics.increment("provider_probes_total", model=model, status=result.get("status"))
+        metrics.observe("provider_probe_ms", latency_ms, model=model)
+        with self._lock:
+            self._results[model] = result
+            if model == self.generator.model:
+                self._consecutive_failures = 0 if ok else self._consecutive_failures + 1
+        if not ok:
+            logger.warning("Provider probe failed", extra={"model": model, "error": result.get("error")})
+        return result
+
+    def probe_endpoints(self, model=None):
+        """
+        Ping every endpoint of the generator's pool (if it has one) and cache the results
+
+        Returns:
+            list: Per-endpoint results, empty without a pool
+        """
+        results = self.generator.test_endpoint_calls(model=model)
+        checked_at = time.time()
+        for result in results:
+            metrics.increment("endpoint_probes_total", endpoint=result["base_url"], status=result["status"])
+            if result["status"] != "success":
+                logger.warning("Endpoint probe failed", extra={
+                    "base_url": result["base_url"], "error": result.get("error")
+                })
+        with self._lock:
+            for result in results:
+                self._endpoints[result["base_url"]] = dict(result, checked_at=checked_at)
+        return results
+
+    def _warm_up(self):
+        """Ping every cascade model (and pool endpoint); True once the configured model answered"""
+        for model in self.generator.cascade:
+            self.probe(model)
+        self.probe_endpoints()
+        with self._lock:
+            primary = self._results.get(self.generator.model, {})
+        return primary.get("status") == "success"
+
+    def _run(self):
+        started = time.perf_counter()
+        while not self._stop.is_set():
+            if self._warm_up():
+                break
+            self._stop.wait(self.retry_s)
+        else:
+            return
+
+        with self._lock:
+            self._warmed_up = True
+        logger.info("Provider warm-up complete", extra={
+            "warmup_s": round(time.perf_counter() - started, 3),
+            "models": list(self.generator.cascade)
+        })
+
+        while not self._stop.wait(self.interval_s):
+            self.probe()
+            self.probe_endpoints()
+
+    def cached(self, model=None):
+        """Last probe result for a model (with its age), or None"""
+        model = model or self.generator.model
+        with self._lock:
+            result = self._results.get(model)
+        if result is None:
+            return None
+        return dict(result, cached=True, age_s=round(time.time() - result["checked_at"], 3))
+
+    def readiness(self):
+        """
+        Returns:
+            dict: {"ready": bool, "reason": ..., "models": {model: last result},
+                   "endpoints": {base_url: last result} (empty without an endpoint pool)}
+        """
+        with self._lock:
+            warmed_up = self._warmed_up
+            failures = self._consecutive_failures
+            results = {model: dict(result) for model, result in self._results.items()}
+            endpoints = {url: dict(result) for url, result in self._endpoints.items()}
+
+        if self.generator is None:
+            ready, reason = False, "generator_not_initialized"
+        elif not warmed_up:
+            ready, reason = False, "warming_up"
+        elif failures >= self.failure_threshold:
+            ready, reason = False, "provider_unhealthy"
+        else:
+            ready, reason = True, None
+
+        return {
+            "ready": ready,
+            "reason": reason,
+            "consecutive_failures": failures,
+            "models": results,
+            "endpoints": endpoints
+        }
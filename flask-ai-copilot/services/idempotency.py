@@ -0,0 +1,236 @@
+"""
+Idempotency Service
+Replays in-flight or completed /generate-module responses for repeated Idempotency-Key values
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from services.metrics import metrics
+from services.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+# Seconds a completed response is replayed for its key
+IDEMPOTENCY_TTL_S = float(os.getenv("IDEMPOTENCY_TTL_S", "900"))
+# Completed responses kept at most (oldest are evicted first)
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "256"))
+# Total size of kept response bodies (buffered responses echo every file)
+IDEMPOTENCY_MAX_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BYTES", str(64 * 1024 * 1024)))
+# Longest accepted key
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# Only successful responses are kept; a retry after a failure generates again
+_REPLAYABLE_STATUS = 200
+
+
+class IdempotencyConflict(Exception):
+    """Raised when a key is reused with a different request body"""
+
+    def __init__(self, key):
+        self.key = key
+        super().__init__(f"Idempotency-Key '{key}' was already used with a different request body")
+
+
+def idempotency_key(headers, data):
+    """
+    Key from the Idempotency-Key header or the "idempotency_key" body field
+
+    Returns:
+        str or None: The key, None if the client did not send one
+
+    Raises:
+        ValueError: if the key is too long or not printable ASCII
+    """
+    key = headers.get("Idempotency-Key") or (data or {}).get("idempotency_key")
+    if key is None:
+        return None
+    if not isinstance(key, str):
+        raise ValueError("Idempotency-Key must be a string")
+    key = key.strip()
+    if not key:
+        return None
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH or not all(" " < char < "\x7f" for char in key):
+        raise ValueError(f"Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} printable ASCII characters")
+    return key
+
+
+def idempotency_scope(tenant, api_key=None):
+    """
+    Scope of a request's keys: its tenant, narrowed to the API key
+
+    Unmapped API keys share the scheduler's default tenant, so the key
+    (hashed; never stored raw) keeps their results apart.
+    """
+    if not api_key:
+        return tenant
+    return f"{tenant}:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+def request_fingerprint(data):
+    """Hash of the request body, so a key cannot be replayed for a different prompt"""
+    body = {name: value for name, value in (data or {}).items() if name != "idempotency_key"}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    """One key: the generation that owns it and, once finished, its response"""
+
+    def __init__(self, scope, key, fingerprint, request_id):
+        self.scope = scope
+        self.key = key
+        self.fingerprint = fingerprint
+        self.request_id = request_id
+        self.created_at = time.monotonic()
+        self.completed_at = None
+        self.body = None
+        self.status = None
+        self.headers = {}
+        self.tokens = 0
+        self.done = threading.Event()
+
+    def expired(self, now, ttl):
+        return self.completed_at is not None and now - self.completed_at > ttl
+
+
+class IdempotencyStore:
+    """
+    Bounded store of generation responses by (tenant, Idempotency-Key)
+
+    The first request with a key owns the generation; repeats while it runs
+    wait for it, and repeats after it finished get the stored response until
+    the TTL passes. Keys are scoped per tenant so one tenant cannot read
+    another's results. In-flight entries are never evicted (the scheduler
+    already bounds how many exist); completed ones are evicted oldest first
+    past IDEMPOTENCY_MAX_ENTRIES or IDEMPOTENCY_MAX_BYTES.
+    """
+
+    def __init__(self, ttl_s=IDEMPOTENCY_TTL_S, max_entries=IDEMPOTENCY_MAX_ENTRIES,
+                 max_bytes=IDEMPOTENCY_MAX_BYTES):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # (scope, key) -> _Entry, completed entries in completion order
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def begin(self, scope, key, fingerprint, request_id):
+        """
+        Claim a key or find the request that already holds it
+
+        Args:
+            scope: Tenant the key belongs to
+            key: Idempotency-Key sent by the client
+            fingerprint: request_fingerprint() of the body
+            request_id: Id of the calling request
+
+        Returns:
+            tuple: (entry, owner) - owner is True if the caller must generate
+                   and then call complete()
+
+        Raises:
+            IdempotencyConflict: if the key is held by a different request body
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._entries.get((scope, key))
+            if entry is not None:
+                if entry.fingerprint != fingerprint:
+                    metrics.increment("idempotency_conflicts_total")
+                    raise IdempotencyConflict(key)
+                return entry, False
+            entry = _Entry(scope, key, fingerprint, request_id)
+            self._entries[(scope, key)] = entry
+            return entry, True
+
+    def complete(self, entry, body=None, status=None, headers=None, tokens=0):
+        """
+        Record the owner's response and release waiting requests
+
+        A failed generation (or body None, when the owner raised) is handed to
+        the requests already waiting but not kept, so a later retry starts over.
+        """
+        entry.body = body
+        entry.status = status
+        entry.headers = dict(headers or {})
+        entry.tokens = tokens
+        entry.completed_at = time.monotonic()
+        with self._lock:
+            if self._entries.get((entry.scope, entry.key)) is entry:
+                if status == _REPLAYABLE_STATUS and body is not None:
+                    # Re-insert so the dict stays in completion order for eviction
+                    self._entries.move_to_end((entry.scope, entry.key))
+                    self._bytes += len(body)
+                    self._evict()
+                else:
+                    del self._entries[(entry.scope, entry.key)]
+        entry.done.set()
+
+    def wait(self, entry, timeout=None):
+        """
+        Wait for the owner of an entry to finish
+
+        Returns:
+            bool: False if the timeout passed first
+        """
+        return entry.done.wait(timeout)
+
+    def record_replay(self, entry, in_flight):
+        """Count a request answered from an entry instead of a new generation"""
+        state = "in_flight" if in_flight else "completed"
+        metrics.increment("idempotent_replays_total", state=state)
+        if entry.tokens:
+            metrics.increment("idempotent_tokens_saved_total", entry.tokens)
+        logger.info("Idempotent replay", extra={
+            "idempotency_key": entry.key,
+            "original_request_id": entry.request_id,
+            "state": state
+        })
+
+    def stats(self):
+        with self._lock:
+            in_flight = sum(1 for entry in self._entries.values() if entry.completed_at is None)
+            return {
+                "entries": len(self._entries),
+                "in_flight": in_flight,
+                "completed": len(self._entries) - in_flight,
+                "bytes": self._bytes,
+                "ttl_s": self.ttl_s,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict(
+                (name, entry) for name, entry in self._entries.items() if entry.completed_at is None
+            )
+            self._bytes = 0
+
+    def _completed(self):
+        return [name for name, entry in self._entries.items() if entry.completed_at is not None]
+
+    def _drop(self, name):
+        entry = self._entries.pop(name)
+        self._bytes -= len(entry.body)
+
+    def _expire(self, now):
+        for name in self._completed():
+            if self._entries[name].expired(now, self.ttl_s):
+                self._drop(name)
+
+    def _evict(self):
+        completed = self._completed()
+        while completed and (len(completed) > self.max_entries or self._bytes > self.max_bytes):
+            self._drop(completed.pop(0))
+            metrics.increment("idempotency_evictions_total")
+
+
+# Shared store used by /generate-module
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,319 @@
+"""
+JSON Parsing Helpers
+Parse LLM response bodies; module-level so they can run in the offload pool
+"""
+
+import re
+import json
+
+
+def extract_json(text):
+    """Extract JSON from text using regex to find first { and last }"""
+    try:
+        # Try to find JSON object boundaries
+        first_brace = text.find('{')
+        last_brace = text.rfind('}')
+        
+        if first_brace != -1 and last_brace != -1 and last_brace > first_brace:
+            json_text = text[first_brace:last_brace + 1]
+            # Remove markdown code blocks if present
+            if "```json" in json_text:
+                json_text = json_text.split("```json")[1].split("```")[0].strip()
+            elif "```" in json_text:
+                json_text = json_text.split("```")[1].split("```")[0].strip()
+            return json.loads(json_text)
+        else:
+            raise ValueError("No JSON object found in response")
+    except Exception as e:
+        raise Exception(f"Failed to extract JSON: {e}")
+
+
+def parse_json_response(content):
+    """
+    Parse a JSON response body, falling back to extraction
+    
+    Returns:
+        tuple: (parsed data, True if extraction was needed)
+    """
+    try:
+        return json.loads(content), False
+    except json.JSONDecodeError:
+        return extract_json(content), True
+
+
+_DECODER = json.JSONDecoder()
+
+
+def _skip(text, index, chars=" \t\r\n,"):
+    while index < len(text) and text[index] in chars:
+        index += 1
+    return index
+
+
+def _decode_string_field(text, name):
+    """Value of the first "name": "..." string field, or None if absent or cut off"""
+    marker = text.find(f'"{name}"')
+    if marker == -1:
+        return None
+    index = _skip(text, marker + len(name) + 2, " \t\r\n")
+    if index >= len(text) or text[index] != ":":
+        return None
+    try:
+        value, _ = _DECODER.raw_decode(text, _skip(text, index + 1, " \t\r\n"))
+    except ValueError:
+        return None
+    return value if isinstance(value, str) else None
+
+
+def salvage_truncated_module(text):
+    """
+    Recover the complete files of a module response that was cut off mid-JSON
+
+    Works for both the {"path": "content"} and the [{"path", "content"}]
+    forms of "files"; the file being written when the output stopped is
+    dropped.
+
+    Returns:
+        dict or None: {"module_name": str or None, "files": {path: content}},
+            or None if no "files" field was started
+    """
+    marker = text.find('"files"')
+    if marker == -1:
+        return None
+    index = _skip(text, marker + len('"files"'), " \t\r\n")
+    if index >= len(text) or text[index] != ":":
+        return None
+    index = _skip(text, index + 1, " \t\r\n")
+    if index >= len(text) or text[index] not in "{[":
+        return None
+
+    files = {}
+    if text[index] == "{":
+        index += 1
+        while True:
+            index = _skip(text, index)
+            if index >= len(text) or text[index] != '"':
+                break
+            try:
+                path, index = _DECODER.raw_decode(text, index)
+                index = _skip(text, index, " \t\r\n")
+                if index >= len(text) or text[index] != ":":
+                    break
+                content, index = _DECODER.raw_decode(text, _skip(text, index + 1, " \t\r\n"))
+            except ValueError:
+                break
+            files[path] = content
+    else:
+        index += 1
+        while True:
+            index = _skip(text, index)
+            if index >= len(text) or text[index] != "{":
+                break
+            try:
+                entry, index = _DECODER.raw_decode(text, index)
+            except ValueError:
+                break
+            if isinstance(entry, dict) and isinstance(entry.get("path"), str):
+                files[entry["path"]] = entry.get("content")
+
+    return {"module_name": _decode_string_field(text, "module_name"), "files": files}
+
+
+_STRING_RUN = re.compile(r'[^"\\]+')
+_LITERAL_RUN = re.compile(r"[-+.0-9a-zA-Z]+")
+_WHITESPACE = " \t\r\n"
+
+
+class ModuleStreamParser:
+    """
+    Incremental parser for a module response that arrives in chunks
+
+    feed() returns the events completed by each chunk: ("module_name", name)
+    and ("file", path, content), the latter as soon as a file's content is
+    complete, for both the {"path": "content"} and the [{"path", "content"}]
+    forms of "files" (non-string content comes out as None). Only the string
+    being read is held in memory; strings no event needs are skipped
+    without being kept. Text around the JSON object (e.g. a markdown fence)
+    is ignored.
+
+    After the last chunk, done is False if the object was cut off; the
+    files already emitted are complete.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._offset = 0
+        # Open containers: [kind, current key, role]
+        self._stack = []
+        self._state = "start"
+        self._role = None
+        # Raw pieces of the string being read (None while a string is skipped)
+        self._parts = None
+        # {"path", "content"} of the "files" array entry being read
+        self._item = None
+        self.started = False
+        self.done = False
+
+    def _error(self, index):
+        raise ValueError(f"Invalid JSON in streamed response at character {self._offset + index}")
+
+    def _value_role(self):
+        """What the value about to be read is (None for values nobody needs)"""
+        depth = len(self._stack)
+        if depth == 1 and self._stack[0][1] == "module_name":
+            return "module_name"
+        if depth < 2 or self._stack[0][1] != "files":
+            return None
+        if depth == 2:
+            return "file" if self._stack[1][0] == "object" else "item"
+        if depth == 3 and self._stack[1][0] == "array" and self._stack[2][1] in ("path", "content"):
+            return "item_" + self._stack[2][1]
+        return None
+
+    def _value_done(self, role, value, events):
+        if role == "module_name":
+            if isinstance(value, str):
+                events.append(("module_name", value))
+        elif role == "file":
+            events.append(("file", self._stack[-1][1], value if isinstance(value, str) else None))
+        elif role in ("item_path", "item_content") and self._item is not None:
+            self._item[role[5:]] = value if isinstance(value, str) else None
+        self._state = "after_value"
+
+    def _open(self, kind):
+        role = self._value_role()
+        if role == "item" and kind == "object":
+            self._item = {}
+        self._stack.append([kind, None, role])
+        self._state = "key_or_end" if kind == "object" else "value_or_end"
+
+    def _close(self, kind, index, events):
+        if not self._stack or self._stack[-1][0] != kind:
+            self._error(index)
+        _, _, role = self._stack.pop()
+        if not self._stack:
+            self.done = True
+            self._state = "done"
+            return
+        if role == "item":
+            item, self._item = self._item, None
+            if item and isinstance(item.get("path"), str) and item["path"]:
+                events.append(("file", item["path"], item.get("content")))
+            self._state = "after_value"
+        else:
+            # An object or array where a string was expected
+            self._value_done(role, None, events)
+
+    def feed(self, chunk):
+        """
+        Parse the next chunk of the response
+
+        Returns:
+            list: Events completed by this chunk
+
+        Raises:
+            ValueError: if the response is not valid JSON
+        """
+        events = []
+        text = self._buffer + chunk
+        index = 0
+        length = len(text)
+        while index < length and not self.done:
+            state = self._state
+            if state == "string":
+                match = _STRING_RUN.match(text, index)
+                if match:
+                    if self._parts is not None:
+                        self._parts.append(match.group())
+                    index = match.end()
+                    if index >= length:
+                        break
+                char = text[index]
+                if char == "\\":
+                    # Keep an escape split across chunks for the next one
+                    if index + 1 >= length:
+                        break
+                    if self._parts is not None:
+                        self._parts.append(text[index:index + 2])
+                    index += 2
+                    continue
+                index += 1
+                raw, self._parts = self._parts, None
+                role = self._role
+                value = json.loads('"' + "".join(raw) + '"', strict=False) if raw is not None else None
+                if role == "key":
+                    self._stack[-1][1] = value
+                    self._state = "colon"
+                else:
+                    self._value_done(role, value, events)
+                continue
+
+            char = text[index]
+            if char in _WHITESPACE:
+                index += 1
+                continue
+
+            if state == "start":
+                start = text.find("{", index)
+                if start == -1:
+                    index = length
+                    break
+                self.started = True
+                self._open("object")
+                index = start + 1
+            elif state in ("key_or_end", "key"):
+                if char == "}" and state == "key_or_end":
+                    self._close("object", index, events)
+                elif char == '"':
+                    self._role = "key"
+                    self._parts = []
+                    self._state = "string"
+                else:
+                    self._error(index)
+                index += 1
+            elif state == "colon":
+                if char != ":":
+                    self._error(index)
+                self._state = "value"
+                index += 1
+            elif state in ("value", "value_or_end"):
+                if char == "]" and state == "value_or_end":
+                    self._close("array", index, events)
+                    index += 1
+                elif char == '"':
+                    self._role = self._value_role()
+                    self._parts = [] if self._role else None
+                    self._state = "string"
+                    index += 1
+                elif char in "{[":
+                    self._open("object" if char == "{" else "array")
+                    index += 1
+                else:
+                    match = _LITERAL_RUN.match(text, index)
+                    if not match:
+                        self._error(index)
+                    if match.end() >= length:
+                        # The literal may continue in the next chunk
+                        break
+                    try:
+                        value = json.loads(match.group())
+                    except ValueError:
+                        self._error(index)
+                    self._value_done(self._value_role(), value, events)
+                    index = match.end()
+            elif state == "after_value":
+                kind = self._stack[-1][0]
+                if char == ",":
+                    self._state = "key" if kind == "object" else "value"
+                elif char in "}]":
+                    self._close("object" if char == "}" else "array", index, events)
+                else:
+                    self._error(index)
+                index += 1
+
+        if self.done:
+            self._buffer = ""
+        else:
+            self._buffer = text[index:]
+            self._offset += index
+        return events
@@ -0,0 +1,68 @@
+"""
+Metrics Service
+Thread-safe in-process counters and value summaries
+"""
+
+import time
+import threading
+
+
+def _key(name, labels):
+    if not labels:
+        return name
+    label_text = ",".join(f"{key}={labels[key]}" for key in sorted(labels))
+    return f"{name}{{{label_text}}}"
+
+
+class Metrics:
+    """Registry of counters and summaries exposed through /metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._summaries = {}
+        self._started_at = time.time()
+
+    def increment(self, name, value=1, **labels):
+        """Add value to a counter"""
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Record one observation (latency, size, ...) in a summary"""
+        key = _key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = {"count": 1, "sum": value, "min": value, "max": value}
+            else:
+                summary["count"] += 1
+                summary["sum"] += value
+                summary["min"] = min(summary["min"], value)
+                summary["max"] = max(summary["max"], value)
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def snapshot(self):
+        """Return a copy of all metrics"""
+        with self._lock:
+            summaries = {}
+            for key, summary in self._summaries.items():
+                summaries[key] = dict(summary, mean=summary["sum"] / summary["count"])
+            return {
+                "uptime_s": round(time.time() - self._started_at, 3),
+                "counters": dict(self._counters),
+                "summaries": summaries
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+
+# Shared registry used by the app and services
+metrics = Metrics()
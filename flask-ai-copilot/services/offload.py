@@ -0,0 +1,148 @@
+"""
+Offload Service
+Runs CPU-bound stages (ZIP compression, JSON parsing, tree rendering) in a process pool
+"""
+
+import os
+import time
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from services.metrics import metrics
+from services.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+OFFLOAD_ENABLED = os.getenv("OFFLOAD_ENABLED", "true").lower() == "true"
+# Worker processes (0 = one per CPU core)
+OFFLOAD_WORKERS = int(os.getenv("OFFLOAD_WORKERS", "0"))
+# Inputs smaller than this run inline; process round-trips cost more than they save
+OFFLOAD_MIN_BYTES = int(os.getenv("OFFLOAD_MIN_BYTES", str(512 * 1024)))
+# Inputs larger than this run inline to avoid pickling huge payloads across processes
+OFFLOAD_MAX_BYTES = int(os.getenv("OFFLOAD_MAX_BYTES", str(256 * 1024 * 1024)))
+# Tasks queued or running in the pool before new ones fall back to inline (0 = 4 per worker)
+OFFLOAD_MAX_PENDING = int(os.getenv("OFFLOAD_MAX_PENDING", "0"))
+# forkserver where available, else spawn; "fork" is faster to start but copies locks held by other threads
+OFFLOAD_START_METHOD = os.getenv("OFFLOAD_START_METHOD", "")
+
+# Modules with the offloaded functions, imported once by the fork server
+OFFLOAD_PRELOAD = ["services.json_parsing", "services.zipper", "services.file_tree"]
+
+
+class OffloadPool:
+    """
+    Lazily started process pool with inline fallback
+
+    Functions passed to run() must be importable module-level functions whose
+    arguments and results pickle cheaply (paths, strings, plain dicts).
+
+    Workers are started by a fork server (a fresh single-threaded process),
+    never by forking the threaded app process. Like spawn, it re-imports the
+    main module in every worker, so the app is started through server.py,
+    whose import does nothing.
+    """
+
+    def __init__(self, workers=OFFLOAD_WORKERS, enabled=OFFLOAD_ENABLED, min_bytes=OFFLOAD_MIN_BYTES,
+                 max_bytes=OFFLOAD_MAX_BYTES, max_pending=OFFLOAD_MAX_PENDING, start_method=OFFLOAD_START_METHOD):
+        self.workers = workers or os.cpu_count() or 1
+        if not start_method:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.start_method = start_method
+        self.enabled = enabled
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.max_pending = max_pending or self.workers * 4
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context(self.start_method)
+                if self.start_method == "forkserver":
+                    # Workers fork from a server that already imported the task modules
+                    context.set_forkserver_preload(OFFLOAD_PRELOAD)
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                logger.info("Offload pool started", extra={"workers": self.workers, "start_method": self.start_method})
+            return self._executor
+
+    def _should_offload(self, size):
+        if not self.enabled or size < self.min_bytes or size > self.max_bytes:
+            return False
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return False
+            self._pending += 1
+            return True
+
+    def run(self, func, *args, size=0, stage="task"):
+        """
+        Run func(*args) in the pool, or inline when offloading does not pay off
+
+        Args:
+            func: Module-level function
+            size: Approximate input size in bytes, used for the inline threshold
+            stage: Name used in metrics
+
+        Returns:
+            Whatever func returns
+        """
+        start = time.perf_counter()
+        if not self._should_offload(size):
+            result = func(*args)
+            self._record(stage, "inline", start)
+            return result
+
+        try:
+            result = self._get_executor().submit(func, *args).result()
+            mode = "pool"
+        except BrokenProcessPool as e:
+            # A worker died (e.g. OOM-killed) or could not start; errors raised
+            # by func itself propagate unchanged
+            logger.warning("Offload pool broken, running inline", extra={"stage": stage, "error": str(e)})
+            self._reset()
+            result = func(*args)
+            mode = "inline"
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+        self._record(stage, mode, start)
+        return result
+
+    def _record(self, stage, mode, start):
+        metrics.increment("offload_tasks_total", stage=stage, mode=mode)
+        metrics.observe("offload_ms", (time.perf_counter() - start) * 1000, stage=stage, mode=mode)
+
+    def _reset(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "workers": self.workers,
+                "started": self._executor is not None,
+                "start_method": self.start_method,
+                "pending": self._pending,
+                "min_bytes": self.min_bytes
+            }
+
+
+# Shared pool for the app and services
+offload_pool = OffloadPool()
+atexit.register(offload_pool.shutdown)
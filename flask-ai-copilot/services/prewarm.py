@@ -0,0 +1,427 @@
+"""
+Prewarm Service
+Request history, off-peak pre-generation of popular prompts and cache hit rates by period
+"""
+
+import os
+import json
+import time
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from services.metrics import metrics
+from services.similarity import canonicalize
+from services.scheduler import generation_cost
+from services.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "false").lower() == "true"
+# Local-time windows in which modules are pre-generated, e.g. "01:00-05:00,22:30-23:30"
+PREWARM_WINDOWS = os.getenv("PREWARM_WINDOWS", "01:00-05:00")
+# Local-time windows whose cache hit rate is reported as "peak" (everything else is "off_peak")
+PEAK_WINDOWS = os.getenv("PEAK_WINDOWS", "08:00-18:00")
+# Tokens prewarming may spend per off-peak window
+PREWARM_TOKEN_BUDGET = int(os.getenv("PREWARM_TOKEN_BUDGET", "200000"))
+# Prompts considered per window (configured prompts first, then the most popular from history)
+PREWARM_MAX_PROMPTS = int(os.getenv("PREWARM_MAX_PROMPTS", "20"))
+# Prompts always kept warm, separated by "|" (prompts themselves contain commas)
+PREWARM_PROMPTS = os.getenv("PREWARM_PROMPTS", "")
+# Seconds between checks for an open window
+PREWARM_CHECK_INTERVAL_S = float(os.getenv("PREWARM_CHECK_INTERVAL_S", "60"))
+# Requests older than this are forgotten; a request's weight halves every PREWARM_HALF_LIFE_H
+PREWARM_HISTORY_DAYS = float(os.getenv("PREWARM_HISTORY_DAYS", "14"))
+PREWARM_HALF_LIFE_H = float(os.getenv("PREWARM_HALF_LIFE_H", "48"))
+# Requests kept in the history file
+PREWARM_HISTORY_MAX_ENTRIES = int(os.getenv("PREWARM_HISTORY_MAX_ENTRIES", "10000"))
+PREWARM_HISTORY_FILE = os.getenv("PREWARM_HISTORY_FILE", os.path.join("cache", "request_history.jsonl"))
+
+
+def parse_windows(text):
+    """
+    Parse "HH:MM-HH:MM" windows separated by commas
+
+    A window whose end is before its start wraps past midnight.
+
+    Returns:
+        list: (start_minute, end_minute) pairs
+
+    Raises:
+        ValueError: if a window is malformed
+    """
+    windows = []
+    for item in (text or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            start, end = (datetime.strptime(part.strip(), "%H:%M") for part in item.split("-"))
+        except ValueError:
+            raise ValueError(f"Invalid time window '{item}' (expected HH:MM-HH:MM)")
+        windows.append((start.hour * 60 + start.minute, end.hour * 60 + end.minute))
+    return windows
+
+
+def window_start(now, windows):
+    """
+    Start of the window containing a local time
+
+    Args:
+        now: datetime
+        windows: parse_windows() result
+
+    Returns:
+        datetime or None: When the open window started, None outside all windows
+    """
+    minute = now.hour * 60 + now.minute
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    for start, end in windows:
+        if start <= end:
+            if start <= minute < end:
+                return midnight + timedelta(minutes=start)
+        elif minute >= start:
+            return midnight + timedelta(minutes=start)
+        elif minute < end:
+            return midnight - timedelta(days=1) + timedelta(minutes=start)
+    return None
+
+
+def _peak_windows():
+    try:
+        return parse_windows(PEAK_WINDOWS)
+    except ValueError as e:
+        logger.warning("Ignoring PEAK_WINDOWS", extra={"error": str(e)})
+        return []
+
+
+_PEAK = _peak_windows()
+
+
+def traffic_period(now=None):
+    """Traffic period of a local time: peak inside PEAK_WINDOWS, otherwise off_peak"""
+    return "peak" if window_start(now or datetime.now(), _PEAK) else "off_peak"
+
+
+def record_cache_lookup(hit, prewarmed=False):
+    """Count one module cache lookup of a /generate-module request by traffic period"""
+    period = traffic_period()
+    metrics.increment("module_cache_lookups_total", period=period, result="hit" if hit else "miss")
+    if hit and prewarmed:
+        metrics.increment("module_cache_prewarmed_hits_total", period=period)
+
+
+def cache_hit_rates():
+    """
+    Module cache hit rate per traffic period since startup
+
+    Returns:
+        dict: {period: {"lookups", "hits", "prewarmed_hits", "hit_rate"}}
+    """
+    rates = {}
+    for period in ("peak", "off_peak"):
+        hits = metrics.counter("module_cache_lookups_total", period=period, result="hit")
+        misses = metrics.counter("module_cache_lookups_total", period=period, result="miss")
+        lookups = hits + misses
+        rates[period] = {
+            "lookups": lookups,
+            "hits": hits,
+            "prewarmed_hits": metrics.counter("module_cache_prewarmed_hits_total", period=period),
+            "hit_rate": round(hits / lookups, 4) if lookups else None
+        }
+    return rates
+
+
+class RequestHistory:
+    """
+    Instructor prompts received by /generate-module, appended to a JSONL file
+
+    record() only buffers the request in memory, keeping disk I/O off the
+    request path; flush() (run by the prewarmer's thread and at exit) appends
+    the buffer to the file.
+
+    Popularity groups prompts by canonical form (topic, level, days), so
+    rephrasings of one request count together; each request's weight decays
+    with age, so both frequent and recent prompts rank high.
+    """
+
+    def __init__(self, path=PREWARM_HISTORY_FILE, max_entries=PREWARM_HISTORY_MAX_ENTRIES,
+                 max_age_s=PREWARM_HISTORY_DAYS * 86400, half_life_s=PREWARM_HALF_LIFE_H * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_s = max_age_s
+        self.half_life_s = half_life_s
+        self._lock = threading.Lock()
+        # Serializes writers of the file; never held by record()
+        self._flush_lock = threading.Lock()
+        self._entries = []
+        # Recorded but not yet written to the file
+        self._pending = []
+        self._appended = 0
+        self._load()
+
+    def record(self, instructor_prompt, tenant=None):
+        entry = {"instructor_prompt": instructor_prompt, "tenant": tenant, "at": time.time()}
+        with self._lock:
+            self._entries.append(entry)
+            self._pending.append(entry)
+
+    def flush(self):
+        """Append buffered requests to the history file, compacting it when due"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._appended += len(pending)
+                # Rewrite the file once max_entries lines were appended past the limit
+                compact = len(self._entries) > self.max_entries and self._appended >= self.max_entries
+                if compact:
+                    self._entries = self._entries[-self.max_entries:]
+                    kept = list(self._entries)
+            if compact:
+                if self._compact(kept):
+                    with self._lock:
+                        self._appended = 0
+                return
+            if not pending:
+                return
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(entry) + "\n" for entry in pending))
+            except OSError as e:
+                logger.warning("Could not append to request history", extra={"error": str(e)})
+
+    def popular(self, limit=PREWARM_MAX_PROMPTS, now=None):
+        """
+        Most requested prompts, weighted by recency
+
+        Returns:
+            list: {"instructor_prompt" (the latest wording), "requests",
+                   "score", "last_requested_at"}, highest score first
+        """
+        now = now or time.time()
+        with self._lock:
+            entries = list(self._entries)
+
+        groups = {}
+        for entry in entries:
+            age = now - entry["at"]
+            if age > self.max_age_s:
+                continue
+            key = canonicalize(entry["instructor_prompt"])["key"]
+            group = groups.setdefault(key, {"requests": 0, "score": 0.0, "last_requested_at": 0})
+            group["requests"] += 1
+            group["score"] += 0.5 ** (max(age, 0) / self.half_life_s)
+            if entry["at"] >= group["last_requested_at"]:
+                group["last_requested_at"] = entry["at"]
+                group["instructor_prompt"] = entry["instructor_prompt"]
+
+        ranked = sorted(groups.values(), key=lambda group: (-group["score"], -group["last_requested_at"]))
+        return [dict(group, score=round(group["score"], 3)) for group in ranked[:limit]]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            return
+        cutoff = time.time() - self.max_age_s
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and entry.get("instructor_prompt") and entry.get("at", 0) >= cutoff:
+                    self._entries.append(entry)
+        self._entries = self._entries[-self.max_entries:]
+
+    def _compact(self, entries):
+        """Rewrite the history file with only the kept entries; False if that failed"""
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(tmp_path, self.path)
+            return True
+        except OSError as e:
+            logger.warning("Could not compact request history", extra={"error": str(e)})
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+
+class Prewarmer:
+    """
+    Pre-generates popular modules during off-peak windows
+
+    Once per PREWARM_CHECK_INTERVAL_S, inside a PREWARM_WINDOWS window, the
+    configured prompts and the most popular prompts from the request history
+    are generated in order, skipping any that already have a reusable
+    module, until the window closes or the window's PREWARM_TOKEN_BUDGET
+    would be exceeded. Each prompt is tried at most once per window.
+    """
+
+    def __init__(self, generate, is_cached, history, enabled=PREWARM_ENABLED, windows=PREWARM_WINDOWS,
+                 token_budget=PREWARM_TOKEN_BUDGET, max_prompts=PREWARM_MAX_PROMPTS,
+                 prompts=PREWARM_PROMPTS, interval_s=PREWARM_CHECK_INTERVAL_S):
+        """
+        Args:
+            generate: Called with an instructor prompt; returns the /generate-module response body
+            is_cached: Called with an instructor prompt; True if a reusable module exists
+            history: RequestHistory to rank prompts from
+        """
+        self.generate = generate
+        self.is_cached = is_cached
+        self.history = history
+        self.enabled = enabled
+        self.windows = parse_windows(windows)
+        self.token_budget = token_budget
+        self.max_prompts = max_prompts
+        self.prompts = [prompt.strip() for prompt in prompts.split("|") if prompt.strip()]
+        self.interval_s = interval_s
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._forced = False
+        self._window = None
+        self._spent = 0
+        self._attempted = set()
+        self._last_run = None
+
+    def start(self):
+        """
+        Start the scheduler on a daemon thread
+
+        The thread also flushes the request history, so it runs even when
+        prewarming is disabled (it then never generates anything).
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="prewarm", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def trigger(self):
+        """Run one pass now, outside the windows, with a fresh token budget"""
+        with self._lock:
+            self._forced = True
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="prewarm", daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def candidates(self):
+        """Prompts to keep warm: configured ones, then popular ones from history (one per canonical form)"""
+        seen = set()
+        result = []
+        ranked = self.prompts + [group["instructor_prompt"] for group in self.history.popular(self.max_prompts)]
+        for prompt in ranked:
+            key = canonicalize(prompt)["key"]
+            if key in seen:
+                continue
+            seen.add(key)
+            result.append(prompt)
+        return result[:max(self.max_prompts, len(self.prompts))]
+
+    def run_pass(self, window=None):
+        """
+        Generate uncached candidates within the remaining budget
+
+        Args:
+            window: Start of the window this pass belongs to (None for a forced pass)
+
+        Returns:
+            dict: Counts of generated, cached, skipped and failed prompts
+        """
+        with self._lock:
+            if window is None or window != self._window:
+                # New window (or forced pass): fresh budget, every prompt eligible again
+                self._window = window
+                self._spent = 0
+                self._attempted = set()
+
+        summary = {"generated": 0, "cached": 0, "failed": 0, "over_budget": 0, "tokens": 0}
+        for prompt in self.candidates():
+            if self._stop.is_set() or (window is not None and self._open_window() != window):
+                break
+            key = canonicalize(prompt)["key"]
+            with self._lock:
+                if key in self._attempted:
+                    continue
+            if self.is_cached(prompt):
+                summary["cached"] += 1
+                continue
+            estimate = generation_cost(prompt)
+            with self._lock:
+                if self._spent + estimate > self.token_budget:
+                    summary["over_budget"] += 1
+                    continue
+                self._attempted.add(key)
+
+            start = time.perf_counter()
+            try:
+                result = self.generate(prompt)
+            except Exception as e:
+                summary["failed"] += 1
+                metrics.increment("prewarm_generations_total", status="error")
+                logger.warning("Prewarm generation failed", extra={"instructor_prompt": prompt, "error": str(e)})
+                continue
+            tokens = (result.get("usage") or {}).get("total_tokens") or estimate
+            with self._lock:
+                self._spent += tokens
+            summary["generated"] += 1
+            summary["tokens"] += tokens
+            metrics.increment("prewarm_generations_total", status="success")
+            metrics.increment("prewarm_tokens_total", tokens)
+            logger.info("Prewarmed module", extra={
+                "instructor_prompt": prompt,
+                "module_name": result.get("module_name"),
+                "tokens": tokens,
+                "duration_s": round(time.perf_counter() - start, 3)
+            })
+
+        with self._lock:
+            self._last_run = dict(summary, finished_at=time.time(), forced=window is None)
+        return summary
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "windows": PREWARM_WINDOWS,
+                "window_open": self._open_window() is not None,
+                "token_budget": self.token_budget,
+                "tokens_spent_in_window": self._spent,
+                "last_run": dict(self._last_run) if self._last_run else None,
+                "history_entries": len(self.history),
+                "cache_hit_rate": cache_hit_rates()
+            }
+
+    def _open_window(self):
+        return window_start(datetime.now(), self.windows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.history.flush()
+            except Exception:
+                logger.exception("Request history flush failed")
+            with self._lock:
+                forced, self._forced = self._forced, False
+            window = self._open_window()
+            if forced or (self.enabled and window is not None):
+                try:
+                    self.run_pass(None if forced else window)
+                except Exception:
+                    logger.exception("Prewarm pass failed")
+            self._wake.wait(self.interval_s)
+            self._wake.clear()
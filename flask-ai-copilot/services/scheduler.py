@@ -0,0 +1,358 @@
+"""
+Scheduler Service
+Weighted fair queuing of generations across tenants and priority classes
+"""
+
+import os
+import time
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from services.metrics import metrics
+from services.structured_logging import get_logger
+from services.tokens import parse_prompt_shape, DEFAULT_DAYS
+from services.deadline import expected_output_tokens
+from services.cancellation import GenerationCancelled, DeadlineExceeded, CANCEL_POLL_INTERVAL_S
+
+logger = get_logger(__name__)
+
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+# Generations running at once across all tenants
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", "4"))
+# Generations running at once for a single identified tenant (0 = no cap; never applied to DEFAULT_TENANT)
+SCHEDULER_TENANT_CONCURRENCY = int(os.getenv("SCHEDULER_TENANT_CONCURRENCY", "2"))
+# Slots batch requests may hold at once (0 = all but one, keeping a slot free for interactive work)
+SCHEDULER_BATCH_SLOTS = int(os.getenv("SCHEDULER_BATCH_SLOTS", "0"))
+# Queued requests per tenant before new ones are rejected with 429
+SCHEDULER_MAX_QUEUE = int(os.getenv("SCHEDULER_MAX_QUEUE", "100"))
+# Relative shares, e.g. "curriculum-team=1,instructors=4" (unlisted tenants get 1)
+SCHEDULER_TENANT_WEIGHTS = os.getenv("SCHEDULER_TENANT_WEIGHTS", "")
+# API key to tenant mapping, e.g. "key123:curriculum-team,key456:instructors"
+SCHEDULER_API_KEYS = os.getenv("SCHEDULER_API_KEYS", "")
+# Accept the X-Tenant-Id header (only behind a gateway that sets it; any client could claim a tenant otherwise)
+SCHEDULER_TRUST_TENANT_HEADER = os.getenv("SCHEDULER_TRUST_TENANT_HEADER", "false").lower() == "true"
+# Tenant of requests without an API key (or a trusted X-Tenant-Id)
+DEFAULT_TENANT = os.getenv("SCHEDULER_DEFAULT_TENANT", "default")
+
+PRIORITY_CLASSES = ("interactive", "batch")
+DEFAULT_PRIORITY = "interactive"
+# Metric label of tenants that are not configured (keeps label cardinality bounded)
+OTHER_TENANT_LABEL = "other"
+
+
+class QueueFull(Exception):
+    """Raised when a tenant already has SCHEDULER_MAX_QUEUE requests waiting"""
+
+    def __init__(self, tenant, queued, retry_after_s):
+        self.tenant = tenant
+        self.retry_after_s = retry_after_s
+        super().__init__(f"Tenant '{tenant}' has {queued} generations queued; retry later")
+
+
+def _parse_pairs(text, separator):
+    pairs = {}
+    for item in text.split(","):
+        if separator not in item:
+            continue
+        key, value = item.split(separator, 1)
+        if key.strip() and value.strip():
+            pairs[key.strip()] = value.strip()
+    return pairs
+
+
+def request_api_key(headers):
+    """API key from X-API-Key or Authorization: Bearer, or None"""
+    api_key = headers.get("X-API-Key")
+    authorization = headers.get("Authorization") or ""
+    if not api_key and authorization.lower().startswith("bearer "):
+        api_key = authorization[7:].strip()
+    return api_key or None
+
+
+def resolve_tenant(headers, api_keys=None, trust_header=None):
+    """
+    Tenant of a request: the tenant mapped to its API key, the X-Tenant-Id
+    header (when trusted), or DEFAULT_TENANT
+
+    Keys not in the mapping share DEFAULT_TENANT; a tenant per key would let
+    a client rotating random keys claim a fresh share (and tenant cap) for
+    every request.
+
+    Args:
+        headers: Request headers (X-API-Key, Authorization: Bearer ..., X-Tenant-Id)
+        api_keys: API key to tenant mapping (defaults to SCHEDULER_API_KEYS)
+        trust_header: Accept X-Tenant-Id (defaults to SCHEDULER_TRUST_TENANT_HEADER)
+    """
+    api_keys = _API_KEY_TENANTS if api_keys is None else api_keys
+    trust_header = SCHEDULER_TRUST_TENANT_HEADER if trust_header is None else trust_header
+    api_key = request_api_key(headers)
+    if api_key and api_key in api_keys:
+        return api_keys[api_key]
+    if trust_header:
+        return (headers.get("X-Tenant-Id") or "").strip() or DEFAULT_TENANT
+    return DEFAULT_TENANT
+
+
+def resolve_priority(headers, data):
+    """
+    Priority class from the X-Priority header or the "priority" body field
+
+    Raises:
+        ValueError: if the value is not a known priority class
+    """
+    priority = (headers.get("X-Priority") or data.get("priority") or DEFAULT_PRIORITY).strip().lower()
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"priority must be one of: {', '.join(PRIORITY_CLASSES)}")
+    return priority
+
+
+def generation_cost(instructor_prompt):
+    """Expected output tokens of a prompt, used as its share of capacity"""
+    days, level = parse_prompt_shape(instructor_prompt)
+    return expected_output_tokens(days or DEFAULT_DAYS, level)
+
+
+class _Ticket:
+    """One request waiting for or holding a generation slot"""
+
+    def __init__(self, tenant, priority, cost, start_tag, finish_tag, seq):
+        self.tenant = tenant
+        self.priority = priority
+        self.cost = cost
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.granted_at = None
+        self.granted = threading.Event()
+
+
+class FairScheduler:
+    """
+    Admits generations into a fixed number of slots
+
+    Within a priority class, tenants share slots by start-time fair queuing:
+    each request is tagged with a virtual start time (the later of the class's
+    virtual clock and the tenant's previous finish tag) and a finish tag of
+    start + cost / weight; the waiting request with the smallest start tag
+    whose tenant is under its concurrency cap runs next. Interactive requests
+    always go before batch ones, and batch requests never hold more than
+    batch_slots slots, so a long batch run leaves room for interactive work.
+    The per-tenant cap does not apply to DEFAULT_TENANT, which holds every
+    client that did not identify itself.
+    """
+
+    def __init__(self, concurrency=SCHEDULER_CONCURRENCY, tenant_concurrency=SCHEDULER_TENANT_CONCURRENCY,
+                 batch_slots=SCHEDULER_BATCH_SLOTS, max_queue=SCHEDULER_MAX_QUEUE, weights=None,
+                 enabled=SCHEDULER_ENABLED):
+        self.enabled = enabled
+        self.concurrency = max(1, concurrency)
+        self.tenant_concurrency = tenant_concurrency
+        self.batch_slots = batch_slots or max(1, self.concurrency - 1)
+        self.max_queue = max_queue
+        self.weights = dict(_TENANT_WEIGHTS if weights is None else weights)
+        # Tenants reported under their own name in metrics
+        self.known_tenants = {DEFAULT_TENANT, *self.weights, *_API_KEY_TENANTS.values()}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        # Per priority class: virtual clock, tenant -> last finish tag, tenant -> FIFO of tickets
+        self._virtual = {priority: 0.0 for priority in PRIORITY_CLASSES}
+        self._finish = {priority: {} for priority in PRIORITY_CLASSES}
+        self._queues = {priority: {} for priority in PRIORITY_CLASSES}
+        self._running = {priority: 0 for priority in PRIORITY_CLASSES}
+        self._tenant_running = {}
+
+    def weight(self, tenant):
+        try:
+            return max(float(self.weights.get(tenant, 1)), 0.01)
+        except (TypeError, ValueError):
+            return 1.0
+
+    def tenant_label(self, tenant):
+        """Tenant as a metric label: configured tenants by name, all others as OTHER_TENANT_LABEL"""
+        return tenant if tenant in self.known_tenants else OTHER_TENANT_LABEL
+
+    def acquire(self, tenant, priority=DEFAULT_PRIORITY, cost=1, token=None):
+        """
+        Wait for a generation slot
+
+        Args:
+            tenant: Tenant id (see resolve_tenant)
+            priority: "interactive" or "batch"
+            cost: Expected work (output tokens); larger requests use more of the tenant's share
+            token: CancellationToken; waiting stops when it is cancelled or its deadline passes
+
+        Returns:
+            _Ticket: Pass to release() when the generation is done (None when disabled)
+
+        Raises:
+            QueueFull: if the tenant has max_queue requests waiting
+            GenerationCancelled: if the request is cancelled while queued
+            DeadlineExceeded: if the request's deadline passes while queued
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            queue = self._queues[priority].setdefault(tenant, deque())
+            if self.max_queue and len(queue) >= self.max_queue:
+                metrics.increment("scheduler_rejections_total", reason="queue_full", priority=priority)
+                raise QueueFull(tenant, len(queue), self._retry_after())
+            start_tag = max(self._virtual[priority], self._finish[priority].get(tenant, 0.0))
+            finish_tag = start_tag + max(cost, 1) / self.weight(tenant)
+            self._finish[priority][tenant] = finish_tag
+            ticket = _Ticket(tenant, priority, cost, start_tag, finish_tag, next(self._seq))
+            queue.append(ticket)
+            self._dispatch()
+
+        while not ticket.granted.wait(CANCEL_POLL_INTERVAL_S):
+            if token is None:
+                continue
+            if token.cancelled:
+                self._abandon(ticket, token.reason)
+                raise GenerationCancelled(token.reason, "queued")
+            remaining = token.remaining()
+            if remaining is not None and remaining <= 0:
+                token.cancel("deadline_exceeded")
+                self._abandon(ticket, "deadline_exceeded")
+                raise DeadlineExceeded("queued", token.deadline_s)
+
+        wait_ms = (ticket.granted_at - ticket.enqueued_at) * 1000
+        label = self.tenant_label(tenant)
+        metrics.increment("scheduler_admitted_total", tenant=label, priority=priority)
+        metrics.observe("scheduler_queue_wait_ms", wait_ms, priority=priority)
+        metrics.observe("scheduler_queue_wait_ms", wait_ms, tenant=label, priority=priority)
+        return ticket
+
+    def release(self, ticket):
+        """Free the slot held by ticket and admit the next request"""
+        if ticket is None:
+            return
+        with self._lock:
+            self._running[ticket.priority] -= 1
+            self._tenant_running[ticket.tenant] -= 1
+            if not self._tenant_running[ticket.tenant]:
+                del self._tenant_running[ticket.tenant]
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, tenant, priority=DEFAULT_PRIORITY, cost=1, token=None):
+        """Hold a generation slot for the duration of the block"""
+        ticket = self.acquire(tenant, priority, cost, token)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def _abandon(self, ticket, reason):
+        """Drop a ticket whose request gave up while queued"""
+        with self._lock:
+            if ticket.granted.is_set():
+                # Granted between the last poll and now: hand the slot on
+                self._running[ticket.priority] -= 1
+                self._tenant_running[ticket.tenant] -= 1
+                if not self._tenant_running[ticket.tenant]:
+                    del self._tenant_running[ticket.tenant]
+            else:
+                queue = self._queues[ticket.priority].get(ticket.tenant)
+                if queue is not None and ticket in queue:
+                    self._unqueue(queue, ticket)
+                    if not queue:
+                        del self._queues[ticket.priority][ticket.tenant]
+            self._dispatch()
+        metrics.increment("cancellations_total", reason=reason, stage="queued")
+        metrics.observe("scheduler_abandoned_wait_ms", (time.monotonic() - ticket.enqueued_at) * 1000,
+                        priority=ticket.priority)
+
+    def _unqueue(self, queue, ticket):
+        """
+        Remove a waiting ticket and give back the virtual time it was charged
+
+        The tenant's later tickets were tagged after this one; they move
+        up by its cost (never before the tag the removed ticket started
+        at), and the tenant's finish tag becomes that of its last ticket,
+        so a request that never ran does not count against the tenant.
+        """
+        index = queue.index(ticket)
+        del queue[index]
+        finish = ticket.start_tag
+        for later in list(queue)[index:]:
+            start = max(finish, later.start_tag - (ticket.finish_tag - ticket.start_tag))
+            later.finish_tag = start + (later.finish_tag - later.start_tag)
+            later.start_tag = start
+            finish = later.finish_tag
+        finishes = self._finish[ticket.priority]
+        if finishes.get(ticket.tenant, 0.0) >= ticket.finish_tag:
+            finishes[ticket.tenant] = finish
+
+    def _dispatch(self):
+        """Grant free slots to the next eligible tickets (caller holds the lock)"""
+        while sum(self._running.values()) < self.concurrency:
+            ticket = self._next("interactive")
+            if ticket is None and self._running["batch"] < self.batch_slots:
+                ticket = self._next("batch")
+            if ticket is None:
+                return
+            queue = self._queues[ticket.priority][ticket.tenant]
+            queue.popleft()
+            if not queue:
+                del self._queues[ticket.priority][ticket.tenant]
+            self._virtual[ticket.priority] = max(self._virtual[ticket.priority], ticket.start_tag)
+            self._running[ticket.priority] += 1
+            self._tenant_running[ticket.tenant] = self._tenant_running.get(ticket.tenant, 0) + 1
+            ticket.granted_at = time.monotonic()
+            ticket.granted.set()
+
+    def _next(self, priority):
+        """Head-of-queue ticket with the smallest start tag among tenants under their cap"""
+        best = None
+        for tenant, queue in self._queues[priority].items():
+            if self._at_cap(tenant):
+                continue
+            head = queue[0]
+            if best is None or (head.start_tag, head.seq) < (best.start_tag, best.seq):
+                best = head
+        if best is None and not any(self._queues[priority].values()):
+            # Idle class: forget old finish tags so returning tenants start level
+            self._finish[priority].clear()
+        return best
+
+    def _at_cap(self, tenant):
+        if not self.tenant_concurrency or tenant == DEFAULT_TENANT:
+            return False
+        return self._tenant_running.get(tenant, 0) >= self.tenant_concurrency
+
+    def _retry_after(self):
+        """Rough seconds until a queued request would be admitted"""
+        queued = sum(len(queue) for queues in self._queues.values() for queue in queues.values())
+        return max(1, int(queued / self.concurrency) * 10)
+
+    def stats(self):
+        with self._lock:
+            tenants = {}
+            for priority, queues in self._queues.items():
+                for tenant, queue in queues.items():
+                    tenants.setdefault(tenant, {"running": 0, "queued": {}})["queued"][priority] = len(queue)
+            for tenant, running in self._tenant_running.items():
+                tenants.setdefault(tenant, {"running": 0, "queued": {}})["running"] = running
+            for tenant, entry in tenants.items():
+                entry["weight"] = self.weight(tenant)
+            return {
+                "enabled": self.enabled,
+                "concurrency": self.concurrency,
+                "tenant_concurrency": self.tenant_concurrency or None,
+                "batch_slots": self.batch_slots,
+                "running": dict(self._running),
+                "queued": {priority: sum(len(queue) for queue in queues.values())
+                           for priority, queues in self._queues.items()},
+                "tenants": tenants
+            }
+
+
+_TENANT_WEIGHTS = _parse_pairs(SCHEDULER_TENANT_WEIGHTS, "=")
+_API_KEY_TENANTS = _parse_pairs(SCHEDULER_API_KEYS, ":")
+
+# Shared scheduler in front of every generation in this process
+scheduler = FairScheduler()
@@ -0,0 +1,198 @@
+"""
+Search Index Service
+Full-text search over generated module files using SQLite FTS5
+"""
+
+import os
+import re
+import time
+import sqlite3
+import threading
+
+from services.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+SEARCH_DB_PATH = os.getenv("SEARCH_DB_PATH", os.path.join("cache", "search.db"))
+
+_TERM_PATTERN = re.compile(r"[\w+#-]+", re.UNICODE)
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS module_files USING fts5(
+    module UNINDEXED,
+    path,
+    content,
+    tokenize = 'porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS indexed_modules (
+    name TEXT PRIMARY KEY,
+    file_count INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    indexed_at REAL NOT NULL
+);
+"""
+
+
+def build_match_query(query):
+    """
+    Turn free text into a safe FTS5 MATCH expression
+
+    Every term is quoted (so "Bloom: Analyze" does not parse as a column
+    filter) and all terms must match. A trailing * keeps prefix search.
+    """
+    terms = []
+    for raw in query.split():
+        prefix = raw.endswith("*")
+        for term in _TERM_PATTERN.findall(raw):
+            terms.append(f'"{term}"')
+        if prefix and terms:
+            terms[-1] += "*"
+    return " ".join(terms)
+
+
+class SearchIndex:
+    """Inverted index over every file written by FileBuilder.build_module"""
+
+    def __init__(self, db_path=SEARCH_DB_PATH):
+        # Get the project root directory (parent of services/)
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.db_path = os.path.join(project_root, db_path)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._write_lock:
+            conn = self._connection()
+            conn.executescript(SCHEMA)
+            conn.commit()
+
+    def _connection(self):
+        # One connection per thread; SQLite connections are not shareable
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def index_module(self, module_name, files, mtime=None):
+        """
+        Replace the indexed contents of one module
+
+        Args:
+            module_name: Module directory name
+            files: Mapping of {filepath: content} (files are read one at a
+                   time, so it may be kept on disk)
+            mtime: Directory modification time the index corresponds to
+        """
+        conn = self._connection()
+        rows = ((module_name, path, files[path]) for path in files)
+        with self._write_lock, conn:
+            conn.execute("DELETE FROM module_files WHERE module = ?", (module_name,))
+            conn.executemany("INSERT INTO module_files (module, path, content) VALUES (?, ?, ?)", rows)
+            conn.execute(
+                "INSERT OR REPLACE INTO indexed_modules (name, file_count, mtime, indexed_at) VALUES (?, ?, ?, ?)",
+                (module_name, len(files), mtime or time.time(), time.time())
+            )
+
+    def remove_module(self, module_name):
+        """Drop a module from the index (e.g. after it was deleted)"""
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute("DELETE FROM module_files WHERE module = ?", (module_name,))
+            conn.execute("DELETE FROM indexed_modules WHERE name = ?", (module_name,))
+
+    def search(self, query, limit=20, module=None):
+        """
+        Ranked full-text search
+
+        Args:
+            query: Free-text query
+            limit: Maximum number of file hits
+            module: Restrict results to one module
+
+        Returns:
+            dict: {"files": [...file hits...], "modules": [...per-module totals...]}
+        """
+        match = build_match_query(query)
+        if not match:
+            return {"files": [], "modules": []}
+
+        sql = (
+            "SELECT module, path, bm25(module_files, 0.0, 5.0, 1.0) AS score, "
+            "snippet(module_files, 2, '[', ']', '...', 12) "
+            "FROM module_files WHERE module_files MATCH ?"
+        )
+        params = [match]
+        if module:
+            sql += " AND module = ?"
+            params.append(module)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+
+        rows = self._connection().execute(sql, params).fetchall()
+
+        files = []
+        modules = {}
+        for module_name, path, score, snippet in rows:
+            # bm25() is lower-is-better; flip it so higher means more relevant
+            relevance = round(-score, 4)
+            files.append({"module": module_name, "path": path, "score": relevance, "snippet": snippet})
+            entry = modules.setdefault(module_name, {"module": module_name, "score": 0.0, "hits": 0})
+            entry["score"] = round(entry["score"] + relevance, 4)
+            entry["hits"] += 1
+
+        return {
+            "files": files,
+            "modules": sorted(modules.values(), key=lambda m: m["score"], reverse=True)
+        }
+
+    def sync(self, file_builder):
+        """
+        Bring the index in line with the output directory
+
+        Modules changed since they were indexed are re-indexed and modules
+        no longer on disk are removed.
+
+        Returns:
+            dict: Number of modules indexed and removed
+        """
+        on_disk = {}
+        for item in file_builder.list_modules():
+            path = file_builder.module_path(item)
+            if path is None or not os.path.isdir(path):
+                continue
+            # Each version is a new directory; FILE_TREE.md is its last file written
+            tree_path = os.path.join(path, "FILE_TREE.md")
+            mtime = os.path.getmtime(path)
+            if os.path.exists(tree_path):
+                mtime = max(mtime, os.path.getmtime(tree_path))
+            on_disk[item] = mtime
+
+        indexed = dict(self._connection().execute("SELECT name, mtime FROM indexed_modules").fetchall())
+
+        removed = 0
+        for name in set(indexed) - set(on_disk):
+            self.remove_module(name)
+            removed += 1
+
+        added = 0
+        for name, mtime in on_disk.items():
+            if name in indexed and indexed[name] >= mtime:
+                continue
+            loaded = file_builder.load_module(name)
+            if loaded is None:
+                continue
+            files, _ = loaded
+            self.index_module(name, files, mtime=mtime)
+            added += 1
+
+        logger.info("Search index synced", extra={"indexed": added, "removed": removed})
+        return {"indexed": added, "removed": removed}
+
+    def stats(self):
+        row = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(file_count), 0) FROM indexed_modules"
+        ).fetchone()
+        return {"modules": row[0], "files": row[1]}
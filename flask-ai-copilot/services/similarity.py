@@ -0,0 +1,217 @@
+"""
+Prompt Similarity Service
+Canonicalizes instructor prompts and finds near-duplicate modules with MinHash
+"""
+
+import os
+import re
+import time
+import random
+import hashlib
+import threading
+
+from services.tokens import parse_prompt_shape, LEVEL_MULTIPLIERS, LEVEL_ALIASES
+from services.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+# Estimated Jaccard similarity needed to reuse an existing module
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.8"))
+# MinHash signature size = bands x rows
+MINHASH_BANDS = int(os.getenv("MINHASH_BANDS", "16"))
+MINHASH_ROWS = int(os.getenv("MINHASH_ROWS", "4"))
+
+# Words that describe the request rather than the topic
+STOPWORDS = {
+    "a", "an", "the", "on", "for", "of", "in", "to", "and", "with", "about", "into",
+    "module", "modules", "course", "courses", "class", "workshop", "training", "program",
+    "day", "days", "level", "week", "weeks", "long", "please", "create", "generate",
+    "make", "build", "teach", "teaching", "lesson", "lessons", "crash"
+}
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_WORD_PATTERN = re.compile(r"[a-z0-9+#]+")
+_DAYS_PATTERN = re.compile(r"^\d+$")
+
+
+def canonicalize(instructor_prompt):
+    """
+    Reduce an instructor prompt to topic, level and duration
+
+    "RAG module, intermediate, 5 days" and "5-day intermediate RAG course"
+    both become {"topic": "rag", "level": "intermediate", "days": 5}.
+    """
+    days, level = parse_prompt_shape(instructor_prompt)
+    level_words = set(LEVEL_MULTIPLIERS) | set(LEVEL_ALIASES)
+
+    words = []
+    for word in _WORD_PATTERN.findall((instructor_prompt or "").lower()):
+        if word in STOPWORDS or word in level_words or _DAYS_PATTERN.match(word):
+            continue
+        words.append(word)
+
+    topic = " ".join(words)
+    return {
+        "topic": topic,
+        "level": level,
+        "days": days,
+        "key": f"{topic}|{level or ''}|{days or ''}"
+    }
+
+
+def shingles(topic):
+    """Word tokens plus character trigrams of each word"""
+    result = set()
+    for word in topic.split():
+        result.add(word)
+        padded = f"^{word}$"
+        for i in range(len(padded) - 2):
+            result.add(padded[i:i + 3])
+    return result
+
+
+class MinHasher:
+    """MinHash signatures with a fixed set of hash permutations"""
+
+    def __init__(self, num_perm=MINHASH_BANDS * MINHASH_ROWS, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, items):
+        if not items:
+            return [_MERSENNE_PRIME] * self.num_perm
+        # Stable 64-bit base hashes (the built-in hash() is randomized per process)
+        hashes = [
+            int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big")
+            for item in items
+        ]
+        return [
+            min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+            for a, b in self._perms
+        ]
+
+    @staticmethod
+    def similarity(sig_a, sig_b):
+        """Estimated Jaccard similarity of two signatures"""
+        matches = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+        return matches / len(sig_a)
+
+
+class PromptIndex:
+    """
+    Index of generated modules keyed by canonical prompt
+
+    Candidates are found through LSH banding over MinHash signatures and
+    then filtered by level, duration and estimated similarity.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, bands=MINHASH_BANDS, rows=MINHASH_ROWS):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self.hasher = MinHasher(bands * rows)
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._buckets = {}
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            chunk = tuple(signature[band * self.rows:(band + 1) * self.rows])
+            yield (band, chunk)
+
+    def add(self, module_name, instructor_prompt, created_at=None):
+        """Index a module under its instructor prompt (replaces any previous entry)"""
+        canonical = canonicalize(instructor_prompt)
+        signature = self.hasher.signature(shingles(canonical["topic"]))
+        entry = {
+            "module_name": module_name,
+            "instructor_prompt": instructor_prompt,
+            "canonical": canonical,
+            "signature": signature,
+            "created_at": created_at or time.time()
+        }
+        with self._lock:
+            self._remove_locked(module_name)
+            self._entries[module_name] = entry
+            for key in self._band_keys(signature):
+                self._buckets.setdefault(key, set()).add(module_name)
+        return canonical
+
+    def remove(self, module_name):
+        with self._lock:
+            self._remove_locked(module_name)
+
+    def _remove_locked(self, module_name):
+        entry = self._entries.pop(module_name, None)
+        if entry is None:
+            return
+        for key in self._band_keys(entry["signature"]):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(module_name)
+                if not bucket:
+                    del self._buckets[key]
+
+    def find(self, instructor_prompt, threshold=None, limit=5):
+        """
+        Find indexed modules similar to a prompt
+
+        Returns:
+            list: Matches sorted by similarity, each with module_name,
+                  similarity and the prompt it was generated from
+        """
+        threshold = self.threshold if threshold is None else threshold
+        canonical = canonicalize(instructor_prompt)
+        if not canonical["topic"]:
+            return []
+        signature = self.hasher.signature(shingles(canonical["topic"]))
+
+        with self._lock:
+            if threshold < self.threshold:
+                # Banding is tuned for the index threshold; scan everything below it
+                entries = list(self._entries.values())
+            else:
+                candidates = set()
+                for key in self._band_keys(signature):
+                    candidates.update(self._buckets.get(key, ()))
+                entries = [self._entries[name] for name in candidates]
+
+        matches = []
+        for entry in entries:
+            other = entry["canonical"]
+            # Same topic at a different level or length is a different module
+            if other["level"] != canonical["level"] or other["days"] != canonical["days"]:
+                continue
+            score = MinHasher.similarity(signature, entry["signature"])
+            if score >= threshold:
+                matches.append({
+                    "module_name": entry["module_name"],
+                    "similarity": round(score, 3),
+                    "instructor_prompt": entry["instructor_prompt"],
+                    "canonical": other,
+                    "created_at": entry["created_at"]
+                })
+
+        # Prefer the most similar, then the newest
+        matches.sort(key=lambda m: (m["similarity"], m["created_at"]), reverse=True)
+        return matches[:limit]
+
+    def rebuild(self, file_builder):
+        """Index the latest version of every module that has prompt metadata"""
+        count = 0
+        for item in file_builder.list_modules():
+            metadata = file_builder.read_module_metadata(item, "prompt")
+            if metadata and metadata.get("instructor_prompt"):
+                self.add(item, metadata["instructor_prompt"], metadata.get("created_at"))
+                count += 1
+        logger.info("Prompt index rebuilt", extra={"modules": count})
+        return count
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,131 @@
+"""
+Structured Output Service
+JSON schemas for provider-constrained module output and targeted repair of invalid files
+"""
+
+import os
+
+
+# Ask providers for schema-constrained output (falls back to plain JSON mode per model)
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "true").lower() == "true"
+# Regenerate only the invalid files of a module instead of retrying the whole module
+REPAIR_ENABLED = os.getenv("REPAIR_ENABLED", "true").lower() == "true"
+# Above this many broken files a full retry is cheaper than a repair call
+REPAIR_MAX_FILES = int(os.getenv("REPAIR_MAX_FILES", "8"))
+# Output token limit per file in a repair call
+REPAIR_TOKENS_PER_FILE = int(os.getenv("REPAIR_TOKENS_PER_FILE", "1500"))
+
+MODULE_SCHEMA_NAME = "learning_module"
+REPAIR_SCHEMA_NAME = "module_repair"
+CONTINUATION_SCHEMA_NAME = "module_continuation"
+
+
+def _files_schema(paths=None):
+    """Array of {path, content} objects (strict schemas cannot describe arbitrary keys)"""
+    path_schema = {"type": "string"}
+    if paths:
+        path_schema["enum"] = list(paths)
+    return {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "path": path_schema,
+                "content": {"type": "string"}
+            },
+            "required": ["path", "content"],
+            "additionalProperties": False
+        }
+    }
+
+
+def module_schema():
+    """Schema of a complete generated module"""
+    return {
+        "type": "object",
+        "properties": {
+            "module_name": {"type": "string"},
+            "files": _files_schema()
+        },
+        "required": ["module_name", "files"],
+        "additionalProperties": False
+    }
+
+
+def repair_schema(paths):
+    """Schema of a repair or continuation response limited to the given file paths"""
+    return {
+        "type": "object",
+        "properties": {"files": _files_schema(paths)},
+        "required": ["files"],
+        "additionalProperties": False
+    }
+
+
+def openai_response_format(name, schema):
+    """response_format for OpenAI-compatible chat completions in strict JSON schema mode"""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": name, "schema": schema, "strict": True}
+    }
+
+
+def gemini_schema(schema):
+    """
+    Convert a JSON schema to Gemini's response_schema dialect
+
+    Gemini uses upper-case type names and does not accept
+    additionalProperties.
+    """
+    if isinstance(schema, list):
+        return [gemini_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    converted = {}
+    for key, value in schema.items():
+        if key in ("additionalProperties", "strict"):
+            continue
+        if key == "type" and isinstance(value, str):
+            converted[key] = value.upper()
+        elif key == "properties":
+            converted[key] = {name: gemini_schema(prop) for name, prop in value.items()}
+        else:
+            converted[key] = gemini_schema(value)
+    return converted
+
+
+def schema_rejected(error):
+    """True if a provider error says the model does not support schema-constrained output"""
+    status = getattr(error, "status_code", None)
+    if status is not None and status not in (400, 422):
+        return False
+    text = str(error).lower()
+    return any(marker in text for marker in ("json_schema", "response_format", "response_schema", "schema"))
+
+
+def normalize_files(files):
+    """
+    Turn the schema's [{"path", "content"}] array into the {path: content}
+    dict used everywhere else (dicts pass through unchanged)
+
+    Entries without a string path are dropped; a later duplicate path wins.
+    """
+    if not isinstance(files, list):
+        return files
+    normalized = {}
+    for entry in files:
+        if isinstance(entry, dict) and isinstance(entry.get("path"), str) and entry["path"]:
+            normalized[entry["path"]] = entry.get("content")
+    return normalized
+
+
+def normalize_module(data):
+    """Normalize the files of a parsed module or repair response in place"""
+    if isinstance(data, dict) and "files" in data:
+        data["files"] = normalize_files(data["files"])
+    return data
+
+
+def invalid_content(content):
+    """True if a file's content cannot be written (not a string, or blank)"""
+    return not isinstance(content, str) or not content.strip()
@@ -0,0 +1,269 @@
+"""
+Token Accounting Service
+Token estimation, adaptive max_tokens and per-request / per-day budgets
+"""
+
+import os
+import re
+import math
+import time
+import threading
+
+
+# Rough characters-per-token ratio used for local estimates
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "4"))
+# Budgets (0 disables the limit)
+TOKEN_BUDGET_PER_REQUEST = int(os.getenv("TOKEN_BUDGET_PER_REQUEST", "0"))
+TOKEN_BUDGET_PER_DAY = int(os.getenv("TOKEN_BUDGET_PER_DAY", "0"))
+# Adaptive max_tokens settings
+ADAPTIVE_MAX_TOKENS = os.getenv("ADAPTIVE_MAX_TOKENS", "true").lower() == "true"
+MAX_OUTPUT_TOKENS = int(os.getenv("MAX_OUTPUT_TOKENS", "16384"))
+MIN_OUTPUT_TOKENS = int(os.getenv("MIN_OUTPUT_TOKENS", "1024"))
+TOKENS_PER_DAY = int(os.getenv("TOKENS_PER_DAY", "3000"))
+BASE_OUTPUT_TOKENS = int(os.getenv("BASE_OUTPUT_TOKENS", "2000"))
+DEFAULT_DAYS = int(os.getenv("DEFAULT_DAYS", "5"))
+
+LEVEL_MULTIPLIERS = {
+    "beginner": 1.0,
+    "intermediate": 1.2,
+    "advanced": 1.5
+}
+
+LEVEL_ALIASES = {
+    "beginners": "beginner",
+    "basic": "beginner",
+    "introductory": "beginner",
+    "intro": "beginner",
+    "novice": "beginner",
+    "medium": "intermediate",
+    "expert": "advanced",
+    "experts": "advanced"
+}
+
+# Context windows of common models; the prompt and completion must fit inside
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4": 8192,
+    "gpt-4-0613": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-3.5-turbo": 16385,
+    "llama-3.1-8b-instant": 131072,
+    "llama-3.3-70b-versatile": 131072,
+    "gemini-1.5-pro": 2097152,
+    "gemini-1.5-flash": 1048576,
+    "gemini-pro": 32760
+}
+
+_DAYS_PATTERN = re.compile(r"(\d+)\s*[- ]?\s*days?\b", re.IGNORECASE)
+_LEVEL_PATTERN = re.compile(r"\b(" + "|".join(list(LEVEL_MULTIPLIERS) + list(LEVEL_ALIASES)) + r")\b", re.IGNORECASE)
+
+
+class TokenBudgetExceeded(Exception):
+    """Raised when a request would exceed its per-request or per-day token budget"""
+
+
+def estimate_tokens(text):
+    """Estimate the token count of text without calling a tokenizer"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def parse_prompt_shape(instructor_prompt):
+    """
+    Extract duration and level from an instructor prompt
+
+    Returns:
+        tuple: (days or None, level or None)
+    """
+    days = None
+    match = _DAYS_PATTERN.search(instructor_prompt or "")
+    if match:
+        days = int(match.group(1))
+
+    level = None
+    match = _LEVEL_PATTERN.search(instructor_prompt or "")
+    if match:
+        level = match.group(1).lower()
+        level = LEVEL_ALIASES.get(level, level)
+
+    return days, level
+
+
+def context_window(model):
+    """Context window for a model, or None if unknown"""
+    override = os.getenv("MODEL_CONTEXT_TOKENS")
+    if override:
+        return int(override)
+    return MODEL_CONTEXT_TOKENS.get(model)
+
+
+def adaptive_max_tokens(days, level, model=None, prompt_tokens=0):
+    """
+    Derive an output token limit from module size
+
+    Args:
+        days: Requested number of days (DEFAULT_DAYS if None)
+        level: beginner/intermediate/advanced (intermediate if None)
+        model: Model name, used to keep prompt + completion inside the context window
+        prompt_tokens: Estimated prompt size
+
+    Returns:
+        int or None: max_tokens to send, or None when adaptive limits are disabled
+    """
+    if not ADAPTIVE_MAX_TOKENS:
+        return None
+
+    days = days or DEFAULT_DAYS
+    multiplier = LEVEL_MULTIPLIERS.get(level or "intermediate", 1.2)
+    max_tokens = int((BASE_OUTPUT_TOKENS + TOKENS_PER_DAY * days) * multiplier)
+    max_tokens = max(MIN_OUTPUT_TOKENS, min(max_tokens, MAX_OUTPUT_TOKENS))
+
+    window = context_window(model) if model else None
+    if window:
+        # Leave a small margin for estimation error
+        available = window - int(prompt_tokens * 1.1) - 64
+        max_tokens = max(1, min(max_tokens, available))
+
+    return max_tokens
+
+
+def usage_dict(prompt_tokens, completion_tokens, estimated=False):
+    prompt_tokens = int(prompt_tokens or 0)
+    completion_tokens = int(completion_tokens or 0)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "estimated": estimated
+    }
+
+
+def merge_usage(total, usage):
+    """Add one call's usage into a running total (both usage dicts)"""
+    if total is None:
+        return dict(usage)
+    return usage_dict(
+        total["prompt_tokens"] + usage["prompt_tokens"],
+        total["completion_tokens"] + usage["completion_tokens"],
+        estimated=total.get("estimated", False) or usage.get("estimated", False)
+    )
+
+
+class RequestBudget:
+    """
+    Tokens one request may still spend
+
+    Every provider call of a generation (cascade attempts, repairs,
+    continuations) is fitted to what is left and charged what it used, so
+    the request as a whole stays within TOKEN_BUDGET_PER_REQUEST.
+    """
+
+    def __init__(self, limit=TOKEN_BUDGET_PER_REQUEST):
+        self.limit = limit
+        self.spent = 0
+
+    @property
+    def remaining(self):
+        """Tokens left, or None without a per-request limit"""
+        if not self.limit:
+            return None
+        return max(0, self.limit - self.spent)
+
+    def allows(self, prompt_tokens):
+        """True if a call with this prompt still leaves room for MIN_OUTPUT_TOKENS of output"""
+        return not self.limit or self.remaining - prompt_tokens >= MIN_OUTPUT_TOKENS
+
+    def fit(self, prompt_tokens, max_tokens):
+        """
+        Apply the remaining budget to a planned call
+
+        Returns:
+            int or None: max_tokens, reduced if needed to fit the budget
+
+        Raises:
+            TokenBudgetExceeded: if the prompt alone leaves no room for output
+        """
+        if not self.limit:
+            return max_tokens
+
+        available = self.remaining - prompt_tokens
+        if available < MIN_OUTPUT_TOKENS:
+            raise TokenBudgetExceeded(
+                f"Prompt needs ~{prompt_tokens} tokens; {self.remaining} of the per-request "
+                f"budget of {self.limit} left"
+            )
+        if max_tokens is None or max_tokens > available:
+            return available
+        return max_tokens
+
+    def charge(self, tokens):
+        """Count the tokens a call used against the request"""
+        self.spent += tokens
+
+
+class TokenBudget:
+    """Enforces per-request and per-day token budgets"""
+
+    def __init__(self, per_request=TOKEN_BUDGET_PER_REQUEST, per_day=TOKEN_BUDGET_PER_DAY):
+        self.per_request = per_request
+        self.per_day = per_day
+        self._lock = threading.Lock()
+        self._day = self._today()
+        self._used = 0
+        self._reserved = 0
+
+    def _today(self):
+        return time.strftime("%Y-%m-%d", time.gmtime())
+
+    def _roll_day(self):
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self._used = 0
+            self._reserved = 0
+
+    def request(self):
+        """Per-request budget for one generation (shared by all of its provider calls)"""
+        return RequestBudget(self.per_request)
+
+    def reserve(self, tokens):
+        """
+        Reserve tokens against today's budget before a call
+
+        Raises:
+            TokenBudgetExceeded: if the daily budget would be exceeded
+        """
+        with self._lock:
+            self._roll_day()
+            if self.per_day and self._used + self._reserved + tokens > self.per_day:
+                raise TokenBudgetExceeded(
+                    f"Daily token budget of {self.per_day} exhausted "
+                    f"({self._used} used, {self._reserved} reserved)"
+                )
+            self._reserved += tokens
+            return tokens
+
+    def settle(self, reserved, used):
+        """Replace a reservation with the tokens actually used"""
+        with self._lock:
+            self._roll_day()
+            self._reserved = max(0, self._reserved - reserved)
+            self._used += used
+
+    def status(self):
+        with self._lock:
+            self._roll_day()
+            return {
+                "day": self._day,
+                "used": self._used,
+                "reserved": self._reserved,
+                "per_day": self.per_day or None,
+                "per_request": self.per_request or None,
+                "remaining": (self.per_day - self._used - self._reserved) if self.per_day else None
+            }
+
+
+# Shared budget for all generations in this process
+token_budget = TokenBudget()
@@ -0,0 +1,256 @@
+"""
+Tracing Service
+Records per-request span trees and optional cProfile dumps
+"""
+
+import os
+import io
+import time
+import uuid
+import random
+import cProfile
+import pstats
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+# Fraction of requests that record a span tree (0.0 - 1.0); X-Debug-Trace forces one for a single request
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+# Number of finished traces kept in memory
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "100"))
+# Number of functions included in a profile dump
+TRACE_PROFILE_LIMIT = int(os.getenv("TRACE_PROFILE_LIMIT", "40"))
+
+# Active trace and span for the current request
+_current_trace = ContextVar("current_trace", default=None)
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    """A timed operation inside a trace"""
+
+    __slots__ = ("name", "attributes", "children", "start", "end", "error")
+
+    def __init__(self, name, attributes=None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.children = []
+        self.start = time.perf_counter()
+        self.end = None
+        self.error = None
+
+    def set(self, **attributes):
+        """Attach attributes to the span"""
+        self.attributes.update(attributes)
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    def to_dict(self, origin):
+        end = self.end if self.end is not None else time.perf_counter()
+        data = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round((end - self.start) * 1000, 3),
+            "attributes": self.attributes,
+            "children": [child.to_dict(origin) for child in self.children]
+        }
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class _NullSpan:
+    """Span stand-in used when the current request is not sampled"""
+
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """Span tree for a single request"""
+
+    def __init__(self, trace_id, name, profile=False):
+        self.trace_id = trace_id
+        self.started_at = time.time()
+        self.root = Span(name)
+        self.profile_dump = None
+        self._profiler = cProfile.Profile() if profile else None
+        # Profilers of helper threads that ran work for this trace (see Tracer.profiled)
+        self._thread_profilers = []
+        self._lock = threading.Lock()
+
+    def add_child(self, parent, span):
+        # Spans may be opened from worker threads sharing this trace
+        with self._lock:
+            parent.children.append(span)
+
+    def to_dict(self):
+        root = self.root.to_dict(self.root.start)
+        data = {
+            "trace_id": self.trace_id,
+            "started_at": self.started_at,
+            "duration_ms": root["duration_ms"],
+            "root": root
+        }
+        if self.profile_dump is not None:
+            data["profile"] = self.profile_dump
+        return data
+
+    def summary(self):
+        root = self.root.to_dict(self.root.start)
+        return {
+            "trace_id": self.trace_id,
+            "name": root["name"],
+            "started_at": self.started_at,
+            "duration_ms": root["duration_ms"],
+            "attributes": root["attributes"],
+            "profiled": self.profile_dump is not None
+        }
+
+
+class Tracer:
+    """Creates traces and keeps recent ones in a bounded ring buffer"""
+
+    def __init__(self, sample_rate=TRACE_SAMPLE_RATE, buffer_size=TRACE_BUFFER_SIZE):
+        self.sample_rate = sample_rate
+        self._traces = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+
+    def new_trace_id(self):
+        return uuid.uuid4().hex
+
+    def start_trace(self, name, trace_id=None, force=False, profile=False):
+        """
+        Start a trace for the current request
+
+        Args:
+            name: Name of the root span
+            trace_id: Existing trace id to use (a new one is generated if omitted)
+            force: Record the trace regardless of the sample rate
+            profile: Run cProfile for the lifetime of the trace. It covers the
+                     calling thread and work run through profiled() (pipeline
+                     stages); other threads and worker processes (offloaded
+                     parsing) are not included.
+
+        Returns:
+            tuple: (trace_id, Trace or None if not sampled)
+        """
+        trace_id = trace_id or self.new_trace_id()
+        sampled = force or profile or (self.sample_rate > 0 and random.random() < self.sample_rate)
+        if not sampled:
+            _current_trace.set(None)
+            _current_span.set(None)
+            return trace_id, None
+
+        trace = Trace(trace_id, name, profile=profile)
+        _current_trace.set(trace)
+        _current_span.set(trace.root)
+        if trace._profiler is not None:
+            trace._profiler.enable()
+        return trace_id, trace
+
+    def finish_trace(self, **attributes):
+        """Close the current trace and store it in the ring buffer"""
+        trace = _current_trace.get()
+        if trace is None:
+            return None
+
+        if trace._profiler is not None:
+            trace._profiler.disable()
+            stream = io.StringIO()
+            stats = pstats.Stats(trace._profiler, stream=stream)
+            with trace._lock:
+                thread_profilers, trace._thread_profilers = trace._thread_profilers, []
+            for profiler in thread_profilers:
+                stats.add(profiler)
+            stats.sort_stats("cumulative").print_stats(TRACE_PROFILE_LIMIT)
+            trace.profile_dump = stream.getvalue()
+            trace._profiler = None
+
+        trace.root.set(**attributes)
+        trace.root.finish()
+        _current_trace.set(None)
+        _current_span.set(None)
+
+        with self._lock:
+            self._traces.append(trace)
+        return trace
+
+    def profiled(self, func, *args, **kwargs):
+        """
+        Call func, profiling it into the current trace's profile if there is one
+
+        cProfile only sees the thread that enabled it, so helper threads that
+        work for a profiled request (pipeline stages) run their part under a
+        profiler of their own, merged into the dump by finish_trace.
+        """
+        trace = _current_trace.get()
+        if trace is None or trace._profiler is None:
+            return func(*args, **kwargs)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ profiles all threads from one profiler and allows no second one
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            with trace._lock:
+                trace._thread_profilers.append(profiler)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Record a child span of the current span
+
+        Yields a no-op span when the current request is not being traced.
+        """
+        trace = _current_trace.get()
+        if trace is None:
+            yield _NULL_SPAN
+            return
+
+        parent = _current_span.get() or trace.root
+        span = Span(name, attributes)
+        trace.add_child(parent, span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.finish()
+            _current_span.reset(token)
+
+    def current_trace_id(self):
+        trace = _current_trace.get()
+        return trace.trace_id if trace is not None else None
+
+    def list_traces(self):
+        """Return summaries of recent traces, newest first"""
+        with self._lock:
+            traces = list(self._traces)
+        return [trace.summary() for trace in reversed(traces)]
+
+    def get_trace(self, trace_id):
+        with self._lock:
+            for trace in self._traces:
+                if trace.trace_id == trace_id:
+                    return trace.to_dict()
+        return None
+
+
+# Shared tracer used by the app and services
+tracer = Tracer()
@@ -0,0 +1,545 @@
+"""
+Module Versions Service
+Immutable per-generation module versions, an atomic "latest" pointer and per-module locks
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import difflib
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only cover threads of this process
+    fcntl = None
+
+from services.metrics import metrics
+from services.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+# Layout: output/<module>/v<N>/ (files), output/<module>/v<N>.zip, output/<module>/.latest.json
+LATEST_POINTER = ".latest.json"
+PUBLISHED_MARKER = ".published"
+LOCK_FILE = ".lock"
+# Per-version {path: sha256, size} list, and the per-module store of file contents by hash
+MANIFEST_FILE = ".manifest.json"
+BLOB_DIR = ".blobs"
+
+# Store each distinct file once per module; versions hard-link unchanged files to it
+DELTA_STORAGE = os.getenv("DELTA_STORAGE", "true").lower() == "true"
+# Remove the ZIPs of superseded versions (rebuilt from the files when downloaded)
+PRUNE_SUPERSEDED_ZIPS = os.getenv("PRUNE_SUPERSEDED_ZIPS", "true").lower() == "true"
+# Longest text diff returned per file, in lines
+DIFF_MAX_LINES = int(os.getenv("DIFF_MAX_LINES", "2000"))
+
+_VERSION_DIR_PATTERN = re.compile(r"^v(\d+)$")
+_VERSION_ZIP_PATTERN = re.compile(r"^v(\d+)\.zip$")
+
+
+def sanitize_module_name(module_name):
+    """Directory name for a module (also strips path separators and leading dots)"""
+    # Remove invalid characters
+    invalid_chars = '<>:"/\\|?*'
+    sanitized = module_name
+    for char in invalid_chars:
+        sanitized = sanitized.replace(char, "_")
+
+    # Remove leading/trailing spaces and dots
+    sanitized = sanitized.strip(". ")
+
+    # Ensure it's not empty
+    if not sanitized:
+        sanitized = "module"
+
+    return sanitized
+
+
+def _hash_file(path):
+    """Return (sha256 hex digest, size) of a file, read in chunks"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def _visible_files(version_dir):
+    """(relative path, full path) of a version's files, skipping hidden files and folders"""
+    for root, dirs, filenames in os.walk(version_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for filename in sorted(filenames):
+            if not filename.startswith("."):
+                full_path = os.path.join(root, filename)
+                yield os.path.relpath(full_path, version_dir).replace(os.sep, "/"), full_path
+
+
+class ModuleLocks:
+    """
+    One lock per module directory
+
+    A thread lock serializes threads of this process; where fcntl is
+    available, a lock file in the module directory also serializes other
+    worker processes. Work on different modules never waits.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    @contextmanager
+    def hold(self, module_dir):
+        with self._lock:
+            lock = self._locks.setdefault(module_dir, threading.Lock())
+        start = time.perf_counter()
+        with lock:
+            metrics.observe("module_lock_wait_ms", (time.perf_counter() - start) * 1000)
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(module_dir, exist_ok=True)
+            with open(os.path.join(module_dir, LOCK_FILE), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class ModuleVersions:
+    """
+    Versioned storage of modules under an output directory
+
+    Every generation writes into a fresh v<N> directory that is never
+    modified once published. Readers resolve "latest" once and then only
+    touch that version's files, so a concurrent generation of the same
+    module cannot change what they read.
+    """
+
+    def __init__(self, output_dir, locks=None):
+        self.output_dir = output_dir
+        self.locks = locks or module_locks
+
+    def module_dir(self, module_name):
+        return os.path.join(self.output_dir, sanitize_module_name(module_name))
+
+    def version_dir(self, module_name, version):
+        return os.path.join(self.module_dir(module_name), f"v{version}")
+
+    def zip_path(self, module_name, version):
+        return os.path.join(self.module_dir(module_name), f"v{version}.zip")
+
+    def _all_versions(self, module_dir):
+        try:
+            names = os.listdir(module_dir)
+        except OSError:
+            return []
+        versions = []
+        for name in names:
+            match = _VERSION_DIR_PATTERN.match(name)
+            if match and os.path.isdir(os.path.join(module_dir, name)):
+                versions.append(int(match.group(1)))
+        return sorted(versions)
+
+    def versions(self, module_name):
+        """Published versions of a module, oldest first"""
+        module_dir = self.module_dir(module_name)
+        return [
+            version for version in self._all_versions(module_dir)
+            if os.path.exists(os.path.join(module_dir, f"v{version}", PUBLISHED_MARKER))
+        ]
+
+    def latest(self, module_name):
+        """Version the "latest" pointer refers to, or None if nothing was published"""
+        try:
+            with open(os.path.join(self.module_dir(module_name), LATEST_POINTER), "r", encoding="utf-8") as f:
+                return int(json.load(f)["version"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def resolve(self, module_name, version=None):
+        """
+        Pin a request to one version
+
+        Args:
+            version: Requested version; None for the latest
+
+        Returns:
+            int or None: The version, or None if it does not exist or is unpublished
+        """
+        if version is None:
+            return self.latest(module_name)
+        published = os.path.join(self.version_dir(module_name, version), PUBLISHED_MARKER)
+        return int(version) if os.path.exists(published) else None
+
+    def allocate(self, module_name):
+        """
+        Reserve the next version number for a new generation
+
+        Returns:
+            tuple: (version, directory to write the files to)
+        """
+        module_dir = self.module_dir(module_name)
+        with self.locks.hold(module_dir):
+            existing = self._all_versions(module_dir)
+            version = (existing[-1] if existing else 0) + 1
+            while True:
+                path = os.path.join(module_dir, f"v{version}")
+                try:
+                    # Exclusive create: even an unlocked writer cannot get the same number
+                    os.makedirs(path)
+                    return version, path
+                except FileExistsError:
+                    version += 1
+
+    def publish(self, module_name, version):
+        """
+        Mark a fully written version as published and move "latest" to it
+
+        The pointer only moves forward: a slower generation that finishes
+        after a newer one is published stays downloadable by version but
+        does not become latest. The version is sealed first (see seal()).
+
+        Returns:
+            bool: True if "latest" now points at this version
+        """
+        module_dir = self.module_dir(module_name)
+        self.seal(module_name, version)
+        with self.locks.hold(module_dir):
+            with open(os.path.join(module_dir, f"v{version}", PUBLISHED_MARKER), "w", encoding="utf-8") as f:
+                f.write(str(time.time()))
+            current = self.latest(module_name)
+            if current is not None and current > version:
+                metrics.increment("module_versions_published_total", latest="false")
+                return False
+            self._write_pointer(module_dir, version)
+            if PRUNE_SUPERSEDED_ZIPS:
+                self._prune_zips(module_dir, version)
+            # Blobs left behind by discarded versions
+            self._prune_blobs(module_dir)
+        metrics.increment("module_versions_published_total", latest="true")
+        logger.info("Published module version", extra={"module_name": module_name, "version": version})
+        return True
+
+    def _write_pointer(self, module_dir, version):
+        """Replace the latest pointer atomically (readers see the old or the new one)"""
+        fd, tmp_path = tempfile.mkstemp(dir=module_dir, prefix=".latest", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": version, "published_at": time.time()}, f)
+            os.replace(tmp_path, os.path.join(module_dir, LATEST_POINTER))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def seal(self, module_name, version):
+        """
+        Record a version's manifest and share its unchanged files
+
+        Each file is hashed; with DELTA_STORAGE, a file whose contents are
+        already in the module's blob store is replaced by a hard link to the
+        blob, and new contents are linked into the store. A version therefore
+        only takes disk space for the files that changed, while every version
+        directory still holds all of its files for readers. Replacement is
+        atomic and the contents are identical, so sealing a published version
+        is safe while it is being read.
+
+        Returns:
+            dict: The manifest
+        """
+        module_dir = self.module_dir(module_name)
+        version_dir = self.version_dir(module_name, version)
+        blob_dir = os.path.join(module_dir, BLOB_DIR)
+        share = DELTA_STORAGE
+        files = {}
+        stored_bytes = 0
+        for rel_path, full_path in _visible_files(version_dir):
+            digest, size = _hash_file(full_path)
+            files[rel_path] = {"sha256": digest, "size": size}
+            if share:
+                try:
+                    if self._share_file(full_path, os.path.join(blob_dir, digest[:2], digest)):
+                        continue
+                except OSError as e:
+                    # Filesystem without hard links: keep full copies
+                    share = False
+                    logger.warning("Cannot share files between versions", extra={
+                        "module_name": module_name, "error": str(e)
+                    })
+            stored_bytes += size
+
+        manifest = {
+            "version": version,
+            "files": files,
+            "size": sum(entry["size"] for entry in files.values()),
+            "stored_bytes": stored_bytes,
+            "sealed_at": time.time()
+        }
+        self._write_json(version_dir, MANIFEST_FILE, manifest)
+        metrics.increment("module_version_bytes_total", manifest["size"])
+        metrics.increment("module_version_stored_bytes_total", stored_bytes)
+        return manifest
+
+    def _share_file(self, path, blob_path):
+        """
+        Back a file with the blob of its contents
+
+        Returns:
+            bool: True if the blob already existed (the file now shares its
+                  storage), False if the file became the blob
+        """
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.link")
+        while True:
+            try:
+                os.link(path, blob_path)
+                return False
+            except FileExistsError:
+                pass
+            if os.path.samefile(path, blob_path):
+                return True
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+            try:
+                os.link(blob_path, tmp_path)
+            except FileNotFoundError:
+                # Blob pruned in between: store this copy instead
+                continue
+            os.replace(tmp_path, path)
+            return True
+
+    def _write_json(self, directory, name, data):
+        """Write a JSON file atomically"""
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, os.path.join(directory, name))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _prune_zips(self, module_dir, latest):
+        """Remove the ZIPs of versions older than latest"""
+        for name in os.listdir(module_dir):
+            match = _VERSION_ZIP_PATTERN.match(name)
+            if match and int(match.group(1)) < latest:
+                try:
+                    os.remove(os.path.join(module_dir, name))
+                    metrics.increment("module_zips_pruned_total")
+                except OSError:
+                    pass
+
+    def manifest(self, module_name, version):
+        """
+        Manifest of a published version (sealing versions published before
+        manifests existed)
+
+        Returns:
+            dict or None: None if the version is not published
+        """
+        if self.resolve(module_name, version) is None:
+            return None
+        try:
+            with open(os.path.join(self.version_dir(module_name, version), MANIFEST_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return self.seal(module_name, version)
+
+    def history(self, module_name):
+        """
+        Published versions with their changes against the previous one
+
+        Returns:
+            list: Oldest first, each {"version", "published_at", "latest",
+                  "files", "size", "stored_bytes", "changes": {"added",
+                  "modified", "removed"}}; stored_bytes is the disk space
+                  the version added
+        """
+        latest = self.latest(module_name)
+        entries = []
+        previous = {}
+        for version in self.versions(module_name):
+            manifest = self.manifest(module_name, version)
+            if manifest is None:
+                continue
+            changes = _compare(previous, manifest["files"])
+            try:
+                with open(os.path.join(self.version_dir(module_name, version), PUBLISHED_MARKER), "r", encoding="utf-8") as f:
+                    published_at = float(f.read().strip())
+            except (OSError, ValueError):
+                published_at = None
+            entries.append({
+                "version": version,
+                "published_at": published_at,
+                "latest": version == latest,
+                "files": len(manifest["files"]),
+                "size": manifest["size"],
+                "stored_bytes": manifest["stored_bytes"],
+                "changes": {kind: len(changes[kind]) for kind in ("added", "modified", "removed")}
+            })
+            previous = manifest["files"]
+        return entries
+
+    def diff(self, module_name, from_version, to_version, text=True, max_lines=DIFF_MAX_LINES):
+        """
+        Compare two published versions
+
+        Args:
+            text: Include a unified diff of every added, modified or removed file
+            max_lines: Diff lines kept per file (longer diffs are marked truncated)
+
+        Returns:
+            dict or None: {"added", "modified", "removed", "unchanged" paths,
+                           "files": {path: {"status", "diff", "truncated"}}},
+                          None if either version is not published
+        """
+        old = self.manifest(module_name, from_version)
+        new = self.manifest(module_name, to_version)
+        if old is None or new is None:
+            return None
+        result = _compare(old["files"], new["files"])
+        if text:
+            result["files"] = {}
+            for status in ("added", "modified", "removed"):
+                for path in result[status]:
+                    old_lines = self._read_lines(module_name, from_version, path) if status != "added" else []
+                    new_lines = self._read_lines(module_name, to_version, path) if status != "removed" else []
+                    lines = list(difflib.unified_diff(
+                        old_lines, new_lines, f"v{from_version}/{path}", f"v{to_version}/{path}"
+                    ))
+                    result["files"][path] = {
+                        "status": status,
+                        "diff": "".join(lines[:max_lines]),
+                        "truncated": len(lines) > max_lines
+                    }
+        return result
+
+    def _read_lines(self, module_name, version, path):
+        try:
+            with open(os.path.join(self.version_dir(module_name, version), path), "r", encoding="utf-8") as f:
+                return f.readlines()
+        except (OSError, UnicodeDecodeError):
+            return []
+
+    def seal_existing(self):
+        """
+        Seal versions published before manifests existed, remove superseded
+        ZIPs and drop blobs no version links to any more
+
+        Returns:
+            int: Number of versions sealed
+        """
+        sealed = 0
+        for module_name in self.modules():
+            module_dir = self.module_dir(module_name)
+            for version in self.versions(module_name):
+                if not os.path.exists(os.path.join(self.version_dir(module_name, version), MANIFEST_FILE)):
+                    self.seal(module_name, version)
+                    sealed += 1
+            with self.locks.hold(module_dir):
+                latest = self.latest(module_name)
+                if PRUNE_SUPERSEDED_ZIPS and latest is not None:
+                    self._prune_zips(module_dir, latest)
+                self._prune_blobs(module_dir)
+        if sealed:
+            logger.info("Sealed module versions", extra={"versions": sealed})
+        return sealed
+
+    def _prune_blobs(self, module_dir):
+        """Remove blobs whose only link is the store itself (caller holds the module lock)"""
+        for root, _, filenames in os.walk(os.path.join(module_dir, BLOB_DIR)):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                try:
+                    if os.stat(path).st_nlink <= 1:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def discard(self, module_name, version):
+        """Remove an unpublished version (e.g. after a cancelled generation)"""
+        module_dir = self.module_dir(module_name)
+        shutil.rmtree(self.version_dir(module_name, version), ignore_errors=True)
+        zip_path = self.zip_path(module_name, version)
+        if os.path.exists(zip_path):
+            os.remove(zip_path)
+        if os.path.isdir(module_dir):
+            with self.locks.hold(module_dir):
+                self._prune_blobs(module_dir)
+
+    def modules(self):
+        """Names of modules with at least one published version"""
+        if not os.path.isdir(self.output_dir):
+            return []
+        return sorted(
+            item for item in os.listdir(self.output_dir)
+            if not item.startswith(".") and self.latest(item) is not None
+        )
+
+    def migrate_legacy(self):
+        """
+        Move modules written before versioning (files directly in
+        output/<module>/, ZIP at output/<module>.zip) into v1
+
+        Returns:
+            int: Number of modules migrated
+        """
+        if not os.path.isdir(self.output_dir):
+            return 0
+        migrated = 0
+        for item in os.listdir(self.output_dir):
+            module_dir = os.path.join(self.output_dir, item)
+            if item.startswith(".") or not os.path.isdir(module_dir):
+                continue
+            with self.locks.hold(module_dir):
+                if self.latest(item) is not None or self._all_versions(module_dir):
+                    continue
+                contents = [name for name in os.listdir(module_dir) if name != LOCK_FILE]
+                if not contents:
+                    continue
+                version_dir = os.path.join(module_dir, "v1")
+                os.makedirs(version_dir)
+                for name in contents:
+                    os.replace(os.path.join(module_dir, name), os.path.join(version_dir, name))
+                legacy_zip = os.path.join(self.output_dir, f"{item}.zip")
+                if os.path.exists(legacy_zip):
+                    os.replace(legacy_zip, os.path.join(module_dir, "v1.zip"))
+                with open(os.path.join(version_dir, PUBLISHED_MARKER), "w", encoding="utf-8") as f:
+                    f.write(str(time.time()))
+                self._write_pointer(module_dir, 1)
+                migrated += 1
+        if migrated:
+            logger.info("Migrated unversioned modules", extra={"modules": migrated})
+        return migrated
+
+
+def _compare(old_files, new_files):
+    """Paths added, modified, removed and unchanged between two manifests' file maps"""
+    return {
+        "added": sorted(path for path in new_files if path not in old_files),
+        "modified": sorted(
+            path for path in new_files
+            if path in old_files and new_files[path]["sha256"] != old_files[path]["sha256"]
+        ),
+        "removed": sorted(path for path in old_files if path not in new_files),
+        "unchanged": sorted(
+            path for path in new_files
+            if path in old_files and new_files[path]["sha256"] == old_files[path]["sha256"]
+        )
+    }
+
+
+# Shared lock registry so every FileBuilder and ModuleZipper in the process agree
+module_locks = ModuleLocks()
@@ -4,8 +4,191 @@ Handles creation of ZIP archives for modules
 """
 
 import os
+import io
+import zlib
+import time
+import fnmatch
+import tarfile
 import zipfile
+import tempfile
 from pathlib import Path
+from services.structured_logging import get_logger
+from services.offload import offload_pool
+from services.metrics import metrics
+from services.versions import ModuleVersions
+
+logger = get_logger(__name__)
+
+# Bytes read from disk per step when streaming an archive
+STREAM_CHUNK_BYTES = int(os.getenv("STREAM_CHUNK_BYTES", str(64 * 1024)))
+
+ARCHIVE_FORMATS = {
+    "zip": ("application/zip", ".zip"),
+    "tar.gz": ("application/gzip", ".tar.gz")
+}
+
+
+def write_zip_archive(zip_path, entries):
+    """
+    Write a deflate-compressed ZIP (runs in the offload pool for large modules)
+    
+    Args:
+        zip_path: Archive to create
+        entries: List of (file path, archive name) tuples
+    """
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for file_path, arcname in entries:
+            zipf.write(file_path, arcname)
+    return zip_path
+
+
+def normalize_patterns(patterns):
+    """
+    Clean up path filters from a download request
+    
+    Args:
+        patterns: Paths or globs relative to the module root ("Day3/", "*/slides.md")
+    
+    Returns:
+        list: Patterns without leading "./" or "/" and with "/" separators
+    
+    Raises:
+        ValueError: if a pattern points outside the module
+    """
+    normalized = []
+    for pattern in patterns or []:
+        pattern = pattern.strip().replace("\\", "/")
+        while pattern.startswith("./"):
+            pattern = pattern[2:]
+        pattern = pattern.lstrip("/")
+        if not pattern:
+            continue
+        if ".." in pattern.split("/"):
+            raise ValueError(f"Invalid path filter: {pattern}")
+        normalized.append(pattern)
+    return normalized
+
+
+def matches_patterns(arcname, patterns):
+    """
+    True if an archive path is selected by any pattern
+    
+    A pattern without glob characters selects that file or everything under
+    that folder; a glob is matched against the whole path ("*" also crosses
+    folders). A pattern without "/" also matches file names anywhere
+    ("slides.md", "*.md").
+    """
+    name = arcname.rsplit("/", 1)[-1]
+    for pattern in patterns:
+        if not any(char in pattern for char in "*?["):
+            folder = pattern.rstrip("/")
+            if arcname == folder or arcname.startswith(folder + "/"):
+                return True
+        elif fnmatch.fnmatchcase(arcname, pattern):
+            return True
+        if "/" not in pattern and fnmatch.fnmatchcase(name, pattern):
+            return True
+    return False
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Write-only sink whose contents are drained after every chunk"""
+    
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+    
+    def tell(self):
+        return self._position
+    
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _read_chunks(file_path):
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(STREAM_CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+
+
+def stream_zip(entries):
+    """
+    Yield a deflate-compressed ZIP of entries chunk by chunk
+    
+    Sizes and CRCs go into data descriptors after each file, so nothing is
+    buffered beyond one chunk and the central directory.
+    
+    Args:
+        entries: List of (file path, archive name) tuples
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for file_path, arcname in entries:
+            info = zipfile.ZipInfo.from_file(file_path, arcname)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with zipf.open(info, "w", force_zip64=info.file_size >= zipfile.ZIP64_LIMIT) as dest:
+                for chunk in _read_chunks(file_path):
+                    dest.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def stream_tar_gz(entries):
+    """
+    Yield a gzip-compressed tar of entries chunk by chunk
+    
+    Args:
+        entries: List of (file path, archive name) tuples
+    """
+    # wbits=31 writes the gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    written = 0
+    for file_path, arcname in entries:
+        stat = os.stat(file_path)
+        info = tarfile.TarInfo(arcname)
+        info.size = stat.st_size
+        info.mtime = int(stat.st_mtime)
+        info.mode = 0o644
+        header = info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+        written += len(header)
+        yield compressor.compress(header)
+        
+        remaining = info.size
+        for chunk in _read_chunks(file_path):
+            # Never write more than the header announced if the file grew
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+            written += len(chunk)
+            yield compressor.compress(chunk)
+            if not remaining:
+                break
+        # Pad a file that shrank, then round up to the tar block size
+        padding = remaining + (-info.size % tarfile.BLOCKSIZE)
+        written += padding
+        yield compressor.compress(tarfile.NUL * padding)
+    
+    # End-of-archive marker, padded to a full record like tarfile does
+    trailer = tarfile.BLOCKSIZE * 2
+    trailer += -(written + trailer) % tarfile.RECORDSIZE
+    yield compressor.compress(tarfile.NUL * trailer)
+    yield compressor.flush()
 
 
 class ModuleZipper:
@@ -16,59 +199,132 @@ class ModuleZipper:
         project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.output_dir = os.path.join(project_root, output_dir)
         os.makedirs(self.output_dir, exist_ok=True)
+        self.versions = ModuleVersions(self.output_dir)
+    
+    def zip_path(self, module_name, version=None):
+        """
+        Path of a version's ZIP (which may not have been built yet)
+        
+        Returns:
+            str or None: None if the module has no such published version
+        """
+        version = self.versions.resolve(module_name, version)
+        if version is None:
+            return None
+        return self.versions.zip_path(module_name, version)
     
-    def create_zip(self, module_name):
+    def create_zip(self, module_name, version=None):
         """
-        Create a ZIP file of the module
+        Create a ZIP file of one version of the module
+        
+        The archive is written under a temporary name and renamed into place,
+        so a download of the same version never sees a partial file.
         
         Args:
             module_name: Name of the module to zip
+            version: Version number (may be unpublished); None for the latest
         
         Returns:
             str: Path to the created ZIP file
         """
-        # Sanitize module name
-        safe_module_name = os.path.basename(module_name)
-        safe_module_name = safe_module_name.replace("..", "_")
+        if version is None:
+            version = self.versions.latest(module_name)
+            if version is None:
+                raise FileNotFoundError(f"Module has no published version: {module_name}")
         
-        module_path = os.path.join(self.output_dir, safe_module_name)
-        zip_path = os.path.join(self.output_dir, f"{safe_module_name}.zip")
+        module_path = self.versions.version_dir(module_name, version)
+        zip_path = self.versions.zip_path(module_name, version)
         
         # Check if module directory exists
         if not os.path.exists(module_path):
             raise FileNotFoundError(f"Module directory not found: {module_path}")
         
-        # Remove existing ZIP if it exists
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
+        # Collect files inline (cheap); compression is offloaded for large modules
+        entries, total_bytes = self._collect_entries(module_path)
         
         # Create ZIP file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(zip_path), prefix=".zip", suffix=".tmp")
+        os.close(fd)
         try:
-            with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-                # Walk through all files in the module directory
-                for root, dirs, files in os.walk(module_path):
-                    # Skip hidden directories
-                    dirs[:] = [d for d in dirs if not d.startswith(".")]
-                    
-                    for file in files:
-                        # Skip hidden files
-                        if file.startswith("."):
-                            continue
-                        
-                        file_path = os.path.join(root, file)
-                        
-                        # Calculate relative path for archive
-                        arcname = os.path.relpath(file_path, module_path)
-                        
-                        # Add file to ZIP
-                        zipf.write(file_path, arcname)
+            offload_pool.run(write_zip_archive, tmp_path, entries, size=total_bytes, stage="create_zip")
+            os.replace(tmp_path, zip_path)
             
-            print(f"Created ZIP file: {zip_path}")
+            logger.info("Created ZIP file", extra={"zip_path": zip_path})
             return zip_path
         
         except Exception as e:
             # Clean up partial ZIP if creation failed
-            if os.path.exists(zip_path):
-                os.remove(zip_path)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
             raise Exception(f"Error creating ZIP file: {e}")
+    
+    def _collect_entries(self, module_path, patterns=None):
+        """
+        List the module's files for an archive, skipping hidden files and folders
+        
+        Returns:
+            tuple: ([(file path, archive name), ...] sorted by archive name, total bytes)
+        """
+        entries = []
+        total_bytes = 0
+        for root, dirs, files in os.walk(module_path):
+            # Skip hidden directories
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            
+            for file in files:
+                # Skip hidden files
+                if file.startswith("."):
+                    continue
+                
+                file_path = os.path.join(root, file)
+                
+                # Calculate relative path for archive
+                arcname = Path(os.path.relpath(file_path, module_path)).as_posix()
+                if patterns and not matches_patterns(arcname, patterns):
+                    continue
+                entries.append((file_path, arcname))
+                total_bytes += os.path.getsize(file_path)
+        entries.sort(key=lambda entry: entry[1])
+        return entries, total_bytes
+    
+    def stream_archive(self, module_name, patterns=None, archive_format="zip", version=None):
+        """
+        Build an archive of (part of) a module version on the fly
+        
+        Args:
+            module_name: Name of the module
+            patterns: Path/glob filters (see matches_patterns); None selects every file
+            archive_format: "zip" or "tar.gz"
+            version: Published version; None for the latest
+        
+        Returns:
+            tuple: (chunk generator, number of files, total uncompressed bytes)
+        
+        Raises:
+            FileNotFoundError: if the module or version does not exist
+            ValueError: for an unknown format or an invalid filter
+        """
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(ARCHIVE_FORMATS)}")
+        patterns = normalize_patterns(patterns)
+        resolved = self.versions.resolve(module_name, version)
+        if resolved is None:
+            raise FileNotFoundError(f"Module version not found: {module_name} v{version or 'latest'}")
+        module_path = self.versions.version_dir(module_name, resolved)
+        
+        entries, total_bytes = self._collect_entries(module_path, patterns)
+        writer = stream_zip if archive_format == "zip" else stream_tar_gz
+        
+        def generate():
+            start = time.perf_counter()
+            sent = 0
+            for chunk in writer(entries):
+                if chunk:
+                    sent += len(chunk)
+                    yield chunk
+            metrics.increment("archive_streams_total", format=archive_format, filtered=bool(patterns))
+            metrics.increment("archive_stream_bytes_total", sent, format=archive_format)
+            metrics.observe("archive_stream_ms", (time.perf_counter() - start) * 1000, format=archive_format)
+        
+        return generate(), len(entries), total_bytes
 
@@ -0,0 +1,49 @@
+"""
+Shared test setup
+Makes the services importable, keeps every on-disk cache in a temporary directory and
+provides a test client of the app backed by the offline stub LLM server
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "benchmarks"))
+
+# Read by the services at import time
+_CACHE_DIR = tempfile.mkdtemp(prefix="copilot-tests-")
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("FRAGMENT_CACHE_DIR", os.path.join(_CACHE_DIR, "fragments"))
+os.environ.setdefault("PREWARM_HISTORY_FILE", os.path.join(_CACHE_DIR, "request_history.jsonl"))
+os.environ.setdefault("SEARCH_DB_PATH", os.path.join(_CACHE_DIR, "search.db"))
+
+
+@pytest.fixture(scope="session")
+def stub_llm():
+    from stub_llm_server import StubLLMServer, StubConfig
+    server = StubLLMServer(StubConfig(latency_ms=0, days=2, files_per_day=3, file_size=300)).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(scope="session")
+def app_module(stub_llm, tmp_path_factory):
+    """The app, generating through the stub server into a temporary output directory"""
+    os.environ.update(AI_PROVIDER="openai", OPENAI_API_KEY="stub", OPENAI_BASE_URL=stub_llm.base_url)
+    import app
+    from services.file_builder import FileBuilder
+    from services.zipper import ModuleZipper
+    output_dir = str(tmp_path_factory.mktemp("output"))
+    app.OUTPUT_DIR = output_dir
+    app.file_builder = FileBuilder(output_dir=output_dir)
+    app.zipper = ModuleZipper(output_dir=output_dir)
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,113 @@
+"""
+Tests for services.zipper
+Streamed ZIP and tar.gz archives must open with the standard library and match the files on disk
+"""
+
+import io
+import gzip
+import random
+import tarfile
+import zipfile
+
+import pytest
+
+from services import zipper as zipper_module
+from services.zipper import (
+    stream_zip, stream_tar_gz, write_zip_archive, normalize_patterns, matches_patterns
+)
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    """A small module tree with an empty file and one spanning several read chunks"""
+    monkeypatch.setattr(zipper_module, "STREAM_CHUNK_BYTES", 1024)
+    rng = random.Random(7)
+    contents = {
+        "summary.md": b"# Summary\n",
+        "Day1/slides.md": "Übersicht — día 1\n".encode("utf-8"),
+        "Day1/empty.txt": b"",
+        "Day2/notes/large.bin": bytes(rng.getrandbits(8) for _ in range(5000)),
+        "Day2/block.txt": b"x" * 512
+    }
+    entries = []
+    for arcname, data in sorted(contents.items()):
+        path = tmp_path / "module" / arcname
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        entries.append((str(path), arcname))
+    return entries, contents
+
+
+def test_stream_zip_is_valid(files):
+    entries, contents = files
+    chunks = list(stream_zip(entries))
+    assert len([chunk for chunk in chunks if chunk]) > 1
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == [arcname for _, arcname in entries]
+        for arcname, data in contents.items():
+            assert archive.read(arcname) == data
+            assert archive.getinfo(arcname).compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_stream_zip_matches_written_archive(files, tmp_path):
+    entries, _ = files
+    zip_path = write_zip_archive(str(tmp_path / "module.zip"), entries)
+    streamed = zipfile.ZipFile(io.BytesIO(b"".join(stream_zip(entries))))
+    with zipfile.ZipFile(zip_path) as written, streamed:
+        assert written.namelist() == streamed.namelist()
+        for info in written.infolist():
+            assert streamed.getinfo(info.filename).CRC == info.CRC
+            assert streamed.getinfo(info.filename).file_size == info.file_size
+
+
+def test_stream_zip_empty():
+    with zipfile.ZipFile(io.BytesIO(b"".join(stream_zip([])))) as archive:
+        assert archive.namelist() == []
+
+
+def test_stream_tar_gz_is_valid(files):
+    entries, contents = files
+    data = b"".join(stream_tar_gz(entries))
+    assert data[:2] == b"\x1f\x8b"
+
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as archive:
+        members = archive.getmembers()
+        assert [member.name for member in members] == [arcname for _, arcname in entries]
+        for member in members:
+            assert member.isfile()
+            assert member.size == len(contents[member.name])
+            assert archive.extractfile(member).read() == contents[member.name]
+
+
+def test_stream_tar_gz_is_padded_to_records(files):
+    entries, _ = files
+    raw = gzip.decompress(b"".join(stream_tar_gz(entries)))
+    assert len(raw) % tarfile.RECORDSIZE == 0
+    # End-of-archive marker is two zero blocks
+    assert raw[-2 * tarfile.BLOCKSIZE:] == tarfile.NUL * 2 * tarfile.BLOCKSIZE
+
+
+def test_stream_tar_gz_empty():
+    with tarfile.open(fileobj=io.BytesIO(b"".join(stream_tar_gz([]))), mode="r:gz") as archive:
+        assert archive.getmembers() == []
+
+
+def test_normalize_patterns():
+    assert normalize_patterns(None) == []
+    assert normalize_patterns(["./Day1/", "/summary.md", "Day2\\notes", "  "]) == [
+        "Day1/", "summary.md", "Day2/notes"
+    ]
+    with pytest.raises(ValueError):
+        normalize_patterns(["../other"])
+
+
+def test_matches_patterns():
+    assert matches_patterns("Day1/slides.md", ["Day1"])
+    assert matches_patterns("Day1/slides.md", ["Day1/"])
+    assert not matches_patterns("Day10/slides.md", ["Day1"])
+    assert matches_patterns("Day2/notes/large.bin", ["Day2/*"])
+    assert matches_patterns("Day1/slides.md", ["slides.md"])
+    assert matches_patterns("Day1/slides.md", ["*.md"])
+    assert not matches_patterns("Day1/slides.md", ["*/notes.md"])
@@ -0,0 +1,81 @@
+"""
+Tests for continuing truncated modules in services.generator
+The stub LLM server cuts responses off at the output token limit; continuation must fill in the rest
+"""
+
+import pytest
+from openai import OpenAI
+
+from stub_llm_server import StubLLMServer, StubConfig, build_module
+
+PROMPT = "Distributed systems, advanced, 3 days"
+
+
+@pytest.fixture(scope="module")
+def truncating_stub():
+    config = StubConfig(latency_ms=0, days=3, files_per_day=5, file_size=600, max_output_tokens=1500)
+    server = StubLLMServer(config).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def generator(truncating_stub, monkeypatch):
+    monkeypatch.setenv("AI_PROVIDER", "openai")
+    from services import generator as generator_module
+    monkeypatch.setattr(generator_module, "CONTINUATION_ENABLED", True)
+    generator = generator_module.ModuleGenerator()
+    generator.client = OpenAI(api_key="stub", base_url=truncating_stub.base_url)
+    return generator
+
+
+def planned_paths(config):
+    return set(build_module(config, "planned")["files"])
+
+
+def test_truncated_module_is_continued(generator, truncating_stub):
+    module = generator.generate_module(PROMPT, use_cache=False)
+    generation = module["generation"]
+
+    assert set(module["files"]) == planned_paths(truncating_stub.config)
+    assert all(module["files"].values())
+    assert not generation["quality_issues"]
+    [continuation] = generation["continuations"]
+    assert continuation["calls"] >= 1
+    assert continuation["files_added"] > 0
+    assert continuation["remaining"] == []
+    assert continuation["stopped"] == "complete"
+    # Continuation tokens are part of the module's usage
+    assert module["usage"]["total_tokens"] >= continuation["usage"]["total_tokens"]
+
+
+def test_truncated_module_keeps_complete_files_without_continuation(generator, truncating_stub, monkeypatch):
+    from services import generator as generator_module
+    monkeypatch.setattr(generator_module, "CONTINUATION_ENABLED", False)
+    # Repair would fill in missing day files; check what salvage alone keeps
+    generator.repair_enabled = False
+    module = generator.generate_module(PROMPT, use_cache=False)
+
+    planned = planned_paths(truncating_stub.config)
+    assert module["generation"]["continuations"] == []
+    assert 0 < len(module["files"]) < len(planned)
+    assert set(module["files"]) <= planned
+    # Salvaged files are whole, never the half-written last one
+    expected = build_module(truncating_stub.config, "planned")["files"]
+    for path, content in module["files"].items():
+        assert content.split("\n", 1)[1] == expected[path].split("\n", 1)[1]
+
+
+def test_request_budget_covers_every_call(generator, monkeypatch):
+    from services import generator as generator_module
+    monkeypatch.setattr(generator_module.token_budget, "per_request", 8000)
+    module = generator.generate_module(PROMPT, use_cache=False)
+
+    spent = module["generation"]["token_budget"]
+    assert spent["limit"] == 8000
+    assert spent["spent"] == module["usage"]["total_tokens"] <= 8000
+    # The first attempt fits; continuing to the full plan does not
+    [continuation] = module["generation"]["continuations"]
+    assert continuation["remaining"]
+    assert continuation["stopped"] == "token_budget"
+    assert "error" not in continuation
@@ -0,0 +1,37 @@
+"""
+Tests for services.file_tree
+Tree export order and totals, and export and rendering of trees deeper than the recursion limit
+"""
+
+import sys
+
+from services.file_tree import FileTree, build_tree
+
+
+def test_export_orders_folders_first_and_sums_sizes():
+    tree = FileTree.from_entries([
+        {"path": "summary.md", "size": 10},
+        {"path": "Day2/lesson.md", "size": 5},
+        {"path": "Day1/slides.md", "size": 3},
+        {"path": "Day1/Lesson.md", "size": 4},
+        {"path": "Day1/slides.md", "size": 7}
+    ]).to_dict()
+    assert (tree["size"], tree["file_count"]) == (26, 4)
+    assert [child["name"] for child in tree["children"]] == ["Day1", "Day2", "summary.md"]
+    day1 = tree["children"][0]
+    assert (day1["path"], day1["size"], day1["file_count"]) == ("Day1", 11, 2)
+    assert [child["path"] for child in day1["children"]] == ["Day1/Lesson.md", "Day1/slides.md"]
+    assert "children" not in day1["children"][0]
+
+
+def test_deep_tree_does_not_recurse():
+    depth = sys.getrecursionlimit() + 100
+    path = "/".join(f"d{index}" for index in range(depth)) + "/file.md"
+    tree, markdown = build_tree([{"path": path, "size": 1}])
+
+    node = tree
+    for _ in range(depth):
+        [node] = node["children"]
+        assert node["file_count"] == 1
+    assert node["children"][0]["path"] == path
+    assert markdown.splitlines()[-2].endswith("└── file.md")
@@ -0,0 +1,33 @@
+"""
+Tests for services.generator
+Provider selection from AI_PROVIDER and the configured API keys
+"""
+
+import pytest
+
+from services import generator as generator_module
+from services.endpoint_pool import EndpointPool
+
+
+@pytest.fixture
+def keys(monkeypatch):
+    """Only a Gemini key, plus an OpenAI-compatible endpoint pool"""
+    monkeypatch.setattr(generator_module, "OPENAI_API_KEY", None)
+    monkeypatch.setattr(generator_module, "GOOGLE_API_KEY", "google-key")
+    monkeypatch.setattr(generator_module, "GROQ_API_KEY", None)
+    monkeypatch.setattr(generator_module, "OPENAI_COMPATIBLE_BASE_URL", "http://a.test/v1,http://b.test/v1")
+    monkeypatch.setenv("OPENAI_COMPATIBLE_MODEL", "local-model")
+
+
+def test_explicit_openai_compatible_wins_over_other_keys(keys, monkeypatch):
+    monkeypatch.setenv("AI_PROVIDER", "openai_compatible")
+    generator = generator_module.ModuleGenerator()
+    assert generator.ai_provider == "openai_compatible"
+    assert isinstance(generator.client, EndpointPool)
+    assert generator.model == "local-model"
+
+
+def test_unknown_provider_is_rejected_instead_of_guessed(keys, monkeypatch):
+    monkeypatch.setenv("AI_PROVIDER", "openai-compatible")
+    with pytest.raises(ValueError, match="Unsupported AI provider"):
+        generator_module.ModuleGenerator()
@@ -0,0 +1,56 @@
+"""
+Tests for services.health and EndpointPool probing
+Warm-up reaches every endpoint of a pool and readiness reports each one
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from services.endpoint_pool import EndpointPool
+from services.health import ProviderHealth
+
+# Nothing listens here, so calls fail at once with a connection error
+DOWN = "http://127.0.0.1:9/v1"
+PING = {"model": "stub-model", "messages": [{"role": "user", "content": "ping"}], "max_tokens": 5}
+
+
+@pytest.fixture
+def pool(stub_llm):
+    return EndpointPool([stub_llm.base_url, DOWN], api_key="stub", failure_threshold=1)
+
+
+def test_probe_reaches_every_endpoint(pool, stub_llm):
+    results = pool.probe(**PING)
+    assert [(r["base_url"], r["status"]) for r in results] == [(stub_llm.base_url, "success"), (DOWN, "error")]
+    assert "error" in results[1]
+    # A failed probe counts towards the cooldown like a failed call
+    healthy = {e["base_url"]: e["healthy"] for e in pool.stats()["endpoints"]}
+    assert healthy == {stub_llm.base_url: True, DOWN: False}
+    # Probes are not load-balanced calls
+    assert all(e["requests"] == 0 for e in pool.stats()["endpoints"])
+
+
+def test_successful_probe_returns_endpoint_to_rotation(pool, stub_llm):
+    pool.probe(**PING)
+    down = pool.endpoints[1]
+    assert down.down_until > 0
+    down.client = pool.endpoints[0].client
+    pool.probe(**PING)
+    assert down.down_until == 0.0 and down.consecutive_failures == 0
+
+
+def test_warm_up_reports_every_endpoint(pool, stub_llm):
+    generator = SimpleNamespace(
+        model="stub-model",
+        cascade=["stub-model"],
+        # The pooled ping reaches a single endpoint
+        test_llm_call=lambda model=None: {"status": "success", "model": model},
+        test_endpoint_calls=lambda model=None: pool.probe(**PING)
+    )
+    health = ProviderHealth(generator, enabled=True)
+    assert health._warm_up()
+
+    endpoints = health.readiness()["endpoints"]
+    assert endpoints[stub_llm.base_url]["status"] == "success"
+    assert endpoints[DOWN]["status"] == "error"
@@ -0,0 +1,168 @@
+"""
+Tests for services.idempotency
+Replay of completed and in-flight generations, body mismatches, expiry and eviction
+"""
+
+import threading
+
+import pytest
+
+from services.idempotency import (
+    IdempotencyStore, IdempotencyConflict, idempotency_key, idempotency_scope, request_fingerprint
+)
+
+
+BODY = {"instructor_prompt": "Python basics, beginner, 2 days"}
+
+
+def begin(store, key="key-1", body=BODY, scope="default", request_id="req-1"):
+    return store.begin(scope, key, request_fingerprint(body), request_id)
+
+
+def test_completed_response_is_replayed():
+    store = IdempotencyStore()
+    entry, owner = begin(store)
+    assert owner is True
+    store.complete(entry, body=b'{"status": "success"}', status=200, headers={"X-Request-Id": "req-1"}, tokens=1200)
+
+    replay, owner = begin(store, request_id="req-2")
+    assert owner is False
+    assert replay is entry
+    assert replay.done.is_set()
+    assert replay.body == b'{"status": "success"}'
+    assert replay.request_id == "req-1"
+    assert replay.tokens == 1200
+
+
+def test_different_body_with_same_key_conflicts():
+    store = IdempotencyStore()
+    entry, _ = begin(store)
+    store.complete(entry, body=b"{}", status=200)
+    with pytest.raises(IdempotencyConflict):
+        begin(store, body={"instructor_prompt": "SQL crash course, 3 days"})
+
+
+def test_keys_are_scoped_per_tenant():
+    store = IdempotencyStore()
+    entry, _ = begin(store, scope="tenant-a")
+    store.complete(entry, body=b"{}", status=200)
+    _, owner = begin(store, scope="tenant-b", body={"instructor_prompt": "other"})
+    assert owner is True
+
+
+def test_unmapped_api_keys_get_separate_scopes():
+    # Unmapped keys share the default tenant but must not replay each other's results
+    first, second = idempotency_scope("default", "key-a"), idempotency_scope("default", "key-b")
+    assert first != second
+    assert first.startswith("default:") and "key-a" not in first
+    assert idempotency_scope("default", "key-a") == first
+    assert idempotency_scope("default") == "default"
+
+
+def test_failed_generation_is_not_kept():
+    store = IdempotencyStore()
+    entry, _ = begin(store)
+    store.complete(entry, body=b'{"status": "error"}', status=500)
+    assert entry.done.is_set()
+    _, owner = begin(store, request_id="req-2")
+    assert owner is True
+
+
+def test_in_flight_duplicate_waits_for_the_owner():
+    store = IdempotencyStore()
+    entry, owner = begin(store)
+    assert owner is True
+    duplicate, duplicate_owner = begin(store, request_id="req-2")
+    assert duplicate_owner is False
+    assert duplicate is entry
+    assert store.wait(duplicate, timeout=0.01) is False
+    assert store.stats()["in_flight"] == 1
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(store.wait(duplicate, timeout=5)))
+    waiter.start()
+    store.complete(entry, body=b"{}", status=200)
+    waiter.join()
+    assert results == [True]
+    assert store.stats()["in_flight"] == 0
+
+
+def test_completed_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("services.idempotency.time.monotonic", lambda: now[0])
+    store = IdempotencyStore(ttl_s=60)
+    entry, _ = begin(store)
+    store.complete(entry, body=b"{}", status=200)
+    now[0] += 30
+    assert begin(store, request_id="req-2")[1] is False
+    now[0] += 31
+    assert begin(store, request_id="req-3")[1] is True
+
+
+def test_oldest_entries_are_evicted_past_max_entries():
+    store = IdempotencyStore(max_entries=2)
+    for index in range(3):
+        entry, _ = begin(store, key=f"key-{index}")
+        store.complete(entry, body=b"{}", status=200)
+    assert store.stats()["completed"] == 2
+    assert begin(store, key="key-0")[1] is True
+    assert begin(store, key="key-2")[1] is False
+
+
+def test_entries_are_evicted_past_max_bytes():
+    store = IdempotencyStore(max_bytes=100)
+    first, _ = begin(store, key="key-1")
+    store.complete(first, body=b"x" * 60, status=200)
+    second, _ = begin(store, key="key-2")
+    store.complete(second, body=b"y" * 60, status=200)
+    stats = store.stats()
+    assert stats["completed"] == 1
+    assert stats["bytes"] == 60
+    assert begin(store, key="key-1")[1] is True
+
+
+def test_in_flight_entries_are_never_evicted():
+    store = IdempotencyStore(max_entries=1)
+    running, _ = begin(store, key="running")
+    for index in range(3):
+        entry, _ = begin(store, key=f"done-{index}")
+        store.complete(entry, body=b"{}", status=200)
+    duplicate, owner = begin(store, key="running", request_id="req-2")
+    assert owner is False
+    assert duplicate is running
+
+
+def test_idempotency_key_validation():
+    assert idempotency_key({"Idempotency-Key": " abc "}, {}) == "abc"
+    assert idempotency_key({}, {"idempotency_key": "from-body"}) == "from-body"
+    assert idempotency_key({}, {}) is None
+    with pytest.raises(ValueError):
+        idempotency_key({"Idempotency-Key": "x" * 300}, {})
+    with pytest.raises(ValueError):
+        idempotency_key({"Idempotency-Key": "bad key"}, {})
+
+
+def test_fingerprint_ignores_key_and_field_order():
+    assert request_fingerprint({"a": 1, "b": 2, "idempotency_key": "k"}) == request_fingerprint({"b": 2, "a": 1})
+    assert request_fingerprint({"a": 1}) != request_fingerprint({"a": 2})
+
+
+def test_generate_module_replays_and_rejects_mismatched_body(client):
+    headers = {"Idempotency-Key": "test-replay-key"}
+    first = client.post("/generate-module", json=BODY, headers=headers)
+    assert first.status_code == 200
+    assert first.headers.get("Idempotent-Replayed") is None
+
+    replay = client.post("/generate-module", json=BODY, headers=headers)
+    assert replay.status_code == 200
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.headers["X-Original-Request-Id"] == first.headers["X-Request-Id"]
+    assert replay.get_json()["module_name"] == first.get_json()["module_name"]
+
+    mismatch = client.post("/generate-module", json={"instructor_prompt": "SQL crash course, 3 days"}, headers=headers)
+    assert mismatch.status_code == 422
+
+
+def test_generate_module_rejects_invalid_key(client):
+    response = client.post("/generate-module", json=BODY, headers={"Idempotency-Key": "x" * 300})
+    assert response.status_code == 400
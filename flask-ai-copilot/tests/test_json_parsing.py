@@ -0,0 +1,114 @@
+"""
+Tests for services.json_parsing
+Salvaging modules cut off mid-JSON and parsing module responses chunk by chunk
+"""
+
+import json
+
+import pytest
+
+from services.json_parsing import (
+    extract_json, parse_json_response, salvage_truncated_module, ModuleStreamParser
+)
+
+MODULE = {
+    "module_name": "Distributed Systems",
+    "files": {
+        "summary.md": "# Summary\n\nQuotes \" and escapes \\n and unicode é ✓",
+        "Day1/lesson.md": "# Lesson\n\n" + "x" * 200,
+        "Day1/slides.md": "# Slides"
+    }
+}
+
+
+def as_file_list(module):
+    return dict(module, files=[{"path": path, "content": content} for path, content in module["files"].items()])
+
+
+@pytest.mark.parametrize("form", ["object", "array"])
+def test_salvage_every_cut_keeps_only_complete_files(form):
+    module = MODULE if form == "object" else as_file_list(MODULE)
+    text = json.dumps(module, indent=2)
+    paths = list(MODULE["files"])
+    files_start = text.index("{" if form == "object" else "[", text.index('"files"'))
+    for cut in range(len(text)):
+        salvaged = salvage_truncated_module(text[:cut])
+        if salvaged is None:
+            assert cut <= files_start
+            continue
+        # Files come back whole and in order; the one being written is dropped
+        assert list(salvaged["files"]) == paths[:len(salvaged["files"])]
+        for path, content in salvaged["files"].items():
+            assert content == MODULE["files"][path]
+        assert salvaged["module_name"] == "Distributed Systems"
+
+
+@pytest.mark.parametrize("form", ["object", "array"])
+def test_salvage_complete_response(form):
+    module = MODULE if form == "object" else as_file_list(MODULE)
+    salvaged = salvage_truncated_module(json.dumps(module))
+    assert salvaged == {"module_name": "Distributed Systems", "files": MODULE["files"]}
+
+
+def test_salvage_without_files():
+    assert salvage_truncated_module('{"module_name": "Cut') is None
+    assert salvage_truncated_module('{"files": "not a collection"}') is None
+    assert salvage_truncated_module('{"files": {') == {"module_name": None, "files": {}}
+
+
+def test_salvage_module_name_cut_off():
+    text = '{"files": {"summary.md": "done"}, "module_name": "Distrib'
+    assert salvage_truncated_module(text) == {"module_name": None, "files": {"summary.md": "done"}}
+
+
+def test_parse_json_response():
+    assert parse_json_response('{"a": 1}') == ({"a": 1}, False)
+    fenced = 'Here you go:\n```json\n{"a": {"b": 2}}\n```'
+    assert parse_json_response(fenced) == ({"a": {"b": 2}}, True)
+
+
+def test_extract_json_without_object():
+    with pytest.raises(Exception, match="Failed to extract JSON"):
+        extract_json("no json here")
+
+
+def feed_in_chunks(text, size):
+    parser = ModuleStreamParser()
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    return parser, events
+
+
+@pytest.mark.parametrize("form", ["object", "array"])
+@pytest.mark.parametrize("size", [1, 3, 7, 64, 10000])
+def test_stream_parser_matches_json_loads(form, size):
+    module = MODULE if form == "object" else as_file_list(MODULE)
+    text = "```json\n" + json.dumps(module, indent=2) + "\n```"
+    parser, events = feed_in_chunks(text, size)
+    assert parser.started and parser.done
+    assert ("module_name", "Distributed Systems") in events
+    assert [event[1:] for event in events if event[0] == "file"] == list(MODULE["files"].items())
+
+
+@pytest.mark.parametrize("form", ["object", "array"])
+def test_stream_parser_agrees_with_salvage_when_cut_off(form):
+    module = MODULE if form == "object" else as_file_list(MODULE)
+    text = json.dumps(module)
+    for cut in range(0, len(text), 5):
+        parser, events = feed_in_chunks(text[:cut], 4)
+        assert not parser.done
+        streamed = {event[1]: event[2] for event in events if event[0] == "file"}
+        salvaged = salvage_truncated_module(text[:cut])
+        assert streamed == (salvaged["files"] if salvaged else {})
+
+
+def test_stream_parser_non_string_content():
+    _, events = feed_in_chunks('{"files": {"a.md": null, "b.md": {"x": 1}, "c.md": "ok"}}', 2)
+    assert events == [("file", "a.md", None), ("file", "b.md", None), ("file", "c.md", "ok")]
+
+
+def test_stream_parser_rejects_invalid_json():
+    parser = ModuleStreamParser()
+    with pytest.raises(ValueError):
+        parser.feed('{"files": {"a.md" "missing colon"}}')
@@ -0,0 +1,68 @@
+"""
+Tests for services.prewarm
+Request history buffering: requests only touch memory, the flush writes and compacts the file
+"""
+
+import time
+
+from services.prewarm import RequestHistory, Prewarmer
+
+
+def lines(path):
+    return path.read_text(encoding="utf-8").splitlines() if path.exists() else []
+
+
+def test_record_buffers_until_flush(tmp_path):
+    path = tmp_path / "history.jsonl"
+    history = RequestHistory(str(path))
+    history.record("RAG module, intermediate, 5 days", tenant="team-a")
+    history.record("Kubernetes, beginner, 3 days")
+
+    assert len(history) == 2
+    assert lines(path) == []
+    history.flush()
+    assert len(lines(path)) == 2
+    # Nothing pending: a second flush appends nothing
+    history.flush()
+    assert len(lines(path)) == 2
+
+    reloaded = RequestHistory(str(path))
+    assert [entry["instructor_prompt"] for entry in reloaded._entries] == [
+        "RAG module, intermediate, 5 days", "Kubernetes, beginner, 3 days"
+    ]
+    assert reloaded._entries[0]["tenant"] == "team-a"
+
+
+def test_flush_compacts_past_max_entries(tmp_path):
+    path = tmp_path / "history.jsonl"
+    history = RequestHistory(str(path), max_entries=3)
+    for day in range(1, 5):
+        history.record(f"Python, beginner, {day} days")
+    history.flush()
+
+    assert len(history) == 3
+    assert [line.count("Python") for line in lines(path)] == [1, 1, 1]
+    assert "1 days" not in path.read_text(encoding="utf-8")
+
+    # Appends after a compaction go to the end of the rewritten file
+    history.record("Python, beginner, 5 days")
+    history.flush()
+    assert "5 days" in lines(path)[-1]
+    assert len(RequestHistory(str(path), max_entries=3)) == 3
+
+
+def test_prewarmer_thread_flushes_when_disabled(tmp_path):
+    path = tmp_path / "history.jsonl"
+    history = RequestHistory(str(path))
+    history.record("RAG module, intermediate, 5 days")
+    prewarmer = Prewarmer(lambda prompt: None, lambda prompt: False, history, enabled=False, interval_s=0.01)
+    prewarmer.start()
+    try:
+        deadline = time.monotonic() + 5
+        while not lines(path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(lines(path)) == 1
+        assert prewarmer.stats()["last_run"] is None
+    finally:
+        prewarmer.stop()
+        prewarmer._thread.join(timeout=5)
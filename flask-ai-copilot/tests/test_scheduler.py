@@ -0,0 +1,199 @@
+"""
+Tests for services.scheduler
+Fair ordering between tenants, priority classes, caps, abandoned tickets and tenant resolution
+"""
+
+import threading
+import time
+
+import pytest
+
+from services.scheduler import (
+    FairScheduler, QueueFull, resolve_tenant, resolve_priority, DEFAULT_TENANT, OTHER_TENANT_LABEL
+)
+from services.cancellation import CancellationToken, GenerationCancelled, DeadlineExceeded
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.005)
+
+
+class Queue:
+    """Requests queued on a scheduler from background threads, in the order they are admitted"""
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.admitted = []
+        self.errors = []
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def submit(self, tenant, priority="interactive", cost=1, token=None):
+        def run():
+            try:
+                ticket = self.scheduler.acquire(tenant, priority, cost, token)
+            except Exception as e:
+                with self._lock:
+                    self.errors.append(e)
+                return
+            with self._lock:
+                self.admitted.append((tenant, priority, ticket))
+
+        settled = self.settled()
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        # Enqueue one at a time so arrival order is deterministic
+        wait_until(lambda: self.settled() > settled)
+
+    def settled(self):
+        """Requests queued, admitted or failed (admitting a queued one leaves this unchanged)"""
+        with self._lock:
+            done = len(self.admitted) + len(self.errors)
+        return sum(self.scheduler.stats()["queued"].values()) + done
+
+    def release_next(self):
+        """Finish the oldest admitted generation still holding a slot"""
+        count = len(self.admitted)
+        with self._lock:
+            running = [entry for entry in self.admitted if not getattr(entry[2], "released", False)]
+        ticket = running[0][2]
+        ticket.released = True
+        self.scheduler.release(ticket)
+        return count
+
+    def drain(self):
+        """Release slots one by one until every request was admitted; returns the admission order"""
+        while len(self.admitted) < len(self._threads) - len(self.errors):
+            count = self.release_next()
+            wait_until(lambda: len(self.admitted) > count or len(self.admitted) == len(self._threads) - len(self.errors))
+        return [(tenant, priority) for tenant, priority, _ in self.admitted]
+
+
+def test_tenants_share_slots_fairly():
+    scheduler = FairScheduler(concurrency=1, tenant_concurrency=0, weights={})
+    queue = Queue(scheduler)
+    queue.submit("blocker")
+    for _ in range(6):
+        queue.submit("batch-heavy")
+    queue.submit("light")
+    order = [tenant for tenant, _ in queue.drain()][1:]
+    # The light tenant's single request goes right after the heavy tenant's first, not after all six
+    assert order.index("light") <= 1
+
+
+def test_weights_give_larger_share():
+    scheduler = FairScheduler(concurrency=1, tenant_concurrency=0, weights={"big": 3, "small": 1})
+    queue = Queue(scheduler)
+    queue.submit("blocker")
+    for _ in range(4):
+        queue.submit("small", cost=100)
+    for _ in range(4):
+        queue.submit("big", cost=100)
+    order = [tenant for tenant, _ in queue.drain()][1:]
+    first_five = order[:5]
+    assert first_five.count("big") >= 3
+
+
+def test_interactive_goes_before_batch():
+    scheduler = FairScheduler(concurrency=1, tenant_concurrency=0, weights={})
+    queue = Queue(scheduler)
+    queue.submit("blocker")
+    queue.submit("a", priority="batch")
+    queue.submit("b", priority="interactive")
+    order = queue.drain()[1:]
+    assert order == [("b", "interactive"), ("a", "batch")]
+
+
+def test_batch_never_takes_every_slot():
+    scheduler = FairScheduler(concurrency=2, tenant_concurrency=0, weights={})
+    queue = Queue(scheduler)
+    queue.submit("a", priority="batch")
+    queue.submit("b", priority="batch")
+    assert scheduler.stats()["running"]["batch"] == 1
+    queue.submit("c", priority="interactive")
+    wait_until(lambda: scheduler.stats()["running"]["interactive"] == 1)
+
+
+def test_identified_tenant_is_capped_but_default_is_not():
+    scheduler = FairScheduler(concurrency=4, tenant_concurrency=1, weights={})
+    queue = Queue(scheduler)
+    queue.submit("team")
+    queue.submit("team")
+    assert scheduler.stats()["tenants"]["team"]["running"] == 1
+    queue.submit(DEFAULT_TENANT)
+    queue.submit(DEFAULT_TENANT)
+    assert scheduler.stats()["tenants"][DEFAULT_TENANT]["running"] == 2
+
+
+def test_queue_full_is_rejected():
+    scheduler = FairScheduler(concurrency=1, tenant_concurrency=0, max_queue=1, weights={})
+    queue = Queue(scheduler)
+    queue.submit("blocker")
+    queue.submit("a")
+    with pytest.raises(QueueFull):
+        scheduler.acquire("a")
+
+
+def test_cancelled_ticket_gives_back_its_share():
+    scheduler = FairScheduler(concurrency=1, tenant_concurrency=0, weights={})
+    queue = Queue(scheduler)
+    queue.submit("blocker")
+    token = CancellationToken("cancelled")
+    queue.submit("a", cost=1000, token=token)
+    queue.submit("a", cost=10)
+    finishes = scheduler._finish["interactive"]
+    assert finishes["a"] == 1010
+
+    token.cancel()
+    wait_until(lambda: queue.errors)
+    assert isinstance(queue.errors[0], GenerationCancelled)
+    # The remaining ticket moved up and the tenant is charged only for it
+    assert finishes["a"] == 10
+    remaining = scheduler._queues["interactive"]["a"][0]
+    assert (remaining.start_tag, remaining.finish_tag) == (0, 10)
+
+    # Another tenant arriving now is not scheduled ahead of "a" because of the cancelled work
+    queue.submit("b", cost=10)
+    assert [tenant for tenant, _ in queue.drain()][1:] == ["a", "b"]
+
+
+def test_deadline_while_queued_raises():
+    scheduler = FairScheduler(concurrency=1, tenant_concurrency=0, weights={})
+    holder = scheduler.acquire("blocker")
+    token = CancellationToken("late", deadline_s=0.05)
+    with pytest.raises(DeadlineExceeded):
+        scheduler.acquire("a", token=token)
+    assert scheduler.stats()["queued"]["interactive"] == 0
+    scheduler.release(holder)
+
+
+def test_unknown_tenants_share_one_metric_label():
+    scheduler = FairScheduler(weights={"curriculum-team": 2})
+    assert scheduler.tenant_label("curriculum-team") == "curriculum-team"
+    assert scheduler.tenant_label(DEFAULT_TENANT) == DEFAULT_TENANT
+    assert scheduler.tenant_label("gateway-team") == OTHER_TENANT_LABEL
+
+
+def test_resolve_tenant():
+    api_keys = {"key123": "curriculum-team"}
+    assert resolve_tenant({"X-API-Key": "key123"}, api_keys) == "curriculum-team"
+    assert resolve_tenant({"Authorization": "Bearer key123"}, api_keys) == "curriculum-team"
+    # Unmapped keys cannot mint tenants of their own
+    assert resolve_tenant({"X-API-Key": "unknown"}, api_keys) == DEFAULT_TENANT
+    assert resolve_tenant({"X-API-Key": "rotated"}, api_keys) == DEFAULT_TENANT
+    # X-Tenant-Id is only honoured when the deployment trusts it
+    assert resolve_tenant({"X-Tenant-Id": "team"}, api_keys, trust_header=False) == DEFAULT_TENANT
+    assert resolve_tenant({"X-Tenant-Id": "team"}, api_keys, trust_header=True) == "team"
+    assert resolve_tenant({}, api_keys) == DEFAULT_TENANT
+
+
+def test_resolve_priority():
+    assert resolve_priority({}, {}) == "interactive"
+    assert resolve_priority({"X-Priority": "Batch"}, {}) == "batch"
+    with pytest.raises(ValueError):
+        resolve_priority({}, {"priority": "urgent"})
@@ -0,0 +1,124 @@
+"""
+Tests for services.similarity
+Prompt canonicalization, MinHash estimates and near-duplicate lookup through the LSH index
+"""
+
+import pytest
+
+from services.similarity import canonicalize, shingles, MinHasher, PromptIndex
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b)
+
+
+def test_canonicalize_ignores_wording():
+    first = canonicalize("RAG module, intermediate, 5 days")
+    second = canonicalize("Please create a 5-day intermediate RAG course")
+    assert first == second
+    assert first["topic"] == "rag"
+    assert first["level"] == "intermediate"
+    assert first["days"] == 5
+
+
+def test_canonicalize_keeps_level_and_days_apart():
+    assert canonicalize("Kubernetes, beginner, 3 days")["key"] != canonicalize("Kubernetes, advanced, 3 days")["key"]
+    assert canonicalize("Kubernetes, beginner, 3 days")["key"] != canonicalize("Kubernetes, beginner, 4 days")["key"]
+
+
+def test_signature_is_stable():
+    items = shingles("distributed systems consensus")
+    assert MinHasher().signature(items) == MinHasher().signature(items)
+    assert MinHasher.similarity(MinHasher().signature(items), MinHasher().signature(set(items))) == 1.0
+
+
+@pytest.mark.parametrize("first, second", [
+    ("distributed systems consensus", "distributed systems consensus raft"),
+    ("machine learning for healthcare", "machine learning in healthcare data"),
+    ("python web development", "rust embedded programming")
+])
+def test_similarity_estimates_jaccard(first, second):
+    hasher = MinHasher(num_perm=256)
+    a, b = shingles(first), shingles(second)
+    estimate = MinHasher.similarity(hasher.signature(a), hasher.signature(b))
+    assert estimate == pytest.approx(jaccard(a, b), abs=0.12)
+
+
+@pytest.fixture
+def index():
+    index = PromptIndex(threshold=0.8)
+    index.add("rag_intermediate", "RAG module, intermediate, 5 days", created_at=1)
+    index.add("kubernetes_beginner", "Kubernetes fundamentals, beginner, 3 days", created_at=2)
+    index.add("rag_advanced", "RAG module, advanced, 5 days", created_at=3)
+    return index
+
+
+def test_find_reworded_prompt(index):
+    [match] = index.find("5-day intermediate course on RAG")
+    assert match["module_name"] == "rag_intermediate"
+    assert match["similarity"] == 1.0
+    assert match["instructor_prompt"] == "RAG module, intermediate, 5 days"
+
+
+def test_find_requires_same_level_and_days(index):
+    assert index.find("RAG module, beginner, 5 days") == []
+    assert index.find("RAG module, intermediate, 4 days") == []
+    assert [m["module_name"] for m in index.find("RAG, advanced, 5 days")] == ["rag_advanced"]
+
+
+def test_find_rejects_different_topic(index):
+    assert index.find("Terraform fundamentals, beginner, 3 days") == []
+    assert index.find("days, module, intermediate") == []
+
+
+def test_find_near_duplicate_topic(index):
+    index.add("k8s_networking", "Kubernetes fundamentals and networking, beginner, 3 days", created_at=4)
+    # Below the index threshold every entry is scored, not just LSH candidates
+    matches = index.find("Kubernetes fundamental, beginner, 3 days", threshold=0.4)
+    assert [m["module_name"] for m in matches] == ["kubernetes_beginner", "k8s_networking"]
+    assert matches[0]["similarity"] > matches[1]["similarity"] >= 0.4
+
+
+def test_find_prefers_newest_on_tie(index):
+    index.add("rag_intermediate_v2", "Intermediate RAG, 5 days", created_at=10)
+    matches = index.find("RAG module, intermediate, 5 days")
+    assert [m["module_name"] for m in matches] == ["rag_intermediate_v2", "rag_intermediate"]
+    assert len(index.find("RAG module, intermediate, 5 days", limit=1)) == 1
+
+
+def test_add_replaces_and_remove_forgets(index):
+    index.add("rag_intermediate", "Kubernetes fundamentals, beginner, 3 days", created_at=5)
+    assert len(index) == 3
+    assert index.find("RAG module, intermediate, 5 days") == []
+    assert {m["module_name"] for m in index.find("Kubernetes fundamentals, beginner, 3 days")} == {
+        "rag_intermediate", "kubernetes_beginner"
+    }
+
+    index.remove("rag_intermediate")
+    index.remove("missing")
+    assert len(index) == 2
+    assert [m["module_name"] for m in index.find("Kubernetes fundamentals, beginner, 3 days")] == [
+        "kubernetes_beginner"
+    ]
+    # Emptied LSH buckets are dropped with the entry
+    assert all(index._buckets.values())
+
+
+def test_rebuild_from_module_metadata():
+    class Builder:
+        metadata = {
+            "rag": {"instructor_prompt": "RAG module, intermediate, 5 days", "created_at": 1},
+            "no_prompt": {},
+            "no_metadata": None
+        }
+
+        def list_modules(self):
+            return list(self.metadata)
+
+        def read_module_metadata(self, module_name, kind):
+            assert kind == "prompt"
+            return self.metadata[module_name]
+
+    index = PromptIndex()
+    assert index.rebuild(Builder()) == 1
+    assert [m["module_name"] for m in index.find("Intermediate RAG, 5 days")] == ["rag"]
@@ -0,0 +1,45 @@
+"""
+Tests for services.tokens
+Per-request budgets shared by every provider call of one generation
+"""
+
+import pytest
+
+from services.tokens import RequestBudget, TokenBudget, TokenBudgetExceeded, MIN_OUTPUT_TOKENS
+
+
+def test_unlimited_budget():
+    budget = RequestBudget(0)
+    budget.charge(10 ** 9)
+    assert budget.remaining is None
+    assert budget.allows(10 ** 9)
+    assert budget.fit(10 ** 9, None) is None
+    assert budget.fit(100, 2000) == 2000
+
+
+def test_fit_draws_on_what_is_left():
+    budget = RequestBudget(10000)
+    assert budget.fit(1000, 4000) == 4000
+    assert budget.fit(1000, None) == 9000
+    budget.charge(5000)
+    assert budget.remaining == 5000
+    # The next call only gets what the earlier ones left
+    assert budget.fit(1000, 8000) == 4000
+
+
+def test_spent_budget_refuses_calls():
+    budget = RequestBudget(10000)
+    budget.charge(10000 - MIN_OUTPUT_TOKENS - 500)
+    assert budget.allows(500)
+    assert not budget.allows(501)
+    with pytest.raises(TokenBudgetExceeded):
+        budget.fit(501, 2000)
+    budget.charge(10 ** 6)
+    assert budget.remaining == 0
+
+
+def test_each_request_gets_its_own_budget():
+    shared = TokenBudget(per_request=10000, per_day=0)
+    first, second = shared.request(), shared.request()
+    first.charge(9000)
+    assert second.remaining == 10000
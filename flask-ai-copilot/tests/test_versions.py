@@ -0,0 +1,246 @@
+"""
+Tests for services.versions
+Version allocation, forward-only publishing, locking, pruning, legacy migration and sealing
+"""
+
+import os
+import json
+import threading
+
+import pytest
+
+from services import versions as versions_module
+from services.versions import (
+    ModuleVersions, ModuleLocks, LATEST_POINTER, MANIFEST_FILE, BLOB_DIR, PUBLISHED_MARKER
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ModuleVersions(str(tmp_path), locks=ModuleLocks())
+
+
+def build(store, module_name, files):
+    """Allocate a version and write files into it"""
+    version, path = store.allocate(module_name)
+    for rel_path, content in files.items():
+        full_path = os.path.join(path, rel_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w", encoding="utf-8") as f:
+            f.write(content)
+    return version
+
+
+def blob_count(store, module_name):
+    blob_dir = os.path.join(store.module_dir(module_name), BLOB_DIR)
+    return sum(len(filenames) for _, _, filenames in os.walk(blob_dir))
+
+
+def test_allocate_numbers_versions_in_order(store):
+    assert store.allocate("Python Basics")[0] == 1
+    version, path = store.allocate("Python Basics")
+    assert version == 2
+    assert os.path.isdir(path)
+    # Allocated versions are not published until publish()
+    assert store.versions("Python Basics") == []
+    assert store.latest("Python Basics") is None
+
+
+def test_concurrent_allocate_never_reuses_a_version(store):
+    results = []
+    lock = threading.Lock()
+
+    def allocate():
+        version, _ = store.allocate("Module")
+        with lock:
+            results.append(version)
+
+    threads = [threading.Thread(target=allocate) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == list(range(1, 17))
+
+
+def test_publish_moves_latest(store):
+    first = build(store, "Module", {"summary.md": "one"})
+    assert store.publish("Module", first) is True
+    assert store.latest("Module") == first
+    second = build(store, "Module", {"summary.md": "two"})
+    assert store.publish("Module", second) is True
+    assert store.latest("Module") == second
+    assert store.versions("Module") == [first, second]
+    with open(os.path.join(store.module_dir("Module"), LATEST_POINTER), encoding="utf-8") as f:
+        assert json.load(f)["version"] == second
+
+
+def test_latest_only_moves_forward(store):
+    older = build(store, "Module", {"summary.md": "slow generation"})
+    newer = build(store, "Module", {"summary.md": "fast generation"})
+    assert store.publish("Module", newer) is True
+    # The slower generation finishes last but does not replace the newer one
+    assert store.publish("Module", older) is False
+    assert store.latest("Module") == newer
+    # It is still published and downloadable by version
+    assert store.resolve("Module", older) == older
+    assert store.versions("Module") == [older, newer]
+
+
+def test_concurrent_publish_ends_on_newest_version(store):
+    versions = [build(store, "Module", {"summary.md": f"v{index}"}) for index in range(12)]
+    threads = [threading.Thread(target=store.publish, args=("Module", version)) for version in reversed(versions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.latest("Module") == max(versions)
+    assert store.versions("Module") == versions
+    assert not [name for name in os.listdir(store.module_dir("Module")) if name.endswith(".tmp")]
+
+
+def test_module_lock_excludes_other_threads(tmp_path):
+    locks = ModuleLocks()
+    module_dir = str(tmp_path / "Module")
+    inside = []
+    overlaps = []
+
+    def hold():
+        for _ in range(50):
+            with locks.hold(module_dir):
+                inside.append(1)
+                if len(inside) > 1:
+                    overlaps.append(len(inside))
+                inside.pop()
+
+    threads = [threading.Thread(target=hold) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == []
+    assert os.path.exists(os.path.join(module_dir, versions_module.LOCK_FILE)) or versions_module.fcntl is None
+
+
+def test_resolve_ignores_unpublished_versions(store):
+    version = build(store, "Module", {"summary.md": "draft"})
+    assert store.resolve("Module", version) is None
+    store.publish("Module", version)
+    assert store.resolve("Module", version) == version
+    assert store.resolve("Module") == version
+
+
+def test_publish_prunes_superseded_zips(store, monkeypatch):
+    monkeypatch.setattr(versions_module, "PRUNE_SUPERSEDED_ZIPS", True)
+    first = build(store, "Module", {"summary.md": "one"})
+    store.publish("Module", first)
+    open(store.zip_path("Module", first), "wb").close()
+    second = build(store, "Module", {"summary.md": "two"})
+    store.publish("Module", second)
+    open(store.zip_path("Module", second), "wb").close()
+    third = build(store, "Module", {"summary.md": "three"})
+    store.publish("Module", third)
+    assert not os.path.exists(store.zip_path("Module", first))
+    assert not os.path.exists(store.zip_path("Module", second))
+    # Older versions keep their files
+    assert os.path.exists(os.path.join(store.version_dir("Module", first), "summary.md"))
+
+
+def test_discard_removes_version_and_orphaned_blobs(store, monkeypatch):
+    monkeypatch.setattr(versions_module, "DELTA_STORAGE", True)
+    store.publish("Module", build(store, "Module", {"summary.md": "kept"}))
+    draft = build(store, "Module", {"summary.md": "discarded"})
+    store.seal("Module", draft)
+    assert blob_count(store, "Module") == 2
+    store.discard("Module", draft)
+    assert not os.path.exists(store.version_dir("Module", draft))
+    assert blob_count(store, "Module") == 1
+
+
+def test_publish_prunes_orphaned_blobs(store, monkeypatch):
+    monkeypatch.setattr(versions_module, "DELTA_STORAGE", True)
+    store.publish("Module", build(store, "Module", {"summary.md": "one"}))
+    # A version sealed and then removed without discard() leaves its blob behind
+    abandoned = build(store, "Module", {"summary.md": "abandoned"})
+    store.seal("Module", abandoned)
+    for name in os.listdir(store.version_dir("Module", abandoned)):
+        os.remove(os.path.join(store.version_dir("Module", abandoned), name))
+    os.rmdir(store.version_dir("Module", abandoned))
+    store.publish("Module", build(store, "Module", {"summary.md": "two"}))
+    assert blob_count(store, "Module") == 2
+
+
+def test_seal_hard_links_unchanged_files(store, monkeypatch):
+    monkeypatch.setattr(versions_module, "DELTA_STORAGE", True)
+    files = {"summary.md": "summary", "Day1/lesson.md": "lesson " * 100}
+    first = build(store, "Module", files)
+    store.publish("Module", first)
+    second = build(store, "Module", dict(files, **{"summary.md": "changed summary"}))
+    store.publish("Module", second)
+
+    unchanged = [os.path.join(store.version_dir("Module", version), "Day1", "lesson.md") for version in (first, second)]
+    assert os.path.samefile(*unchanged)
+    changed = [os.path.join(store.version_dir("Module", version), "summary.md") for version in (first, second)]
+    assert not os.path.samefile(*changed)
+
+    manifest = store.manifest("Module", second)
+    assert set(manifest["files"]) == {"summary.md", "Day1/lesson.md"}
+    # Only the changed file took new space
+    assert manifest["stored_bytes"] == len("changed summary")
+    assert os.path.exists(os.path.join(store.version_dir("Module", second), MANIFEST_FILE))
+
+    diff = store.diff("Module", first, second)
+    assert diff["modified"] == ["summary.md"]
+    assert diff["unchanged"] == ["Day1/lesson.md"]
+    assert "+changed summary" in diff["files"]["summary.md"]["diff"]
+
+
+def test_seal_without_delta_storage_keeps_full_copies(store, monkeypatch):
+    monkeypatch.setattr(versions_module, "DELTA_STORAGE", False)
+    first = build(store, "Module", {"summary.md": "same"})
+    store.publish("Module", first)
+    second = build(store, "Module", {"summary.md": "same"})
+    store.publish("Module", second)
+    paths = [os.path.join(store.version_dir("Module", version), "summary.md") for version in (first, second)]
+    assert not os.path.samefile(*paths)
+    assert store.manifest("Module", second)["stored_bytes"] == len("same")
+
+
+def test_history_reports_changes(store):
+    store.publish("Module", build(store, "Module", {"a.md": "a", "b.md": "b"}))
+    store.publish("Module", build(store, "Module", {"a.md": "a2", "c.md": "c"}))
+    history = store.history("Module")
+    assert [entry["version"] for entry in history] == [1, 2]
+    assert history[1]["latest"] is True
+    assert history[1]["changes"] == {"added": 1, "modified": 1, "removed": 1}
+
+
+def test_migrate_legacy_moves_files_into_v1(tmp_path):
+    output_dir = tmp_path
+    legacy_dir = output_dir / "Old_Module"
+    (legacy_dir / "Day1").mkdir(parents=True)
+    (legacy_dir / "summary.md").write_text("summary", encoding="utf-8")
+    (legacy_dir / "Day1" / "lesson.md").write_text("lesson", encoding="utf-8")
+    (output_dir / "Old_Module.zip").write_bytes(b"zip")
+    store = ModuleVersions(str(output_dir), locks=ModuleLocks())
+
+    assert store.migrate_legacy() == 1
+    assert store.latest("Old_Module") == 1
+    version_dir = legacy_dir / "v1"
+    assert (version_dir / "summary.md").read_text(encoding="utf-8") == "summary"
+    assert (version_dir / "Day1" / "lesson.md").exists()
+    assert (version_dir / PUBLISHED_MARKER).exists()
+    assert (legacy_dir / "v1.zip").read_bytes() == b"zip"
+    assert not (output_dir / "Old_Module.zip").exists()
+    assert store.modules() == ["Old_Module"]
+    # Already versioned modules are left alone
+    assert store.migrate_legacy() == 0
+
+
+def test_seal_existing_seals_versions_without_manifest(store):
+    version = build(store, "Module", {"summary.md": "old"})
+    store.publish("Module", version)
+    os.remove(os.path.join(store.version_dir("Module", version), MANIFEST_FILE))
+    assert store.seal_existing() == 1
+    assert os.path.exists(os.path.join(store.version_dir("Module", version), MANIFEST_FILE))
+    assert store.seal_existing() == 0
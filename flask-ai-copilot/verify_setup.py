@@ -124,7 +124,7 @@ def main():
     if all_passed:
         print("\n✓ All checks passed! Backend is ready to run.")
         print("\nStart the server with:")
-        print("  python app.py")
+        print("  python server.py")
     else:
         print("\n✗ Some checks failed. Please fix the issues above.")
         sys.exit(1)
@@ -3,8 +3,8 @@
  */
 
 import { useState, useCallback, useRef, useEffect } from 'react';
-import { generateModule, downloadModule } from './api/api';
-import { filesToTree, findFileInTree } from './utils/tree';
+import { generateModule, downloadModule, fetchModuleFile, newIdempotencyKey } from './api/api';
+import { filesToTree, serverTreeToTree, findFileInTree } from './utils/tree';
 import { useToast } from './components/Toast';
 import Sidebar from './components/Sidebar';
 import Header from './components/Header';
@@ -20,7 +20,12 @@ function App() {
   const [isGenerating, setIsGenerating] = useState(false);
   const [isDownloading, setIsDownloading] = useState(false);
   const [error, setError] = useState(null);
+  // Contents of streamed modules, loaded when a file is first opened
+  const [fileContents, setFileContents] = useState({});
   const previewScrollRef = useRef(null);
+  // Prompt and Idempotency-Key of the last attempt that did not succeed; retrying
+  // the same prompt reuses the key so the server returns that generation
+  const pendingAttemptRef = useRef(null);
 
   // Reset preview scroll when file changes
   useEffect(() => {
@@ -29,16 +34,47 @@ function App() {
     }
   }, [selectedFile?.path]);
 
+  // Streamed generations only return the tree; load each file when it is opened
+  useEffect(() => {
+    const path = selectedFile?.path;
+    if (!moduleData?.streamed || !path || path in fileContents) {
+      return;
+    }
+    let cancelled = false;
+    fetchModuleFile(moduleData.module_name, path, moduleData.version)
+      .then((content) => {
+        if (!cancelled) {
+          setFileContents((loaded) => ({ ...loaded, [path]: content }));
+        }
+      })
+      .catch((err) => {
+        console.error('[Preview] Failed to load file:', path, err);
+        if (!cancelled) {
+          showError(err.message || `Could not load ${path}`);
+        }
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [moduleData, selectedFile?.path, fileContents, showError]);
+
   const handleGenerate = useCallback(async (prompt) => {
     setIsGenerating(true);
     setError(null);
     setSelectedFile(null);
     setTree(null);
     setModuleData(null);
+    setFileContents({});
 
     try {
       console.log('[API] Generating module with prompt:', prompt);
-      const response = await generateModule(prompt);
+      if (pendingAttemptRef.current?.prompt !== prompt) {
+        pendingAttemptRef.current = { prompt, idempotencyKey: newIdempotencyKey() };
+      }
+      const response = await generateModule(prompt, {
+        idempotencyKey: pendingAttemptRef.current.idempotencyKey,
+      });
+      pendingAttemptRef.current = null;
 
       console.log('[API] Response received:', {
         module_name: response.module_name,
@@ -46,13 +82,26 @@ function App() {
         files: response.files
       });
 
-      const { module_name, files } = response;
+      const { module_name, version, files, tree: serverTree, streamed } = response;
 
       // Validate response
       if (!module_name) {
         throw new Error('Invalid response: missing module_name');
       }
 
+      // Streamed generations: build the tree now, load contents on selection
+      if (streamed && serverTree) {
+        const fileTree = serverTreeToTree(serverTree, {});
+        setModuleData({ module_name, version, files: null, streamed: true });
+        setTree(fileTree);
+        const firstFile = findFirstFile(fileTree);
+        if (firstFile) {
+          setSelectedFile(firstFile);
+        }
+        showSuccess('Module generated successfully!');
+        return;
+      }
+
       if (!files || typeof files !== 'object' || Object.keys(files).length === 0) {
         console.warn('[API] Empty files object received');
         setModuleData({ module_name, files: {} });
@@ -61,14 +110,14 @@ function App() {
         return;
       }
 
-      // Convert files to tree structure
+      // Use the tree built by the backend; fall back to building it here
       console.log('[Tree] Converting files to tree structure...');
-      const fileTree = filesToTree(files);
+      const fileTree = serverTree ? serverTreeToTree(serverTree, files) : filesToTree(files);
       console.log('[Tree] Tree conversion complete:', {
         rootItems: fileTree.length
       });
 
-      setModuleData({ module_name, files });
+      setModuleData({ module_name, version, files });
       setTree(fileTree);
 
       // Auto-select first file if available (DFS)
@@ -129,7 +178,8 @@ function App() {
 
     try {
       console.log('[Download] Starting download for module:', moduleData.module_name);
-      await downloadModule(moduleData.module_name);
+      // Pin to the version shown, even if the module was regenerated since
+      await downloadModule(moduleData.module_name, { version: moduleData.version });
       console.log('[Download] Download completed successfully');
       showSuccess('ZIP downloaded successfully!');
     } catch (err) {
@@ -171,7 +221,7 @@ function App() {
         moduleName={moduleData?.module_name}
         onDownload={handleDownload}
         isDownloading={isDownloading}
-        hasFiles={!!(moduleData?.files && Object.keys(moduleData.files).length > 0)}
+        hasFiles={!!(moduleData?.streamed || (moduleData?.files && Object.keys(moduleData.files).length > 0))}
         isGenerating={isGenerating}
       />
 
@@ -251,7 +301,7 @@ function App() {
               {/* File Preview */}
               <div className="flex-1 flex flex-col overflow-hidden bg-white/50 backdrop-blur-sm" ref={previewScrollRef}>
                 <FilePreview
-                  content={selectedFile?.content}
+                  content={moduleData?.streamed ? fileContents[selectedFile?.path] : selectedFile?.content}
                   fileName={selectedFile?.name}
                   filePath={selectedFile?.path}
                 />
@@ -16,22 +16,41 @@ const api = axios.create({
   timeout: 300000, // 5 minutes for module generation
 });
 
+/**
+ * New Idempotency-Key for a generation attempt
+ * @returns {string} Random key
+ */
+export const newIdempotencyKey = () => {
+  if (window.crypto?.randomUUID) {
+    return window.crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+};
+
 /**
  * Generate a learning module from instructor prompt
  * @param {string} instructorPrompt - The instructor's prompt (e.g., "RAG module, intermediate, 5 days")
+ * @param {Object} [options]
+ * @param {string} [options.idempotencyKey] - Reuse the key of a failed attempt so a retry
+ *   returns that generation's result instead of starting another one
  * @returns {Promise<Object>} Module data with module_name, file_tree, and zip_path
  */
-export const generateModule = async (instructorPrompt) => {
+export const generateModule = async (instructorPrompt, { idempotencyKey } = {}) => {
   try {
     console.log('[API] POST /generate-module with prompt:', instructorPrompt);
     const response = await api.post('/generate-module', {
       instructor_prompt: instructorPrompt,
+    }, {
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {},
     });
 
     console.log('[API] Response status:', response.status);
+    if (response.headers?.['idempotent-replayed']) {
+      console.log('[API] Result of an earlier attempt replayed by the server');
+    }
     console.log('[API] Response data keys:', Object.keys(response.data || {}));
 
-    const { module_name, files, status } = response.data || {};
+    const { module_name, version, files, tree, streamed, status } = response.data || {};
     
     // Validate response structure
     if (status === 'error') {
@@ -43,9 +62,14 @@ export const generateModule = async (instructorPrompt) => {
       throw new Error('Invalid response: missing module_name');
     }
     
+    // Streamed generations send the tree only; contents come from fetchModuleFile
+    if (streamed) {
+      return { module_name, version, files: null, tree, streamed: true };
+    }
+
     if (!files) {
       console.warn('[API] Missing files in response, using empty object');
-      return { module_name, files: {} };
+      return { module_name, version, files: {}, tree };
     }
     
     if (typeof files !== 'object') {
@@ -58,7 +82,7 @@ export const generateModule = async (instructorPrompt) => {
       fileCount: Object.keys(files).length
     });
 
-    return { module_name, files };
+    return { module_name, version, files, tree };
   } catch (error) {
     console.error('[API] Error details:', {
       message: error.message,
@@ -91,12 +115,29 @@ export const generateModule = async (instructorPrompt) => {
 /**
  * Download a module as ZIP file
  * @param {string} moduleName - Name of the module to download
+ * @param {Object} [options]
+ * @param {string[]} [options.paths] - Files, folders or globs to include (e.g. ['Day3/'] or ['slides.md'])
+ * @param {string} [options.format] - 'zip' (default) or 'tar.gz'
+ * @param {number} [options.version] - Module version to download (default latest)
  * @returns {Promise<boolean>} True if download succeeded
  */
-export const downloadModule = async (moduleName) => {
+export const downloadModule = async (moduleName, { paths = [], format = 'zip', version } = {}) => {
   try {
+    // Repeated ?path= parameters (axios would send path[]= for an array)
+    const params = new URLSearchParams({ module: moduleName });
+    if (version) {
+      params.append('version', String(version));
+    }
+    paths.forEach((path) => params.append('path', path));
+    if (format !== 'zip') {
+      params.append('format', format);
+    }
+    const extension = format === 'zip' ? '.zip' : `.${format}`;
+    const versionSuffix = version ? `_v${version}` : '';
+    const fileName = `${moduleName}${versionSuffix}${paths.length ? '_partial' : ''}${extension}`;
+
     const response = await api.get('/download-module', {
-      params: { module: moduleName },
+      params,
       responseType: 'blob', // Important for file downloads
     });
     
@@ -113,12 +154,12 @@ export const downloadModule = async (moduleName) => {
     }
     
     // Verify blob size (ZIP files should be > 0 bytes)
-    const blob = new Blob([response.data], { type: 'application/zip' });
+    const blob = new Blob([response.data], { type: format === 'zip' ? 'application/zip' : 'application/gzip' });
     if (blob.size === 0) {
       throw new Error('Downloaded file is empty');
     }
     
-    console.log('[Download] ZIP file size:', blob.size, 'bytes');
+    console.log('[Download] Archive size:', blob.size, 'bytes');
     
     // Create blob URL
     const url = window.URL.createObjectURL(blob);
@@ -126,7 +167,7 @@ export const downloadModule = async (moduleName) => {
     // Create temporary download link
     const link = document.createElement('a');
     link.href = url;
-    link.setAttribute('download', `${moduleName}.zip`);
+    link.setAttribute('download', fileName);
     link.style.display = 'none';
     
     // Trigger download
@@ -191,6 +232,119 @@ export const listModules = async () => {
   }
 };
 
+/**
+ * Fetch the contents of one file of a module
+ * @param {string} moduleName - Name of the module
+ * @param {string} path - File path within the module (e.g. 'Day1/lesson.md')
+ * @param {number} [version] - Module version (default latest)
+ * @returns {Promise<string>} File contents
+ */
+export const fetchModuleFile = async (moduleName, path, version) => {
+  try {
+    const params = { module: moduleName, path };
+    if (version) {
+      params.version = String(version);
+    }
+    const response = await api.get('/module-file', { params, responseType: 'text' });
+    return response.data;
+  } catch (error) {
+    if (error.response) {
+      let message = error.response.data;
+      try {
+        const errorData = JSON.parse(error.response.data);
+        message = errorData.error || errorData.message;
+      } catch {
+        // Plain-text error body
+      }
+      throw new Error(message || `Failed to load ${path}`);
+    } else if (error.request) {
+      throw new Error('No response from server. Is the backend running?');
+    } else {
+      throw new Error(error.message || `Failed to load ${path}`);
+    }
+  }
+};
+
+/**
+ * List the published versions of a module
+ * @param {string} moduleName - Name of the module
+ * @returns {Promise<Array>} Versions, oldest first, with their changes and stored size
+ */
+export const listModuleVersions = async (moduleName) => {
+  try {
+    const response = await api.get('/module-versions', { params: { module: moduleName } });
+    return response.data.versions || [];
+  } catch (error) {
+    if (error.response) {
+      throw new Error(error.response.data?.error || error.response.data?.message || 'Failed to list versions');
+    } else if (error.request) {
+      throw new Error('No response from server. Is the backend running?');
+    } else {
+      throw new Error(error.message || 'Failed to list versions');
+    }
+  }
+};
+
+/**
+ * Compare two versions of a module
+ * @param {string} moduleName - Name of the module
+ * @param {Object} [options]
+ * @param {number} [options.from] - Older version (default: the one before `to`)
+ * @param {number} [options.to] - Newer version (default latest)
+ * @param {boolean} [options.text] - Include unified diffs of changed files (default true)
+ * @returns {Promise<Object>} added/modified/removed/unchanged paths and per-file diffs
+ */
+export const diffModuleVersions = async (moduleName, { from, to, text = true } = {}) => {
+  try {
+    const params = { module: moduleName };
+    if (from) {
+      params.from = String(from);
+    }
+    if (to) {
+      params.to = String(to);
+    }
+    if (!text) {
+      params.text = 'false';
+    }
+    const response = await api.get('/module-diff', { params });
+    return response.data;
+  } catch (error) {
+    if (error.response) {
+      throw new Error(error.response.data?.error || error.response.data?.message || 'Failed to compare versions');
+    } else if (error.request) {
+      throw new Error('No response from server. Is the backend running?');
+    } else {
+      throw new Error(error.message || 'Failed to compare versions');
+    }
+  }
+};
+
+/**
+ * Load every file of one module version
+ * @param {string} moduleName - Name of the module
+ * @param {number} [version] - Module version (default latest)
+ * @returns {Promise<Object>} module_name, version, files, and tree
+ */
+export const fetchModuleVersion = async (moduleName, version) => {
+  try {
+    const params = { module: moduleName };
+    if (version) {
+      params.version = String(version);
+    }
+    const response = await api.get('/module-version', { params });
+    const { module_name, files, tree } = response.data || {};
+    return { module_name, version: response.data?.version, files: files || {}, tree };
+  } catch (error) {
+    if (error.response) {
+      throw new Error(error.response.data?.error || error.response.data?.message || 'Failed to load version');
+    } else if (error.request) {
+      throw new Error('No response from server. Is the backend running?');
+    } else {
+      throw new Error(error.message || 'Failed to load version');
+    }
+  }
+};
+
 /**
  * Health check endpoint
  * @returns {Promise<Object>} Health status
@@ -62,57 +62,42 @@ export const filesToTree = (files) => {
   console.log('[Tree] Building tree from', Object.keys(files).length, 'files');
   
   const tree = [];
+  // Folder lookup by path so each segment is found in O(1) instead of a linear find
+  const folders = new Map();
 
-  /**
-   * Recursively add a file/folder to the tree
-   * @param {Array} parent - Parent array to add to
-   * @param {Array} parts - Path parts array
-   * @param {string} fullPath - Full original path
-   * @param {string} content - File content
-   */
-  const addToTree = (parent, parts, fullPath, content) => {
-    if (parts.length === 0) return;
-    
-    const currentName = parts[0];
-    const isLastPart = parts.length === 1;
+  // Process each file path
+  Object.entries(files).forEach(([filePath, content]) => {
+    const parts = filePath.split('/').filter(Boolean);
     
-    if (isLastPart) {
-      // This is a file
-      parent.push({
-        name: currentName,
-        path: fullPath,
-        type: 'file',
-        content: content,
-      });
-    } else {
-      // This is a folder (or intermediate folder)
-      // Find or create the folder
-      let folder = parent.find(item => item.name === currentName && item.type === 'folder');
-      
+    if (parts.length === 0) return; // Skip empty paths
+
+    let parent = tree;
+    let folderPath = '';
+    for (let i = 0; i < parts.length - 1; i++) {
+      folderPath = folderPath ? `${folderPath}/${parts[i]}` : parts[i];
+      let folder = folders.get(folderPath);
+
       if (!folder) {
         folder = {
-          name: currentName,
-          path: parts.slice(0, 1).join('/'), // Path up to this folder
+          name: parts[i],
+          path: folderPath,
           type: 'folder',
           children: [],
           expanded: true, // Default to expanded
         };
+        folders.set(folderPath, folder);
         parent.push(folder);
       }
-      
-      // Recursively add the rest of the path
-      addToTree(folder.children, parts.slice(1), fullPath, content);
+
+      parent = folder.children;
     }
-  };
 
-  // Process each file path
-  Object.entries(files).forEach(([filePath, content]) => {
-    const parts = filePath.split('/').filter(Boolean);
-    
-    if (parts.length === 0) return; // Skip empty paths
-    
-    // Add to tree starting from root
-    addToTree(tree, parts, filePath, content);
+    parent.push({
+      name: parts[parts.length - 1],
+      path: filePath,
+      type: 'file',
+      content: content,
+    });
   });
 
   // Sort: folders first, then files, both alphabetically
@@ -144,6 +129,42 @@ export const filesToTree = (files) => {
   return tree;
 };
 
+/**
+ * Attach file contents to the nested tree returned by the backend
+ * @param {Object} serverTree - Root folder from the API ("tree" field)
+ * @param {Object} files - Object with file paths as keys and content as values
+ * @returns {Array} Nested tree structure in the same shape as filesToTree
+ */
+export const serverTreeToTree = (serverTree, files) => {
+  if (!serverTree || !Array.isArray(serverTree.children)) {
+    return filesToTree(files);
+  }
+
+  // Already sorted by the backend (folders first, then files)
+  const convert = (items) => items.map(item => {
+    if (item.type === 'folder') {
+      return {
+        name: item.name,
+        path: item.path,
+        type: 'folder',
+        size: item.size,
+        fileCount: item.file_count,
+        children: convert(item.children || []),
+        expanded: true,
+      };
+    }
+    return {
+      name: item.name,
+      path: item.path,
+      type: 'file',
+      size: item.size,
+      content: files?.[item.path] ?? '',
+    };
+  });
+
+  return convert(serverTree.children);
+};
+
 /**
  * Find a file in the tree by path
  * @param {Array} tree - Tree structure
@@ -49,7 +49,7 @@ if exist "venv\Scripts\activate.bat" (
 
 REM Start backend in new window
 echo [INFO] Starting backend server...
-start "AI Copilot Backend" cmd /k "python app.py"
+start "AI Copilot Backend" cmd /k "python server.py"
 timeout /t 2 /nobreak >nul
 
 REM Wait for backend to be ready
@@ -93,7 +93,7 @@ elif [ -d ".venv" ]; then
 fi
 
 # Start backend in background
-python app.py > backend.log 2>&1 &
+python server.py > backend.log 2>&1 &
 BACKEND_PID=$!
 
 print_info "Backend starting (PID: $BACKEND_PID)"